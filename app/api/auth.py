@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, Response
 from sqlalchemy.orm import Session
-from app.database.connection import get_db  # Thay đổi import
+from app.database.connection import get_db, get_account_write_db  # Thay đổi import
 from app.middleware.models.user_model import UserModel
 from app.utils.password_utils import get_password_hash, verify_password
 from app.utils.jwt_utils import create_access_token
@@ -111,10 +111,10 @@ async def api_login(
     )
 
 @router.post("/register", response_model=UserResponseView, name="api_register")
-async def api_register(
+def api_register(
     request: UserRegisterView,
     response: Response,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_account_write_db)
 ):
     """API đăng ký trả về JSON response và set cookie"""
     log_debug("=== API REGISTER ATTEMPT ===", "INFO")
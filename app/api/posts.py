@@ -1,22 +1,71 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import Float, cast, delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session, joinedload
 from app.database.connection import get_db, get_primary_db, get_replica_db
-from app.middleware.models.post_model import PostModel
+from app.database.disconnect_handling import is_connection_lost
+from app.middleware.models.post_model import PostModel, SEARCH_CONFIG
 from app.middleware.models.kol_model import KOLModel
 from app.middleware.models.category_model import CategoryModel
 from app.middleware.models.user_model import UserModel
 from app.utils.logger import log_debug
 from app.views.posts_view import (
-    PostResponseView, PostsResponseView, PostDetailResponseView, 
-    CreatePostView, UpdatePostView, KOLResponseView, CategoryResponseView
+    PostResponseView, PostsResponseView, PostListItemView, PostDetailResponseView, 
+    CreatePostView, UpdatePostView, KOLResponseView, CategoryResponseView,
+    PostSearchResultView, PostSearchResponseView,
+    BulkCreatePostsView, BulkUpdatePostsView, BulkDeletePostsView, BulkItemResultView, BulkResponseView
 )
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.utils.jwt_utils import verify_token
-from typing import List, Optional
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.query_budget import query_budget
+from typing import List, Optional, Literal
+from datetime import datetime
 
 router = APIRouter()
 security = HTTPBearer(auto_error=False)
 
+# Các kiểu sắp xếp của listing, mỗi kiểu khớp với một index trên posts
+# (ix_posts_created_at, ix_posts_kol_id_created_at khi lọc theo kol_id, hoặc primary key)
+POST_SORTS = {
+    "newest": (PostModel.created_at.desc(), PostModel.id.desc()),
+    "oldest": (PostModel.created_at.asc(), PostModel.id.asc()),
+    "id_desc": (PostModel.id.desc(),),
+    "id_asc": (PostModel.id.asc(),),
+}
+
+# Field có thể chọn qua fields= của listing -> cột SQL tương ứng
+POST_LIST_FIELDS = {
+    "id": PostModel.id,
+    "title": PostModel.title,
+    "excerpt": PostModel.excerpt,
+    "content": PostModel.content,
+    "author_id": PostModel.author_id,
+    "kol_id": PostModel.kol_id,
+    "category_id": PostModel.category_id,
+    "images": PostModel.images,
+    "created_at": PostModel.created_at,
+    "updated_at": PostModel.updated_at,
+    "kol_name": KOLModel.name,
+    "category_name": CategoryModel.name,
+    "author_username": UserModel.username,
+}
+
+# Listing mặc định bỏ content (client chỉ hiển thị title + excerpt)
+DEFAULT_POST_LIST_FIELDS = [name for name in POST_LIST_FIELDS if name != "content"]
+
+# Số phần tử tối đa cho một request bulk
+BULK_MAX_ITEMS = 1000
+
+# Tùy chọn ts_headline cho đoạn trích kết quả tìm kiếm
+SEARCH_HEADLINE_OPTIONS = "MaxFragments=2, MaxWords=30, MinWords=10, StartSel=<mark>, StopSel=</mark>"
+
+def internal_error(e):
+    """503 + Retry-After khi mất kết nối DB giữa chừng (failover), 500 cho lỗi khác"""
+    if is_connection_lost(e):
+        return HTTPException(status_code=503, detail="Database connection lost, please retry",
+                             headers={"Retry-After": "1"})
+    return HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 # Dependency cho authentication
 async def get_current_user_api(
     request: Request,
@@ -48,37 +97,85 @@ async def get_current_user_api(
     
     raise HTTPException(status_code=401, detail="Authentication required")
 
+def parse_post_fields(fields):
+    """Tách fields="title,excerpt" thành danh sách field hợp lệ (luôn có id)"""
+    if not fields:
+        return DEFAULT_POST_LIST_FIELDS
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in POST_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(POST_LIST_FIELDS)}"
+        )
+    return ["id"] + [name for name in dict.fromkeys(requested) if name != "id"]
+
+def build_post_list_query(db, field_names):
+    """SELECT chỉ các cột được yêu cầu, chỉ JOIN bảng liên quan khi cần"""
+    query = db.query(*[POST_LIST_FIELDS[name].label(name) for name in field_names]).select_from(PostModel)
+    if "kol_name" in field_names:
+        query = query.outerjoin(KOLModel, KOLModel.id == PostModel.kol_id)
+    if "category_name" in field_names:
+        query = query.outerjoin(CategoryModel, CategoryModel.id == PostModel.category_id)
+    if "author_username" in field_names:
+        query = query.outerjoin(UserModel, UserModel.id == PostModel.author_id)
+    return query
+
+def apply_post_filters(query, kol_id=None, category_id=None, author_id=None, created_from=None, created_to=None):
+    """Thêm điều kiện lọc cho truy vấn posts, bỏ qua các tham số None"""
+    if kol_id is not None:
+        query = query.filter(PostModel.kol_id == kol_id)
+    if category_id is not None:
+        query = query.filter(PostModel.category_id == category_id)
+    if author_id is not None:
+        query = query.filter(PostModel.author_id == author_id)
+    if created_from is not None:
+        query = query.filter(PostModel.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(PostModel.created_at < created_to)
+    return query
+
+def build_post_listing(db, field_names, filters, sort, skip=0, limit=10):
+    """Truy vấn trang listing của GET /api/posts/ (cột, bộ lọc, sắp xếp, phân trang);
+    test_query_plans EXPLAIN đúng truy vấn này"""
+    return (
+        apply_post_filters(build_post_list_query(db, field_names), **filters)
+        .order_by(*POST_SORTS[sort])
+        .offset(skip)
+        .limit(limit)
+    )
+
 # ==================== POST ENDPOINTS ====================
 
-@router.get("/", response_model=PostsResponseView, name="api_get_all_posts")
+@router.get("/", response_model=PostsResponseView, response_model_exclude_unset=True, name="api_get_all_posts")
+@query_budget(statements=3, rows=22, query={"limit": 20})  # user + trang + count
 async def api_get_all_posts(
     skip: int = Query(0, ge=0, description="Skip posts"),
     limit: int = Query(10, ge=1, le=100, description="Limit posts"),
+    kol_id: Optional[int] = Query(None, description="Filter by KOL"),
+    category_id: Optional[int] = Query(None, description="Filter by category"),
+    author_id: Optional[int] = Query(None, description="Filter by author"),
+    created_from: Optional[datetime] = Query(None, description="Created at >= (ISO 8601)"),
+    created_to: Optional[datetime] = Query(None, description="Created at < (ISO 8601)"),
+    sort: Literal["newest", "oldest", "id_desc", "id_asc"] = Query("newest", description="Sort order"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (default: all except content)"),
     db: Session = Depends(get_replica_db),  # Use replica for reads
     current_user: UserModel = Depends(get_current_user_api)
 ):
-    """API lấy tất cả bài viết với phân trang"""
+    """API lấy bài viết với bộ lọc (KOL, category, tác giả, khoảng thời gian), chọn field và phân trang"""
+    if created_from and created_to and created_from >= created_to:
+        raise HTTPException(status_code=400, detail="created_from must be before created_to")
+    field_names = parse_post_fields(fields)
     try:
-        posts = db.query(PostModel).offset(skip).limit(limit).all()
-        total = db.query(PostModel).count()
+        filters = dict(
+            kol_id=kol_id, category_id=category_id, author_id=author_id,
+            created_from=created_from, created_to=created_to
+        )
+        rows = build_post_listing(db, field_names, filters, sort, skip, limit).all()
+        total = apply_post_filters(db.query(PostModel), **filters).count()
         
-        post_responses = []
-        for post in posts:
-            post_responses.append(PostResponseView(
-                id=post.id,
-                title=post.title,
-                excerpt=post.excerpt,
-                content=post.content,
-                author_id=post.author_id,
-                kol_id=post.kol_id,
-                category_id=post.category_id,
-                images=post.images,
-                created_at=post.created_at,
-                updated_at=post.updated_at,
-                kol_name=post.kol.name if post.kol else None,
-                category_name=post.category.name if post.category else None,
-                author_username=post.author.username if post.author else None
-            ))
+        # Chỉ set các field đã chọn, response_model_exclude_unset bỏ phần còn lại khỏi JSON
+        post_responses = [PostListItemView(**row._mapping) for row in rows]
         
         return PostsResponseView(
             message=f"Posts retrieved successfully by {current_user.username}",
@@ -87,9 +184,213 @@ async def api_get_all_posts(
         )
     except Exception as e:
         log_debug(f"❌ Error getting posts: {str(e)}", "ERROR")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise internal_error(e)
+
+@router.get("/search", response_model=PostSearchResponseView, name="api_search_posts")
+@query_budget(statements=2, rows=22, query={"q": "blackpink", "limit": 20})  # user + tìm kiếm (headline trong cùng câu)
+async def api_search_posts(
+    q: str = Query(..., min_length=1, max_length=200, description="Search text (websearch syntax)"),
+    limit: int = Query(20, ge=1, le=100, description="Limit results"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_replica_db),  # Use replica for reads
+    current_user: UserModel = Depends(get_current_user_api)
+):
+    """API tìm kiếm full-text bài viết (title, excerpt, content) với keyset pagination"""
+    try:
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        # float8 để rank trong cursor so sánh lại chính xác
+        rank = cast(func.ts_rank_cd(PostModel.search_vector, ts_query), Float(53))
+        
+        # Bước 1: chỉ lấy id + rank của trang hiện tại qua GIN index
+        page = (
+            select(PostModel.id.label("id"), rank.label("rank"))
+            .where(PostModel.search_vector.op("@@")(ts_query))
+            .order_by(rank.desc(), PostModel.id.desc())
+            .limit(limit + 1)
+        )
+        if cursor:
+            try:
+                cursor_rank, cursor_id = decode_cursor(cursor, 2)
+                page = page.where(tuple_(rank, PostModel.id) < tuple_(float(cursor_rank), int(cursor_id)))
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        page = page.subquery()
+        
+        # Bước 2: ts_headline chỉ chạy trên các dòng của trang này
+        snippet = func.ts_headline(
+            SEARCH_CONFIG,
+            func.coalesce(PostModel.excerpt, "") + " " + PostModel.content,
+            ts_query,
+            SEARCH_HEADLINE_OPTIONS
+        )
+        rows = (
+            db.query(
+                PostModel.id, PostModel.title, PostModel.excerpt, PostModel.author_id,
+                PostModel.kol_id, PostModel.category_id, PostModel.images, PostModel.created_at,
+                KOLModel.name.label("kol_name"), CategoryModel.name.label("category_name"),
+                page.c.rank, snippet.label("snippet")
+            )
+            .join(page, page.c.id == PostModel.id)
+            .outerjoin(KOLModel, KOLModel.id == PostModel.kol_id)
+            .outerjoin(CategoryModel, CategoryModel.id == PostModel.category_id)
+            .order_by(page.c.rank.desc(), PostModel.id.desc())
+            .all()
+        )
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1].rank, rows[-1].id])
+        
+        return PostSearchResponseView(
+            message=f"Search completed by {current_user.username}",
+            query=q,
+            count=len(rows),
+            next_cursor=next_cursor,
+            results=[PostSearchResultView(**row._mapping) for row in rows]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_debug(f"❌ Error searching posts: {str(e)}", "ERROR")
+        raise internal_error(e)
+
+# ==================== BULK ENDPOINTS ====================
+
+def existing_ids(db, column, ids):
+    """Một truy vấn IN (...) trả về tập id tồn tại thay vì query từng id"""
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return set()
+    return set(db.execute(select(column).where(column.in_(ids))).scalars())
+
+def check_bulk_size(items):
+    if not items:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items (max {BULK_MAX_ITEMS})")
+
+def reference_error(item, kol_ids, category_ids):
+    """Lỗi tham chiếu KOL/Category của một item (None nếu hợp lệ)"""
+    if item.kol_id is not None and item.kol_id not in kol_ids:
+        return "KOL not found"
+    if item.category_id is not None and item.category_id not in category_ids:
+        return "Category not found"
+    return None
+
+def bulk_response(action, results, current_user):
+    succeeded = sum(1 for r in results if r.status != "error")
+    return BulkResponseView(
+        message=f"Bulk {action} completed by {current_user.username}",
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=results
+    )
+
+@router.post("/bulk", response_model=BulkResponseView, name="api_bulk_create_posts")
+async def api_bulk_create_posts(
+    bulk_data: BulkCreatePostsView,
+    db: Session = Depends(get_primary_db),  # Use primary for writes
+    current_user: UserModel = Depends(get_current_user_api)
+):
+    """API tạo nhiều bài viết trong một transaction (INSERT nhiều dòng)"""
+    check_bulk_size(bulk_data.posts)
+    try:
+        kol_ids = existing_ids(db, KOLModel.id, [p.kol_id for p in bulk_data.posts])
+        category_ids = existing_ids(db, CategoryModel.id, [p.category_id for p in bulk_data.posts])
+        
+        results = [None] * len(bulk_data.posts)
+        rows, row_indexes = [], []
+        for index, post_data in enumerate(bulk_data.posts):
+            error = reference_error(post_data, kol_ids, category_ids)
+            if error:
+                results[index] = BulkItemResultView(index=index, status="error", error=error)
+                continue
+            rows.append({**post_data.model_dump(), "author_id": current_user.id})
+            row_indexes.append(index)
+        
+        if rows:
+            # executemany + RETURNING: SQLAlchemy gộp thành INSERT ... VALUES (...), (...) theo lô
+            new_ids = db.execute(insert(PostModel).returning(PostModel.id, sort_by_parameter_order=True), rows).scalars().all()
+            db.commit()
+            for index, post_id in zip(row_indexes, new_ids):
+                results[index] = BulkItemResultView(index=index, id=post_id, status="created")
+        
+        log_debug(f"📦 Bulk created {len(rows)}/{len(results)} posts by {current_user.username}", "INFO")
+        return bulk_response("create", results, current_user)
+    except Exception as e:
+        db.rollback()
+        log_debug(f"❌ Error bulk creating posts: {str(e)}", "ERROR")
+        raise internal_error(e)
+
+@router.put("/bulk", response_model=BulkResponseView, name="api_bulk_update_posts")
+async def api_bulk_update_posts(
+    bulk_data: BulkUpdatePostsView,
+    db: Session = Depends(get_primary_db),  # Use primary for writes
+    current_user: UserModel = Depends(get_current_user_api)
+):
+    """API cập nhật nhiều bài viết trong một transaction (UPDATE theo primary key)"""
+    check_bulk_size(bulk_data.posts)
+    try:
+        post_ids = existing_ids(db, PostModel.id, [p.id for p in bulk_data.posts])
+        kol_ids = existing_ids(db, KOLModel.id, [p.kol_id for p in bulk_data.posts])
+        category_ids = existing_ids(db, CategoryModel.id, [p.category_id for p in bulk_data.posts])
+        
+        results = []
+        rows = []
+        for index, post_data in enumerate(bulk_data.posts):
+            error = "Post not found" if post_data.id not in post_ids else reference_error(post_data, kol_ids, category_ids)
+            if error:
+                results.append(BulkItemResultView(index=index, id=post_data.id, status="error", error=error))
+                continue
+            # Chỉ cập nhật các field được gửi lên (giống api_update_post)
+            values = post_data.model_dump(exclude_none=True)
+            if len(values) > 1:
+                rows.append(values)
+            results.append(BulkItemResultView(index=index, id=post_data.id, status="updated"))
+        
+        if rows:
+            db.execute(update(PostModel), rows)
+            db.commit()
+        
+        log_debug(f"📦 Bulk updated {len(rows)}/{len(results)} posts by {current_user.username}", "INFO")
+        return bulk_response("update", results, current_user)
+    except Exception as e:
+        db.rollback()
+        log_debug(f"❌ Error bulk updating posts: {str(e)}", "ERROR")
+        raise internal_error(e)
+
+@router.delete("/bulk", response_model=BulkResponseView, name="api_bulk_delete_posts")
+async def api_bulk_delete_posts(
+    bulk_data: BulkDeletePostsView,
+    db: Session = Depends(get_primary_db),  # Use primary for writes
+    current_user: UserModel = Depends(get_current_user_api)
+):
+    """API xóa nhiều bài viết bằng một câu DELETE ... WHERE id IN (...)"""
+    check_bulk_size(bulk_data.ids)
+    try:
+        deleted_ids = set(db.execute(
+            delete(PostModel).where(PostModel.id.in_(set(bulk_data.ids))).returning(PostModel.id)
+        ).scalars())
+        db.commit()
+        
+        results = [
+            BulkItemResultView(index=index, id=post_id, status="deleted")
+            if post_id in deleted_ids else
+            BulkItemResultView(index=index, id=post_id, status="error", error="Post not found")
+            for index, post_id in enumerate(bulk_data.ids)
+        ]
+        
+        log_debug(f"📦 Bulk deleted {len(deleted_ids)}/{len(results)} posts by {current_user.username}", "INFO")
+        return bulk_response("delete", results, current_user)
+    except Exception as e:
+        db.rollback()
+        log_debug(f"❌ Error bulk deleting posts: {str(e)}", "ERROR")
+        raise internal_error(e)
 
 @router.get("/{post_id}", response_model=PostDetailResponseView, name="api_get_post_by_id")
+@query_budget(statements=2, rows=2)  # user + post (joinedload kol, category, author)
 async def api_get_post_by_id(
     post_id: int,
     db: Session = Depends(get_db),
@@ -97,7 +398,12 @@ async def api_get_post_by_id(
 ):
     """API lấy chi tiết bài viết theo ID"""
     try:
-        post = db.query(PostModel).filter(PostModel.id == post_id).first()
+        post = (
+            db.query(PostModel)
+            .options(joinedload(PostModel.kol), joinedload(PostModel.category), joinedload(PostModel.author))
+            .filter(PostModel.id == post_id)
+            .first()
+        )
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
         
@@ -125,7 +431,7 @@ async def api_get_post_by_id(
         raise
     except Exception as e:
         log_debug(f"❌ Error getting post {post_id}: {str(e)}", "ERROR")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise internal_error(e)
 
 @router.post("/", response_model=PostDetailResponseView, name="api_create_post")
 async def api_create_post(
@@ -183,7 +489,7 @@ async def api_create_post(
         raise
     except Exception as e:
         log_debug(f"❌ Error creating post: {str(e)}", "ERROR")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise internal_error(e)
 
 @router.put("/{post_id}", response_model=PostDetailResponseView, name="api_update_post")
 async def api_update_post(
@@ -249,7 +555,7 @@ async def api_update_post(
         raise
     except Exception as e:
         log_debug(f"❌ Error updating post {post_id}: {str(e)}", "ERROR")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise internal_error(e)
 
 @router.delete("/{post_id}", name="api_delete_post")
 async def api_delete_post(
@@ -276,11 +582,12 @@ async def api_delete_post(
         raise
     except Exception as e:
         log_debug(f"❌ Error deleting post {post_id}: {str(e)}", "ERROR")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise internal_error(e)
 
 # ==================== KOL ENDPOINTS ====================
 
 @router.get("/kols/", response_model=List[KOLResponseView], name="api_get_all_kols")
+@query_budget(statements=2, rows=101)
 async def api_get_all_kols(
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user_api)
@@ -291,11 +598,12 @@ async def api_get_all_kols(
         return [KOLResponseView.from_orm(kol) for kol in kols]
     except Exception as e:
         log_debug(f"❌ Error getting KOLs: {str(e)}", "ERROR")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise internal_error(e)
 
 # ==================== CATEGORY ENDPOINTS ====================
 
 @router.get("/categories/", response_model=List[CategoryResponseView], name="api_get_all_categories")
+@query_budget(statements=2, rows=101)
 async def api_get_all_categories(
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user_api)
@@ -306,4 +614,4 @@ async def api_get_all_categories(
         return [CategoryResponseView.from_orm(category) for category in categories]
     except Exception as e:
         log_debug(f"❌ Error getting categories: {str(e)}", "ERROR")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}") 
\ No newline at end of file
+        raise internal_error(e) 
\ No newline at end of file
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
 from sqlalchemy.orm import Session
-from app.database.connection import get_db
+from app.database.connection import get_db, get_account_write_db
 from app.middleware.models.user_model import UserModel
 from app.utils.password_utils import get_password_hash
 from app.utils.jwt_utils import verify_token
@@ -107,9 +107,9 @@ async def get_user_by_id(
     return user
 
 @router.post("/users/create", response_model=UserResponse, name="create_user")
-async def create_user(
+def create_user(
     user_data: CreateUserRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_account_write_db),
     current_user: UserModel = Depends(get_current_user_from_token)
 ):
     """Tạo người dùng mới (chỉ admin)"""
@@ -147,10 +147,10 @@ async def create_user(
     return new_user
 
 @router.put("/users/{user_id}", response_model=UserResponse, name="update_user")
-async def update_user(
+def update_user(
     user_id: int,
     user_data: UpdateUserRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_account_write_db),
     current_user: UserModel = Depends(get_current_user_from_token)
 ):
     """Cập nhật thông tin người dùng (chỉ admin)"""
@@ -183,9 +183,9 @@ async def update_user(
     return user
 
 @router.delete("/users/{user_id}", name="delete_user")
-async def delete_user(
+def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_account_write_db),
     current_user: UserModel = Depends(get_current_user_from_token)
 ):
     """Xóa người dùng (chỉ admin)"""
@@ -213,9 +213,9 @@ async def delete_user(
     return {"message": f"User {user.username} deleted successfully"}
 
 @router.patch("/users/{user_id}/toggle-status", response_model=UserResponse, name="toggle_user_status")
-async def toggle_user_status(
+def toggle_user_status(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_account_write_db),
     current_user: UserModel = Depends(get_current_user_from_token)
 ):
     """Bật/tắt trạng thái người dùng (chỉ admin)"""
@@ -245,10 +245,10 @@ async def toggle_user_status(
     return user
 
 @router.patch("/users/{user_id}/change-role", response_model=UserResponse, name="change_user_role")
-async def change_user_role(
+def change_user_role(
     user_id: int,
     is_admin: bool,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_account_write_db),
     current_user: UserModel = Depends(get_current_user_from_token)
 ):
     """Thay đổi vai trò người dùng (chỉ admin)"""
@@ -1,11 +1,10 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from app.utils.logger import log_debug
+from app.utils.templates import templates
 import os
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 # Định nghĩa tất cả các API endpoints
 API_ENDPOINTS = {
@@ -190,6 +189,12 @@ API_ENDPOINTS = {
             "description": "Kiểm tra trạng thái hệ thống",
             "response": "JSON"
         },
+        "ready": {
+            "method": "GET",
+            "path": "/ready",
+            "description": "Kiểm tra ứng dụng đã warm-up (DB, template) xong chưa",
+            "response": "JSON"
+        },
         "api_discovery": {
             "method": "GET",
             "path": "/api/discovery",
@@ -1,23 +1,26 @@
-from fastapi import APIRouter, Request, Depends, Form, HTTPException, UploadFile, File
+from fastapi import APIRouter, Request, Depends, Form, HTTPException, UploadFile, File, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from app.database.connection import get_db
 from app.middleware.models.post_model import PostModel
 from app.middleware.models.kol_model import KOLModel
 from app.utils.logger import log_debug
+from app.utils.templates import templates, stream_template
+from app.utils.query_budget import query_budget
 from app.middleware.auth_middleware import get_current_user  # Thêm import
 from app.middleware.models.user_model import UserModel
 import os
 from datetime import datetime
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 # Tạo thư mục uploads nếu chưa có
 UPLOAD_DIR = "app/static/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Số bài viết mỗi trang ở trang quản trị
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+
 # Thêm function kiểm tra file ảnh
 def is_valid_image_file(filename):
     """Kiểm tra file có phải là ảnh không"""
@@ -29,11 +32,12 @@ def is_valid_image_file(filename):
     return file_extension in allowed_extensions
 
 @router.get("/jisoo", response_class=HTMLResponse, name="jisoo")
+@query_budget(statements=1)  # chưa phân trang nên chưa giới hạn số dòng
 async def jisoo(request: Request, db: Session = Depends(get_db)):
     """Hiển thị tất cả bài viết của Jisoo"""
     log_debug(f"🔍 Truy cập trang Jisoo - IP: {request.client.host}", "DEBUG")
     # Lấy bài viết của Jisoo thông qua KOL
-    posts = db.query(PostModel).join(KOLModel).filter(KOLModel.name == "jisoo").all()
+    posts = db.query(PostModel).join(KOLModel).filter(KOLModel.name == "jisoo").order_by(PostModel.created_at.desc()).all()
     log_debug(f"📝 Tìm thấy {len(posts)} bài viết của Jisoo", "DEBUG")
     return templates.TemplateResponse("members/jisoo.html", {
         "request": request,
@@ -41,11 +45,12 @@ async def jisoo(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/rose", response_class=HTMLResponse, name="rose")
+@query_budget(statements=1)  # chưa phân trang nên chưa giới hạn số dòng
 async def rose(request: Request, db: Session = Depends(get_db)):
     """Hiển thị tất cả bài viết của Rosé"""
     log_debug(f"🔍 Truy cập trang Rosé - IP: {request.client.host}", "DEBUG")
     # Lấy bài viết của Rosé thông qua KOL
-    posts = db.query(PostModel).join(KOLModel).filter(KOLModel.name == "rose").all()
+    posts = db.query(PostModel).join(KOLModel).filter(KOLModel.name == "rose").order_by(PostModel.created_at.desc()).all()
     log_debug(f"📝 Tìm thấy {len(posts)} bài viết của Rosé", "DEBUG")
     return templates.TemplateResponse("members/rose.html", {
         "request": request,
@@ -53,11 +58,12 @@ async def rose(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/lisa", response_class=HTMLResponse, name="lisa")
+@query_budget(statements=1)  # chưa phân trang nên chưa giới hạn số dòng
 async def lisa(request: Request, db: Session = Depends(get_db)):
     """Hiển thị tất cả bài viết của Lisa"""
     log_debug(f"🔍 Truy cập trang Lisa - IP: {request.client.host}", "DEBUG")
     # Lấy bài viết của Lisa thông qua KOL
-    posts = db.query(PostModel).join(KOLModel).filter(KOLModel.name == "lisa").all()
+    posts = db.query(PostModel).join(KOLModel).filter(KOLModel.name == "lisa").order_by(PostModel.created_at.desc()).all()
     log_debug(f"📝 Tìm thấy {len(posts)} bài viết của Lisa", "DEBUG")
     return templates.TemplateResponse("members/lisa.html", {
         "request": request,
@@ -65,11 +71,12 @@ async def lisa(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/jennie", response_class=HTMLResponse, name="jennie")
+@query_budget(statements=1)  # chưa phân trang nên chưa giới hạn số dòng
 async def jennie(request: Request, db: Session = Depends(get_db)):
     """Hiển thị tất cả bài viết của Jennie"""
     log_debug(f"🔍 Truy cập trang Jennie - IP: {request.client.host}", "DEBUG")
     # Lấy bài viết của Jennie thông qua KOL
-    posts = db.query(PostModel).join(KOLModel).filter(KOLModel.name == "jennie").all()
+    posts = db.query(PostModel).join(KOLModel).filter(KOLModel.name == "jennie").order_by(PostModel.created_at.desc()).all()
     log_debug(f"📝 Tìm thấy {len(posts)} bài viết của Jennie", "DEBUG")
     return templates.TemplateResponse("members/jennie.html", {
         "request": request,
@@ -77,20 +84,36 @@ async def jennie(request: Request, db: Session = Depends(get_db)):
     })
 
 @router.get("/admin-management", response_class=HTMLResponse, name="admin_management")
+@query_budget(statements=3, rows=52, query={"per_page": 50})  # user + count + trang (joinedload)
 async def admin_management(
     request: Request, 
+    page: int = Query(1, ge=1, description="Trang hiện tại"),
+    per_page: int = Query(ADMIN_PAGE_SIZE, ge=1, le=200, description="Số bài viết mỗi trang"),
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)  
 ):
     """Trang quản lý bài viết - Yêu cầu đăng nhập"""
     log_debug(f"🔐 Admin Management accessed by: {current_user.username}", "INFO")
-    # Lấy tất cả bài viết
-    posts = db.query(PostModel).all()
-    log_debug(f"📊 Tổng số bài viết trong hệ thống: {len(posts)}", "DEBUG")
-    return templates.TemplateResponse("admin/admin-management.html", {
+    # Chỉ lấy một trang bài viết, load sẵn relationship vì session đóng trước khi stream
+    total = db.query(PostModel).count()
+    posts = (
+        db.query(PostModel)
+        .options(joinedload(PostModel.author), joinedload(PostModel.category))
+        .order_by(PostModel.id.desc())
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+    total_pages = max(1, (total + per_page - 1) // per_page)
+    log_debug(f"📊 Tổng số bài viết trong hệ thống: {total} - trang {page}/{total_pages}", "DEBUG")
+    return stream_template("admin/admin-management.html", {
         "request": request,
         "posts": posts,
-        "username": current_user.username  # Hiển thị username thực
+        "username": current_user.username,  # Hiển thị username thực
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "total_pages": total_pages
     })
 
 # Thêm bài viết mới - Yêu cầu authentication
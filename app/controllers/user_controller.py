@@ -1,12 +1,12 @@
-from fastapi import APIRouter, Request, HTTPException, Depends, Form
+from fastapi import APIRouter, Request, HTTPException, Depends, Form, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from app.database.connection import get_db
+from app.database.connection import get_db, get_account_write_db
 from app.middleware.models.user_model import UserModel
 from app.utils.password_utils import get_password_hash, verify_password
 from app.utils.jwt_utils import create_access_token, verify_token
 from app.utils.logger import log_debug
+from app.utils.templates import templates, stream_template
 from datetime import timedelta
 from dotenv import load_dotenv
 import os
@@ -18,11 +18,13 @@ from app.api.users import router as users_api_router
 load_dotenv()
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 
 # JWT Settings từ .env
 ACCESS_TOKEN_EXPIRE_HOURS = int(os.getenv("ACCESS_TOKEN_EXPIRE_HOURS", "2"))
 
+# Số người dùng mỗi trang ở trang quản trị
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+
 # Helper function để lấy current user từ token - DI CHUYỂN LÊN ĐÂY
 async def get_current_user_from_token(
     request: Request,
@@ -147,13 +149,13 @@ async def register(request: Request):
     })
 
 @router.post("/register-submit", response_class=HTMLResponse, name="register_submit")
-async def register_submit(
+def register_submit(
     request: Request,
     username: str = Form(..., description="Tên đăng nhập"),
     email: str = Form(..., description="Email"),
     password1: str = Form(..., description="Mật khẩu"),
     password2: str = Form(..., description="Xác nhận mật khẩu"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_account_write_db)
 ):
     """Xử lý đăng ký người dùng mới và tạo tài khoản"""
     log_debug("=== REGISTER SUBMIT FUNCTION CALLED ===", "INFO")
@@ -223,7 +225,12 @@ async def logout():
 # ===== NEW USER MANAGEMENT ENDPOINTS =====
 
 @router.get("/admin-users", response_class=HTMLResponse, name="admin_users_page")
-async def admin_users_page(request: Request, db: Session = Depends(get_db)):
+async def admin_users_page(
+    request: Request,
+    page: int = Query(1, ge=1, description="Trang hiện tại"),
+    per_page: int = Query(ADMIN_PAGE_SIZE, ge=1, le=200, description="Số người dùng mỗi trang"),
+    db: Session = Depends(get_db)
+):
     """Trang quản lý người dùng cho admin"""
     log_debug("=== ACCESSING ADMIN USERS PAGE ===", "INFO")
     
@@ -239,15 +246,27 @@ async def admin_users_page(request: Request, db: Session = Depends(get_db)):
         log_debug(f"❌ User {username} is not admin", "WARNING")
         return RedirectResponse(url="/", status_code=302)
     
-    # Lấy tất cả users
-    users = db.query(UserModel).all()
-    log_debug(f"✅ Found {len(users)} users", "INFO")
+    # Chỉ lấy một trang users
+    total = db.query(UserModel).count()
+    users = (
+        db.query(UserModel)
+        .order_by(UserModel.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+    total_pages = max(1, (total + per_page - 1) // per_page)
+    log_debug(f"✅ Found {total} users - page {page}/{total_pages}", "INFO")
     
-    return templates.TemplateResponse("admin/user-management.html", {
+    return stream_template("admin/user-management.html", {
         "request": request,
         "username": username,
         "users": users,
-        "is_admin": True
+        "is_admin": True,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "total_pages": total_pages
     })
 
 # XÓA TẤT CẢ CÁC API ENDPOINTS (từ dòng 254 trở đi)
@@ -0,0 +1,323 @@
+"""
+Import/export CSV và JSONL cho posts, KOLs, categories bằng COPY (không qua ORM)
+
+    python -m app.database.data_transfer export posts posts.csv
+    python -m app.database.data_transfer import posts posts.csv --resume
+    python -m app.database.data_transfer import kols kols.jsonl --format jsonl
+
+Import đọc file theo từng batch (bộ nhớ cố định), COPY FROM STDIN vào bảng tạm rồi
+INSERT ... ON CONFLICT DO NOTHING. Chỉ khi file có cột id hoặc cột unique (kols/categories:
+name) thì chạy lại một batch mới không tạo bản ghi trùng, nên import chỉ ghi checkpoint
+và cho --resume với những file đó. Export COPY TO STDOUT theo từng khoảng id (keyset).
+Sau mỗi batch vị trí trong file được ghi vào <file>.checkpoint để --resume chạy tiếp từ đó.
+"""
+
+from app.database.connection import get_engine
+from app.middleware.models.post_model import PostModel
+from app.middleware.models.kol_model import KOLModel
+from app.middleware.models.category_model import CategoryModel
+from datetime import datetime
+import argparse
+import json
+import io
+import os
+import time
+
+# Bảng hỗ trợ, theo thứ tự import (posts tham chiếu kols/categories)
+TRANSFER_MODELS = {
+    "kols": KOLModel,
+    "categories": CategoryModel,
+    "posts": PostModel,
+}
+
+DEFAULT_BATCH_SIZE = 10000
+
+def table_columns(table):
+    """Các cột ghi được của bảng (bỏ cột generated và cột do trigger tính như posts.search_vector)"""
+    return [
+        c.name for c in TRANSFER_MODELS[table].__table__.columns
+        if c.computed is None and not c.info.get("trigger_maintained")
+    ]
+
+def conflict_columns(table):
+    """Cột có ràng buộc unique (primary key, name...): dòng trùng bị ON CONFLICT bỏ qua"""
+    return [c.name for c in TRANSFER_MODELS[table].__table__.columns if c.primary_key or c.unique]
+
+def detect_format(path, file_format=None):
+    """csv/jsonl theo tham số hoặc phần mở rộng của file"""
+    if file_format:
+        return file_format
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+def checkpoint_path(path):
+    return f"{path}.checkpoint"
+
+def load_checkpoint(path, action, table):
+    """Đọc checkpoint của lần chạy trước, bỏ qua nếu là của thao tác/bảng khác"""
+    try:
+        with open(checkpoint_path(path)) as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if checkpoint.get("action") != action or checkpoint.get("table") != table:
+        print(f"⚠️ Ignoring checkpoint for {checkpoint.get('action')} {checkpoint.get('table')}")
+        return None
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    """Ghi checkpoint qua file tạm + rename để không bao giờ bị ghi dở"""
+    tmp_path = f"{checkpoint_path(path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path(path))
+
+def clear_checkpoint(path):
+    if os.path.exists(checkpoint_path(path)):
+        os.remove(checkpoint_path(path))
+
+def report_progress(action, table, rows, started, done_bytes=None, total_bytes=None):
+    elapsed = max(time.time() - started, 1e-6)
+    message = f"📦 {action} {table}: {rows:,} rows ({rows / elapsed:,.0f} rows/s)"
+    if done_bytes is not None and total_bytes:
+        message += f" - {done_bytes / total_bytes:.1%} of file"
+    print(message)
+
+def copy_text_value(value):
+    """Chuyển một giá trị JSON sang định dạng text của COPY (NULL = \\N)"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, bool):
+        value = "true" if value else "false"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def read_csv_batches(f, batch_size):
+    """Đọc nguyên văn từng batch record CSV (bytes) kể cả field nhiều dòng trong ngoặc kép"""
+    batch, record_lines, quotes, rows = [], [], 0, 0
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        record_lines.append(line)
+        quotes += line.count(b'"')
+        # Số dấu " lẻ nghĩa là field trong ngoặc kép còn tiếp ở dòng sau
+        if quotes % 2:
+            continue
+        record = b"".join(record_lines)
+        record_lines, quotes = [], 0
+        if not record.strip():
+            continue
+        batch.append(record if record.endswith(b"\n") else record + b"\n")
+        rows += 1
+        if rows == batch_size:
+            yield b"".join(batch), rows
+            batch, rows = [], 0
+    if record_lines:
+        raise ValueError("CSV file ends inside a quoted field")
+    if batch:
+        yield b"".join(batch), rows
+
+def read_jsonl_batches(f, columns, batch_size):
+    """Đọc từng batch JSONL và chuyển sang định dạng text của COPY theo thứ tự columns"""
+    buffer, rows = io.StringIO(), 0
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        buffer.write("\t".join(copy_text_value(record.get(column)) for column in columns))
+        buffer.write("\n")
+        rows += 1
+        if rows == batch_size:
+            yield buffer.getvalue().encode("utf-8"), rows
+            buffer, rows = io.StringIO(), 0
+    if rows:
+        yield buffer.getvalue().encode("utf-8"), rows
+
+def import_columns(f, table, file_format):
+    """Cột của file: header CSV hoặc key của dòng JSONL đầu tiên"""
+    allowed = table_columns(table)
+    position = f.tell()
+    if file_format == "csv":
+        header = f.readline().decode("utf-8-sig").strip()
+        columns = [c.strip().strip('"') for c in header.split(",")]
+        data_start = f.tell()
+    else:
+        line = f.readline()
+        while line and not line.strip():
+            line = f.readline()
+        columns = [c for c in json.loads(line) if c in allowed] if line else []
+        data_start = position
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(unknown)}")
+    if not columns:
+        raise ValueError(f"No importable columns found for {table}")
+    return columns, data_start
+
+def copy_batch(conn, table, columns, data, file_format):
+    """COPY một batch vào bảng tạm rồi đưa sang bảng thật, trả về số dòng đã thêm"""
+    column_list = ", ".join(columns)
+    copy_options = "FORMAT csv" if file_format == "csv" else "FORMAT text"
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMP TABLE transfer_stage ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {table} WITH NO DATA"
+        )
+        cursor.copy_expert(f"COPY transfer_stage ({column_list}) FROM STDIN WITH ({copy_options})", io.BytesIO(data))
+        # Trùng khóa (id, name unique) bị bỏ qua: import lại một batch chỉ an toàn khi file có các cột này
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM transfer_stage ON CONFLICT DO NOTHING"
+        )
+        inserted = cursor.rowcount
+    conn.commit()
+    return inserted
+
+def sync_id_sequence(conn, table):
+    """Import có cột id thì đẩy sequence lên max(id), tránh trùng khóa khi app insert tiếp"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table}"
+        )
+    conn.commit()
+
+def import_table(table, path, file_format=None, batch_size=DEFAULT_BATCH_SIZE, resume=False, role="primary"):
+    """Import file CSV/JSONL vào bảng bằng COPY FROM STDIN theo từng batch
+
+    Checkpoint ghi sau khi batch đã commit, crash ở giữa thì --resume chạy lại batch cuối:
+    chỉ cho phép khi file có cột unique để batch chạy lại không tạo dòng trùng.
+    """
+    file_format = detect_format(path, file_format)
+    total_bytes = os.path.getsize(path)
+    with open(path, "rb") as f:
+        columns, data_start = import_columns(f, table, file_format)
+    keys = [c for c in columns if c in conflict_columns(table)]
+    if not keys:
+        if resume:
+            raise ValueError(
+                f"--resume needs one of {', '.join(conflict_columns(table))} in the file: "
+                f"without a unique column a re-run batch would be inserted twice"
+            )
+        print(f"⚠️ No unique column ({', '.join(conflict_columns(table))}) in {path}: "
+              f"no checkpoint is written, re-running this import duplicates rows")
+    checkpoint = load_checkpoint(path, "import", table) if resume else None
+    rows = checkpoint["rows"] if checkpoint else 0
+    inserted = checkpoint["inserted"] if checkpoint else 0
+
+    print(f"📥 Importing {path} ({file_format}) into {table}, batch size {batch_size}")
+    conn = get_engine(role).raw_connection()
+    try:
+        with open(path, "rb") as f:
+            f.seek(checkpoint["offset"] if checkpoint else data_start)
+            if checkpoint:
+                print(f"⏩ Resuming after {rows:,} rows (byte {checkpoint['offset']:,})")
+
+            started = time.time()
+            batches = (read_csv_batches(f, batch_size) if file_format == "csv"
+                       else read_jsonl_batches(f, columns, batch_size))
+            for data, batch_rows in batches:
+                inserted += copy_batch(conn, table, columns, data, file_format)
+                rows += batch_rows
+                if keys:
+                    save_checkpoint(path, {
+                        "action": "import", "table": table, "offset": f.tell(),
+                        "rows": rows, "inserted": inserted, "updated_at": datetime.now().isoformat()
+                    })
+                report_progress("import", table, rows, started, f.tell(), total_bytes)
+
+        if "id" in columns:
+            sync_id_sequence(conn, table)
+    finally:
+        conn.close()
+
+    clear_checkpoint(path)
+    print(f"✅ Imported {table}: {rows:,} rows read, {inserted:,} inserted, {rows - inserted:,} already present")
+    return {"rows": rows, "inserted": inserted}
+
+def export_query(table, columns, file_format, last_id, upper_id):
+    """Câu SELECT cho một khoảng id, JSONL dùng row_to_json"""
+    select = (f"SELECT {', '.join(columns)} FROM {table} "
+              f"WHERE id > {int(last_id)} AND id <= {int(upper_id)} ORDER BY id")
+    if file_format == "jsonl":
+        return f"SELECT row_to_json(t) FROM ({select}) t"
+    return select
+
+def export_table(table, path, file_format=None, batch_size=DEFAULT_BATCH_SIZE, resume=False, role="replica"):
+    """Export bảng ra CSV/JSONL bằng COPY TO STDOUT theo từng khoảng id"""
+    file_format = detect_format(path, file_format)
+    columns = table_columns(table)
+    checkpoint = load_checkpoint(path, "export", table) if resume else None
+    last_id = checkpoint["last_id"] if checkpoint else 0
+    rows = checkpoint["rows"] if checkpoint else 0
+
+    if file_format == "csv":
+        copy_options = "FORMAT csv"
+    else:
+        # Mỗi dòng là một JSON nguyên văn: CSV với quote/delimiter không bao giờ xuất hiện trong JSON
+        copy_options = "FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02'"
+
+    print(f"📤 Exporting {table} to {path} ({file_format}), batch size {batch_size}")
+    conn = get_engine(role).raw_connection()
+    try:
+        with open(path, "r+b" if checkpoint else "wb") as f:
+            if checkpoint:
+                # Bỏ phần batch ghi dở sau checkpoint cuối
+                f.truncate(checkpoint["offset"])
+                f.seek(checkpoint["offset"])
+                print(f"⏩ Resuming after id {last_id} ({rows:,} rows)")
+            elif file_format == "csv":
+                f.write((",".join(columns) + "\n").encode("utf-8"))
+
+            started = time.time()
+            with conn.cursor() as cursor:
+                while True:
+                    # Biên trên của batch theo index primary key, mỗi COPY chỉ đọc một khoảng id
+                    cursor.execute(
+                        f"SELECT count(*), max(id) FROM (SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s) batch",
+                        (last_id, batch_size)
+                    )
+                    batch_rows, upper_id = cursor.fetchone()
+                    if not batch_rows:
+                        break
+                    query = export_query(table, columns, file_format, last_id, upper_id)
+                    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH ({copy_options})", f)
+                    conn.rollback()
+                    last_id, rows = upper_id, rows + batch_rows
+                    f.flush()
+                    save_checkpoint(path, {
+                        "action": "export", "table": table, "offset": f.tell(),
+                        "last_id": last_id, "rows": rows, "updated_at": datetime.now().isoformat()
+                    })
+                    report_progress("export", table, rows, started)
+    finally:
+        conn.close()
+
+    clear_checkpoint(path)
+    print(f"✅ Exported {table}: {rows:,} rows to {path}")
+    return {"rows": rows}
+
+def main():
+    parser = argparse.ArgumentParser(description="Import/export posts, KOLs and categories with COPY")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("table", choices=list(TRANSFER_MODELS))
+    parser.add_argument("path", help="CSV or JSONL file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None,
+                        help="File format (default: from file extension)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per COPY batch")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from <path>.checkpoint (import: file needs an id or unique column)")
+    parser.add_argument("--role", choices=["primary", "replica", "haproxy"], default=None,
+                        help="Engine to use (default: primary for import, replica for export)")
+    args = parser.parse_args()
+
+    if args.action == "import":
+        import_table(args.table, args.path, args.format, args.batch_size, args.resume, args.role or "primary")
+    else:
+        export_table(args.table, args.path, args.format, args.batch_size, args.resume, args.role or "replica")
+
+if __name__ == "__main__":
+    main()
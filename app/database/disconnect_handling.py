@@ -0,0 +1,98 @@
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Session
+from app.utils.logger import log_debug
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+load_dotenv()
+
+# Chờ một chút trước khi thử lại để HAProxy/libpq kịp chuyển sang primary mới
+DB_READ_RETRY_DELAY = float(os.getenv("DB_READ_RETRY_DELAY", "0.2"))
+
+# SQLSTATE báo server đóng kết nối: admin_shutdown (pg_terminate_backend, fence),
+# crash_shutdown, cannot_connect_now; class 08 là connection_exception
+DISCONNECT_SQLSTATES = {"57P01", "57P02", "57P03"}
+DISCONNECT_SQLSTATE_CLASS = "08"
+
+class DisconnectStats:
+    """Bộ đếm trong process: số lỗi mất kết nối và số lần retry câu đọc"""
+
+    def __init__(self):
+        self.counters = {
+            "disconnects": 0,
+            "read_retries": 0,
+            "read_retry_failures": 0,
+        }
+        self._lock = threading.Lock()
+
+    def increment(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+disconnect_stats = DisconnectStats()
+
+def is_disconnect_sqlstate(pgcode):
+    return bool(pgcode) and (pgcode in DISCONNECT_SQLSTATES or pgcode.startswith(DISCONNECT_SQLSTATE_CLASS))
+
+def is_connection_lost(error):
+    """Lỗi do mất kết nối DB (kết nối đã bị invalidate), client có thể thử lại"""
+    return isinstance(error, exc.DBAPIError) and error.connection_invalidated
+
+def attach_disconnect_handling(db_engine, role):
+    """Coi lỗi SQLSTATE đóng kết nối (pg_terminate_backend, shutdown) là disconnect để
+    SQLAlchemy invalidate cả pool của engine (mặc định invalidate_pool_on_disconnect)
+    thay vì đợi pool_pre_ping phát hiện từng kết nối hỏng lúc checkout"""
+
+    @event.listens_for(db_engine, "handle_error")
+    def mark_disconnect(context):
+        pgcode = getattr(context.original_exception, "pgcode", None)
+        if is_disconnect_sqlstate(pgcode):
+            context.is_disconnect = True
+        if context.is_disconnect:
+            # Đếm từng câu lệnh lỗi vì mất kết nối (nhiều kết nối hỏng cùng lúc thì đếm nhiều lần)
+            disconnect_stats.increment("disconnects")
+            log_debug(f"🔌 {role} engine lost its connection, pool invalidated: {context.original_exception}", "WARNING")
+
+def _is_read(statement):
+    return getattr(statement, "is_select", False)
+
+class ReadRetrySession(Session):
+    """Session tự thử lại một lần câu SELECT bị mất kết nối
+
+    Chỉ retry khi transaction hiện tại chưa ghi gì (chưa flush, chưa execute câu ghi):
+    rollback rồi chạy lại trên kết nối mới là an toàn vì câu đọc idempotent.
+    Transaction đã có ghi thì lỗi được ném ra như cũ.
+    """
+
+    def execute(self, statement, *args, **kwargs):
+        if not _is_read(statement):
+            self.info["has_writes"] = True
+        try:
+            return super().execute(statement, *args, **kwargs)
+        except exc.DBAPIError as e:
+            if not (e.connection_invalidated and _is_read(statement) and not self.info.get("has_writes")):
+                raise
+        disconnect_stats.increment("read_retries")
+        log_debug("🔁 Retrying read after connection loss", "WARNING")
+        self.rollback()
+        time.sleep(DB_READ_RETRY_DELAY)
+        try:
+            return super().execute(statement, *args, **kwargs)
+        except exc.DBAPIError:
+            disconnect_stats.increment("read_retry_failures")
+            raise
+
+@event.listens_for(ReadRetrySession, "after_flush")
+def _mark_flush(session, flush_context):
+    session.info["has_writes"] = True
+
+@event.listens_for(ReadRetrySession, "after_commit")
+@event.listens_for(ReadRetrySession, "after_rollback")
+def _reset_writes(session):
+    session.info.pop("has_writes", None)
@@ -0,0 +1,210 @@
+"""
+Sinh dữ liệu giả lập quy mô production cho benchmark (users, KOLs, categories, posts)
+
+    python -m app.database.generate_data --posts 1000000 --users 10000 --reset
+
+Cùng --seed thì luôn sinh ra đúng cùng một bộ dữ liệu. Dữ liệu được COPY thẳng vào
+bảng theo từng batch (không qua ORM, bộ nhớ cố định). Mọi user có mật khẩu
+GENERATED_PASSWORD để benchmark có thể đăng nhập.
+"""
+
+from sqlalchemy import text
+from app.database.connection import get_engine
+from app.database.data_transfer import copy_text_value, table_columns
+from app.utils.password_utils import pwd_context
+from datetime import datetime, timedelta
+import argparse
+import io
+import math
+import random
+import time
+
+GENERATED_PASSWORD = "benchmark123"
+# Salt cố định để hash mật khẩu cũng tất định
+GENERATED_PASSWORD_SALT = "blinkbenchmarksalt000."
+
+DEFAULT_SEED = 42
+DEFAULT_BATCH_SIZE = 20000
+
+BASE_KOLS = ["Jennie", "Jisoo", "Lisa", "Rose"]
+BASE_CATEGORIES = ["Music", "Fashion", "Beauty", "Lifestyle", "Travel"]
+CATEGORY_COLORS = ["#FF6B6B", "#4ECDC4", "#45B7D1", "#96CEB4", "#FFEAA7"]
+
+# Từ vựng trộn tiếng Việt/tiếng Anh, tần suất theo Zipf để full-text search có từ phổ biến lẫn từ hiếm
+VOCABULARY = (
+    "blackpink jennie jisoo lisa rose concert album music fashion show world tour stage "
+    "comeback single chart record dance vocal rap visual brand ambassador collection runway "
+    "photo shoot interview fan meeting festival award performance video teaser release "
+    "âm nhạc thời trang sự kiện buổi diễn sân khấu người hâm mộ bài hát ca khúc phong cách "
+    "làm đẹp du lịch hình ảnh trang phục thương hiệu đại sứ bộ sưu tập lịch trình tin tức "
+    "mới nhất hôm nay tuần này kỷ lục bảng xếp hạng lượt xem triệu ngày đêm thành công "
+    "the a of and in on with for to from new first best live official special limited"
+).split()
+
+# Phân phối độ dài (ký tự): lognormal quanh trung vị, cắt ở giới hạn cột
+TITLE_LENGTH = (60, 0.35, 255)
+EXCERPT_LENGTH = (120, 0.4, 500)
+CONTENT_LENGTH = (1500, 0.9, 20000)
+
+class DataGenerator:
+    """Sinh từng dòng cho mỗi bảng từ một random.Random có seed"""
+
+    def __init__(self, seed, users, kols, categories, days):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.kols = kols
+        self.categories = categories
+        self.days = days
+        self.now = datetime(2025, 1, 1)
+        self.cum_word_weights = list(self._cumulative(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+        # Vài KOL và category chiếm phần lớn bài viết, giống dữ liệu thật
+        self.cum_kol_weights = list(self._cumulative(1 / rank ** 1.2 for rank in range(1, kols + 1)))
+        self.cum_category_weights = list(self._cumulative(1 / rank for rank in range(1, categories + 1)))
+
+    @staticmethod
+    def _cumulative(weights):
+        total = 0
+        for weight in weights:
+            total += weight
+            yield total
+
+    def length(self, spec):
+        median, sigma, limit = spec
+        return max(1, min(limit, int(self.rng.lognormvariate(math.log(median), sigma))))
+
+    def sentence(self, spec):
+        """Chuỗi từ ngẫu nhiên có độ dài theo spec"""
+        target = self.length(spec)
+        words = []
+        size = 0
+        while size < target:
+            chunk = self.rng.choices(VOCABULARY, cum_weights=self.cum_word_weights, k=32)
+            for word in chunk:
+                words.append(word)
+                size += len(word) + 1
+                if size >= target:
+                    break
+        return " ".join(words)[:spec[2]]
+
+    def user_rows(self):
+        hashed_password = pwd_context.handler("bcrypt").using(salt=GENERATED_PASSWORD_SALT).hash(GENERATED_PASSWORD)
+        for user_id in range(1, self.users + 1):
+            created_at = self.now - timedelta(days=self.days, seconds=-user_id)
+            yield (user_id, f"user{user_id}", f"user{user_id}@example.com", hashed_password,
+                   True, user_id == 1, created_at.isoformat())
+
+    def kol_rows(self):
+        for kol_id in range(1, self.kols + 1):
+            name = BASE_KOLS[kol_id - 1] if kol_id <= len(BASE_KOLS) else f"KOL {kol_id}"
+            yield (kol_id, name, f"BLACKPINK {name}" if kol_id <= len(BASE_KOLS) else f"Generated {name}",
+                   f"{name.lower().replace(' ', '_')}.jpg", True)
+
+    def category_rows(self):
+        for category_id in range(1, self.categories + 1):
+            base = category_id <= len(BASE_CATEGORIES)
+            name = BASE_CATEGORIES[category_id - 1] if base else f"Category {category_id}"
+            color = CATEGORY_COLORS[(category_id - 1) % len(CATEGORY_COLORS)]
+            yield (category_id, name, f"Generated {name}", color, True)
+
+    def post_rows(self, posts):
+        span = self.days * 86400
+        for post_id in range(1, posts + 1):
+            # created_at tăng dần theo id (có nhiễu) như dữ liệu được tạo theo thời gian thật
+            offset = span * post_id / posts + self.rng.uniform(-3600, 3600)
+            created_at = self.now - timedelta(seconds=span) + timedelta(seconds=offset)
+            kol_id = self.rng.choices(range(1, self.kols + 1), cum_weights=self.cum_kol_weights)[0]
+            category_id = self.rng.choices(range(1, self.categories + 1), cum_weights=self.cum_category_weights)[0]
+            yield (
+                post_id,
+                self.sentence(TITLE_LENGTH).capitalize(),
+                self.sentence(CONTENT_LENGTH),
+                self.sentence(EXCERPT_LENGTH),
+                f"post_{post_id % 50}.jpg",
+                self.rng.randint(1, self.users),
+                kol_id,
+                category_id,
+                created_at.isoformat(),
+                None,
+            )
+
+TABLE_ROW_COLUMNS = {
+    "users": ["id", "username", "email", "hashed_password", "is_active", "is_admin", "created_at"],
+    "kols": ["id", "name", "description", "avatar", "is_active"],
+    "categories": ["id", "name", "description", "color", "is_active"],
+    "posts": table_columns("posts"),
+}
+
+def copy_rows(conn, table, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """COPY FROM STDIN từng batch dòng vào bảng, commit sau mỗi batch"""
+    columns = TABLE_ROW_COLUMNS[table]
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)"
+    started = time.time()
+    total = 0
+    buffer, count = io.StringIO(), 0
+    with conn.cursor() as cursor:
+        for row in rows:
+            buffer.write("\t".join(copy_text_value(value) for value in row))
+            buffer.write("\n")
+            count += 1
+            if count == batch_size:
+                cursor.copy_expert(sql, io.BytesIO(buffer.getvalue().encode("utf-8")))
+                conn.commit()
+                total += count
+                buffer, count = io.StringIO(), 0
+                print(f"📦 {table}: {total:,} rows ({total / max(time.time() - started, 1e-6):,.0f} rows/s)")
+        if count:
+            cursor.copy_expert(sql, io.BytesIO(buffer.getvalue().encode("utf-8")))
+            conn.commit()
+            total += count
+        # id được chỉ định sẵn nên phải đẩy sequence lên để app insert tiếp không trùng khóa
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST(MAX(id), 1)) FROM {table}")
+        conn.commit()
+    print(f"✅ {table}: {total:,} rows in {time.time() - started:.1f}s")
+    return total
+
+def generate_data(posts, users, kols, categories, days=365, seed=DEFAULT_SEED,
+                  batch_size=DEFAULT_BATCH_SIZE, reset=False, role="primary"):
+    """Sinh toàn bộ dữ liệu; các bảng phải rỗng trừ khi reset=True"""
+    db_engine = get_engine(role)
+    with db_engine.begin() as conn:
+        if reset:
+            print("🧹 Truncating posts, categories, kols, users...")
+            conn.execute(text("TRUNCATE posts, categories, kols, users RESTART IDENTITY CASCADE"))
+        else:
+            for table in ["users", "kols", "categories", "posts"]:
+                if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {table})")).scalar():
+                    raise RuntimeError(f"Table {table} is not empty, use --reset to regenerate")
+
+    generator = DataGenerator(seed, users, kols, categories, days)
+    print(f"🎲 Generating {users:,} users, {kols} KOLs, {categories} categories, {posts:,} posts (seed={seed})")
+    started = time.time()
+    conn = db_engine.raw_connection()
+    try:
+        counts = {
+            "users": copy_rows(conn, "users", generator.user_rows(), batch_size),
+            "kols": copy_rows(conn, "kols", generator.kol_rows(), batch_size),
+            "categories": copy_rows(conn, "categories", generator.category_rows(), batch_size),
+            "posts": copy_rows(conn, "posts", generator.post_rows(posts), batch_size),
+        }
+        # Thống kê mới cho planner trước khi benchmark
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE users, kols, categories, posts")
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Generated data in {time.time() - started:.1f}s - login with any userN / {GENERATED_PASSWORD}")
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate deterministic benchmark data with COPY")
+    parser.add_argument("--posts", type=int, default=100000, help="Number of posts")
+    parser.add_argument("--users", type=int, default=1000, help="Number of users")
+    parser.add_argument("--kols", type=int, default=len(BASE_KOLS), help="Number of KOLs")
+    parser.add_argument("--categories", type=int, default=len(BASE_CATEGORIES), help="Number of categories")
+    parser.add_argument("--days", type=int, default=365, help="Spread created_at over this many days")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Random seed")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per COPY batch")
+    parser.add_argument("--reset", action="store_true", help="Truncate the tables first")
+    args = parser.parse_args()
+    generate_data(args.posts, args.users, args.kols, args.categories, args.days, args.seed,
+                  args.batch_size, args.reset)
@@ -1,15 +1,29 @@
-from app.database.connection import engine, Base
-from app.middleware.models.user_model import UserModel
-from app.middleware.models.post_model import PostModel
-from app.middleware.models.kol_model import KOLModel
-from app.middleware.models.category_model import CategoryModel
+from alembic import command
+from alembic.config import Config
+from sqlalchemy.exc import OperationalError
+import sys
+import time
 
-def init_database():
-    """Khởi tạo database và tạo tất cả bảng"""
-    print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+ALEMBIC_CONFIG = "alembic.ini"
+
+def init_database(max_attempts=30, delay=2):
+    """Đưa schema lên phiên bản mới nhất bằng Alembic (bước migration, chạy một lần trước khi start app)"""
+    print("Running Alembic migrations...")
+    # Đợi DB/HAProxy sẵn sàng với retry
+    for attempt in range(1, max_attempts + 1):
+        try:
+            command.upgrade(Config(ALEMBIC_CONFIG), "head")
+            break
+        except OperationalError as e:
+            print(f"⏳ Waiting for database (attempt {attempt}/{max_attempts}): {str(e).splitlines()[0]}")
+            time.sleep(delay)
+    else:
+        print("❌ Could not connect to database after retries")
+        return False
     print("✅ Database initialized successfully!")
-    print("✅ Tables created: users, posts, kols, categories")
+    print("✅ Tables: users, posts, kols, categories (with post indexes)")
+    return True
 
 if __name__ == "__main__":
-    init_database()
+    # Exit code khác 0 để start.sh/container dừng lại thay vì chạy app trên schema cũ
+    sys.exit(0 if init_database() else 1)
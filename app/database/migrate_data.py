@@ -1,48 +1,133 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import text
 from app.database.connection import engine
+from app.database.data_transfer import load_checkpoint, save_checkpoint, clear_checkpoint
 # Import tất cả models để đảm bảo chúng được đăng ký
 from app.middleware.models.user_model import UserModel
 from app.middleware.models.kol_model import KOLModel
 from app.middleware.models.category_model import CategoryModel
 from app.middleware.models.post_model import PostModel
+from datetime import datetime
+import argparse
+import time
 
-def migrate_existing_data():
-    """Chuyển đổi dữ liệu từ cột member và category cũ sang khóa ngoại mới"""
-    with Session(engine) as session:
-        # Lấy tất cả posts hiện tại
-        posts = session.query(PostModel).all()
-        
-        # Tạo mapping cho KOLs
-        kol_mapping = {}
-        for post in posts:
-            if hasattr(post, 'member') and post.member and post.member not in kol_mapping:
-                kol = session.query(KOLModel).filter(KOLModel.name == post.member).first()
-                if not kol:
-                    kol = KOLModel(name=post.member, description=f"KOL {post.member}")
-                    session.add(kol)
-                    session.flush()  # Để lấy ID
-                kol_mapping[post.member] = kol.id
-        
-        # Tạo mapping cho Categories
-        category_mapping = {}
-        for post in posts:
-            if hasattr(post, 'category') and post.category and post.category not in category_mapping:
-                category = session.query(CategoryModel).filter(CategoryModel.name == post.category).first()
-                if not category:
-                    category = CategoryModel(name=post.category, description=f"Category {post.category}")
-                    session.add(category)
-                    session.flush()  # Để lấy ID
-                category_mapping[post.category] = category.id
-        
-        # Cập nhật posts với khóa ngoại
-        for post in posts:
-            if hasattr(post, 'member') and post.member and post.member in kol_mapping:
-                post.kol_id = kol_mapping[post.member]
-            if hasattr(post, 'category') and post.category and post.category in category_mapping:
-                post.category_id = category_mapping[post.category]
-        
-        session.commit()
-        print("✅ Data migration completed successfully!")
+DEFAULT_BATCH_SIZE = 5000
+CHECKPOINT_PATH = "logs/migrate_data"
+
+# Mỗi chunk là một transaction ngắn, không chờ lock quá lâu khi app đang chạy
+CHUNK_LOCK_TIMEOUT = "5s"
+
+# cột cũ trong posts -> (bảng đích, cột khóa ngoại, mô tả mặc định)
+LEGACY_MAPPINGS = {
+    "member": ("kols", "kol_id", "KOL "),
+    "category": ("categories", "category_id", "Category "),
+}
+
+def legacy_columns(conn):
+    """Các cột cũ (member, category) còn tồn tại trong bảng posts"""
+    rows = conn.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = 'posts' AND column_name IN ('member', 'category')"
+    )).scalars().all()
+    return [column for column in LEGACY_MAPPINGS if column in rows]
+
+def dry_run_report(conn, columns):
+    """Đếm những gì migration sẽ làm, không ghi gì"""
+    report = {}
+    for column in columns:
+        table, foreign_key, _ = LEGACY_MAPPINGS[column]
+        report[f"missing_{table}"] = conn.execute(text(
+            f"SELECT count(DISTINCT p.{column}) FROM posts p "
+            f"WHERE p.{column} IS NOT NULL AND p.{column} <> '' "
+            f"AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.name = p.{column})"
+        )).scalar()
+        report[f"posts_to_update_{foreign_key}"] = conn.execute(text(
+            f"SELECT count(*) FROM posts p LEFT JOIN {table} t ON t.name = p.{column} "
+            f"WHERE p.{column} IS NOT NULL AND p.{column} <> '' AND p.{foreign_key} IS DISTINCT FROM t.id"
+        )).scalar()
+    return report
+
+def insert_missing_references(conn, column):
+    """Tạo KOL/Category còn thiếu bằng một câu INSERT ... SELECT DISTINCT ... ON CONFLICT"""
+    table, _, description = LEGACY_MAPPINGS[column]
+    result = conn.execute(text(
+        f"INSERT INTO {table} (name, description) "
+        f"SELECT DISTINCT {column}, :description || {column} FROM posts "
+        f"WHERE {column} IS NOT NULL AND {column} <> '' "
+        f"ON CONFLICT (name) DO NOTHING"
+    ), {"description": description})
+    return result.rowcount
+
+def update_chunk(conn, column, lower_id, upper_id):
+    """Gán khóa ngoại cho các post trong khoảng id bằng UPDATE ... FROM"""
+    table, foreign_key, _ = LEGACY_MAPPINGS[column]
+    result = conn.execute(text(
+        f"UPDATE posts p SET {foreign_key} = t.id FROM {table} t "
+        f"WHERE t.name = p.{column} AND p.id > :lower_id AND p.id <= :upper_id "
+        f"AND p.{foreign_key} IS DISTINCT FROM t.id"
+    ), {"lower_id": lower_id, "upper_id": upper_id})
+    return result.rowcount
+
+def migrate_existing_data(batch_size=DEFAULT_BATCH_SIZE, dry_run=False, resume=False):
+    """Chuyển đổi dữ liệu từ cột member và category cũ sang khóa ngoại mới
+
+    Chạy theo tập hợp thay vì từng object ORM: tạo KOL/Category còn thiếu bằng
+    INSERT ... ON CONFLICT, rồi UPDATE ... FROM theo từng khoảng id, mỗi khoảng
+    commit riêng và ghi checkpoint để --resume chạy tiếp.
+    """
+    with engine.connect() as conn:
+        columns = legacy_columns(conn)
+        conn.commit()
+        if not columns:
+            print("✅ No legacy member/category columns on posts, nothing to migrate")
+            return {}
+
+        if dry_run:
+            report = dry_run_report(conn, columns)
+            print("🔍 Dry run - no changes written:")
+            for key, value in report.items():
+                print(f"   {key}: {value:,}")
+            return report
+
+        for column in columns:
+            with conn.begin():
+                created = insert_missing_references(conn, column)
+            print(f"✅ {LEGACY_MAPPINGS[column][0]}: {created} created from posts.{column}")
+
+        min_id, max_id = conn.execute(text("SELECT min(id), max(id) FROM posts")).one()
+        conn.commit()
+        if max_id is None:
+            print("✅ No posts to migrate")
+            return {}
+
+        checkpoint = load_checkpoint(CHECKPOINT_PATH, "migrate", "posts") if resume else None
+        lower_id = checkpoint["last_id"] if checkpoint else min_id - 1
+        updated = checkpoint["updated"] if checkpoint else 0
+        if checkpoint:
+            print(f"⏩ Resuming after post id {lower_id} ({updated:,} posts updated so far)")
+
+        started = time.time()
+        while lower_id < max_id:
+            upper_id = min(lower_id + batch_size, max_id)
+            with conn.begin():
+                conn.execute(text(f"SET LOCAL lock_timeout = '{CHUNK_LOCK_TIMEOUT}'"))
+                for column in columns:
+                    updated += update_chunk(conn, column, lower_id, upper_id)
+            lower_id = upper_id
+            save_checkpoint(CHECKPOINT_PATH, {
+                "action": "migrate", "table": "posts", "last_id": lower_id,
+                "updated": updated, "updated_at": datetime.now().isoformat()
+            })
+            done = (lower_id - min_id + 1) / (max_id - min_id + 1)
+            print(f"📦 Posts up to id {lower_id}: {updated:,} updated ({done:.1%}, {time.time() - started:.1f}s)")
+
+    clear_checkpoint(CHECKPOINT_PATH)
+    print("✅ Data migration completed successfully!")
+    return {"updated": updated}
 
 if __name__ == "__main__":
-    migrate_existing_data()
+    parser = argparse.ArgumentParser(description="Migrate posts.member/category to kol_id/category_id")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Post ids per UPDATE chunk")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint")
+    args = parser.parse_args()
+    migrate_existing_data(args.batch_size, args.dry_run, args.resume)
@@ -0,0 +1,59 @@
+from logging.config import fileConfig
+
+from sqlalchemy import create_engine
+from sqlalchemy import pool
+
+from alembic import context
+
+from app.database.connection import Base, PRIMARY_DB_URL
+# Import tất cả models để metadata đầy đủ cho autogenerate
+from app.middleware.models.user_model import UserModel
+from app.middleware.models.kol_model import KOLModel
+from app.middleware.models.category_model import CategoryModel
+from app.middleware.models.post_model import PostModel
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# Migration luôn chạy trên primary (replica là read-only)
+DATABASE_URL = config.get_main_option("sqlalchemy.url") or PRIMARY_DB_URL
+
+
+def run_migrations_offline() -> None:
+    """Sinh SQL ra stdout mà không cần kết nối DB (alembic upgrade head --sql)"""
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Chạy migration trực tiếp trên primary"""
+    connectable = create_engine(DATABASE_URL, poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        # Mỗi revision một transaction để CREATE INDEX CONCURRENTLY dùng được autocommit_block
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,63 @@
+"""indexes for posts: foreign keys, created_at and (kol_id, created_at DESC)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:30:00
+
+Dùng CREATE INDEX CONCURRENTLY (ngoài transaction) để không khóa ghi trên primary.
+Không tạo index riêng cho kol_id vì ix_posts_kol_id_created_at đã bắt đầu bằng kol_id.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (tên index, danh sách cột) - trùng với khai báo trong PostModel
+POST_INDEXES = [
+    ("ix_posts_author_id", ["author_id"]),
+    ("ix_posts_category_id", ["category_id"]),
+    ("ix_posts_created_at", ["created_at"]),
+    # Trang member / listing: WHERE kol_id = ? ORDER BY created_at DESC
+    ("ix_posts_kol_id_created_at", ["kol_id", sa.text("created_at DESC")]),
+]
+
+
+def _is_invalid_index(name):
+    """Lần CREATE INDEX CONCURRENTLY trước bị lỗi để lại index INVALID mà IF NOT EXISTS sẽ bỏ qua"""
+    if op.get_context().as_sql:
+        return False
+    return bool(op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).scalar())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, columns in POST_INDEXES:
+            if _is_invalid_index(name):
+                op.drop_index(name, table_name="posts", postgresql_concurrently=True)
+            op.create_index(
+                name, "posts", columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(POST_INDEXES):
+            op.drop_index(
+                name, table_name="posts",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -0,0 +1,105 @@
+"""full-text search on posts: trigger-maintained tsvector column + GIN index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 10:00:00
+
+Dùng cấu hình 'simple' vì nội dung trộn tiếng Việt và tiếng Anh (Postgres không có stemmer tiếng Việt).
+Không dùng cột GENERATED STORED: ADD COLUMN kiểu đó rewrite cả bảng posts dưới ACCESS EXCLUSIVE lock.
+Thay vào đó: cột nullable (chỉ đổi catalog) + trigger giữ giá trị cho dòng mới/sửa,
+backfill theo lô id (mỗi lô một transaction) rồi tạo GIN index CONCURRENTLY.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+
+def search_vector_sql(prefix=""):
+    """Giữ nguyên biểu thức tại thời điểm migration (PostModel.SEARCH_VECTOR_SQL phải trùng)"""
+    return (
+        f"setweight(to_tsvector('simple', coalesce({prefix}title, '')), 'A') || "
+        f"setweight(to_tsvector('simple', coalesce({prefix}excerpt, '')), 'B') || "
+        f"setweight(to_tsvector('simple', coalesce({prefix}content, '')), 'C')"
+    )
+
+
+SEARCH_VECTOR_FUNCTION = "posts_search_vector_update"
+SEARCH_VECTOR_TRIGGER = "posts_search_vector_trigger"
+BACKFILL_BATCH_SIZE = int(os.getenv("SEARCH_VECTOR_BACKFILL_BATCH", "5000"))
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _is_invalid_index(name):
+    """Lần CREATE INDEX CONCURRENTLY trước bị lỗi để lại index INVALID mà IF NOT EXISTS sẽ bỏ qua"""
+    if op.get_context().as_sql:
+        return False
+    return bool(op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).scalar())
+
+
+def _backfill_search_vector():
+    """Điền search_vector cho dòng cũ theo lô id; chạy trong autocommit nên mỗi lô commit riêng, lock ngắn"""
+    update_sql = f"UPDATE posts SET search_vector = {search_vector_sql()} WHERE search_vector IS NULL"
+    if op.get_context().as_sql:
+        op.execute(update_sql)
+        return
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text("SELECT coalesce(max(id), 0) FROM posts")).scalar()
+    for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+        bind.execute(
+            sa.text(f"{update_sql} AND id > :start AND id <= :end"),
+            {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Cột nullable không default chỉ đổi catalog; lock_timeout để không xếp hàng chặn ghi sau transaction dài
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.add_column("posts", sa.Column("search_vector", TSVECTOR(), nullable=True))
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION {SEARCH_VECTOR_FUNCTION}() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {search_vector_sql("NEW.")};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(
+        f"CREATE TRIGGER {SEARCH_VECTOR_TRIGGER} "
+        f"BEFORE INSERT OR UPDATE OF title, excerpt, content ON posts "
+        f"FOR EACH ROW EXECUTE FUNCTION {SEARCH_VECTOR_FUNCTION}()"
+    )
+    with op.get_context().autocommit_block():
+        _backfill_search_vector()
+        if _is_invalid_index("ix_posts_search_vector"):
+            op.drop_index("ix_posts_search_vector", table_name="posts", postgresql_concurrently=True)
+        op.create_index(
+            "ix_posts_search_vector", "posts", ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_posts_search_vector", table_name="posts",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.execute(f"DROP TRIGGER IF EXISTS {SEARCH_VECTOR_TRIGGER} ON posts")
+    op.execute(f"DROP FUNCTION IF EXISTS {SEARCH_VECTOR_FUNCTION}()")
+    op.drop_column("posts", "search_vector")
@@ -0,0 +1,156 @@
+from sqlalchemy import event, exc
+from sqlalchemy.engine import URL, make_url
+from app.utils.logger import log_debug
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+load_dotenv()
+
+# Danh sách node cho kết nối multi-host trực tiếp (bỏ qua HAProxy), vd "postgres-primary:5432,postgres-replica-1:5432"
+DB_CLUSTER_HOSTS = [
+    h.strip() if ":" in h else f"{h.strip()}:5432"
+    for h in os.getenv("DB_CLUSTER_HOSTS", "").split(",") if h.strip()
+]
+# Node lỗi bị đẩy xuống cuối danh sách trong khoảng thời gian này
+DB_NODE_DOWN_SECONDS = float(os.getenv("DB_NODE_DOWN_SECONDS", "5"))
+# connect_timeout của libpq cho từng host, quyết định thời gian bỏ qua một node chết
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "2"))
+
+# target_session_attrs của libpq theo vai trò engine
+TARGET_SESSION_ATTRS = {
+    "primary": "read-write",
+    "replica": "prefer-standby",
+}
+
+# SQLSTATE 25006: read_only_sql_transaction - node vừa bị demote thành standby
+READ_ONLY_SQLSTATE = "25006"
+
+class NodeHealthRegistry:
+    """Trạng thái các node trong process: node nào đang down, node nào đang là primary"""
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        self.down_until = {}
+        self.roles = {}
+        self.primary = None
+        self._lock = threading.Lock()
+
+    def mark_up(self, node, role):
+        with self._lock:
+            self.down_until.pop(node, None)
+            self.roles[node] = role
+            if role == "primary" and self.primary != node:
+                if self.primary is not None:
+                    log_debug(f"🔄 Primary changed: {self.primary} -> {node}", "WARNING")
+                self.primary = node
+            elif role == "standby" and self.primary == node:
+                self.primary = None
+
+    def mark_down(self, node):
+        with self._lock:
+            self.down_until[node] = time.time() + DB_NODE_DOWN_SECONDS
+            if self.primary == node:
+                self.primary = None
+        log_debug(f"❌ DB node {node} marked down for {DB_NODE_DOWN_SECONDS}s", "WARNING")
+
+    def mark_demoted(self, node):
+        """Node không còn nhận ghi (bị demote/fence)"""
+        self.mark_up(node, "standby")
+        log_debug(f"⚠️ DB node {node} is read-only, no longer primary", "WARNING")
+
+    def is_down(self, node):
+        return self.down_until.get(node, 0) > time.time()
+
+    def ordered_nodes(self, role):
+        """Thứ tự thử kết nối: node sống trước, node đúng vai trò trước, node down cuối cùng"""
+        wanted = "primary" if role == "primary" else "standby"
+        def rank(node):
+            return (self.is_down(node), self.roles.get(node) != wanted, self.nodes.index(node))
+        return sorted(self.nodes, key=rank)
+
+    def snapshot(self):
+        return {
+            node: {"role": self.roles.get(node), "down": self.is_down(node)}
+            for node in self.nodes
+        }
+
+node_registry = NodeHealthRegistry(DB_CLUSTER_HOSTS)
+
+def cluster_enabled():
+    return bool(DB_CLUSTER_HOSTS)
+
+def multi_host_url(base_url, role):
+    """URL libpq multi-host cho vai trò (primary: read-write, replica: prefer-standby)"""
+    base = make_url(base_url)
+    return URL.create(
+        base.drivername,
+        username=base.username,
+        password=base.password,
+        database=base.database,
+        query={
+            "host": DB_CLUSTER_HOSTS,
+            "target_session_attrs": TARGET_SESSION_ATTRS[role],
+            "connect_timeout": str(DB_CONNECT_TIMEOUT),
+        },
+    )
+
+def _node_of(dbapi_connection):
+    info = dbapi_connection.info
+    return f"{info.host}:{info.port}"
+
+def attach_node_health(db_engine, role):
+    """Gắn registry vào engine multi-host: sắp xếp host khi kết nối, ghi nhận node,
+    loại kết nối tới primary cũ khi checkout và khi gặp lỗi read-only/disconnect"""
+
+    @event.listens_for(db_engine, "do_connect")
+    def order_hosts(dialect, connection_record, cargs, cparams):
+        nodes = node_registry.ordered_nodes(role)
+        cparams["host"] = ",".join(node.rpartition(":")[0] for node in nodes)
+        cparams["port"] = ",".join(node.rpartition(":")[2] for node in nodes)
+        connection_record.info["tried_nodes"] = nodes
+
+    @event.listens_for(db_engine, "connect")
+    def record_node(dbapi_connection, connection_record):
+        node = _node_of(dbapi_connection)
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SELECT pg_is_in_recovery()")
+        in_recovery = cursor.fetchone()[0]
+        cursor.close()
+        dbapi_connection.rollback()
+        node_registry.mark_up(node, "standby" if in_recovery else "primary")
+        connection_record.info["node"] = node
+        # libpq thử các host theo thứ tự: host đứng trước node thành công mà trước đó
+        # đúng vai trò thì giờ đã chết hoặc đổi vai trò, đẩy nó xuống cuối một thời gian
+        wanted = "primary" if role == "primary" else "standby"
+        for tried in connection_record.info.pop("tried_nodes", []):
+            if tried == node:
+                break
+            if node_registry.roles.get(tried) == wanted:
+                node_registry.mark_down(tried)
+
+    if role == "primary":
+        @event.listens_for(db_engine, "checkout")
+        def reject_demoted_primary(dbapi_connection, connection_record, connection_proxy):
+            node = connection_record.info.get("node")
+            if node is not None and node_registry.roles.get(node) == "standby":
+                # Pool bỏ kết nối này và mở kết nối mới (libpq sẽ tìm primary mới)
+                raise exc.DisconnectionError(f"{node} is no longer primary")
+
+    @event.listens_for(db_engine, "handle_error")
+    def detect_node_failure(context):
+        node = None
+        if context.connection is not None:
+            try:
+                node = context.connection.connection.info.get("node")
+            except Exception:
+                pass
+        pgcode = getattr(context.original_exception, "pgcode", None)
+        if role == "primary" and pgcode == READ_ONLY_SQLSTATE:
+            if node:
+                node_registry.mark_demoted(node)
+            # Đánh dấu disconnect để SQLAlchemy invalidate toàn bộ pool của engine
+            context.is_disconnect = True
+        elif context.is_disconnect and node:
+            node_registry.mark_down(node)
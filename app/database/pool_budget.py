@@ -0,0 +1,143 @@
+from sqlalchemy import text
+from app.utils.logger import log_debug
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Giới hạn kết nối của Postgres (postgres-config/postgresql.conf: max_connections = 100)
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+# Số kết nối chừa lại cho replication, superuser, psql, script bảo trì...
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+# Tỉ trọng chia ngân sách giữa các engine (get_db/haproxy phục vụ phần lớn route)
+DB_POOL_WEIGHTS = os.getenv("DB_POOL_WEIGHTS", "haproxy=3,replica=2,primary=1")
+# strict: vượt ngân sách thì dừng khởi động, degrade: cảnh báo và tính lại pool theo max_connections của server
+DB_POOL_BUDGET_MODE = os.getenv("DB_POOL_BUDGET_MODE", "strict").lower()
+# Tỉ lệ phần burst (max_overflow) trong phần được chia của mỗi engine
+DB_POOL_OVERFLOW_RATIO = float(os.getenv("DB_POOL_OVERFLOW_RATIO", "0.33"))
+# Ghi đè thủ công cho mọi engine (vẫn bị kiểm tra với ngân sách)
+DB_POOL_SIZE = os.getenv("DB_POOL_SIZE")
+DB_MAX_OVERFLOW = os.getenv("DB_MAX_OVERFLOW")
+
+MIN_CONNECTIONS_PER_ENGINE = 2
+
+class PoolBudgetError(RuntimeError):
+    """Pool vượt ngân sách kết nối ở chế độ strict: không được chạy tiếp"""
+
+def parse_weights(spec=DB_POOL_WEIGHTS):
+    """Đọc chuỗi 'haproxy=3,replica=2,primary=1' thành dict"""
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        role, _, weight = item.partition("=")
+        weights[role.strip()] = max(1, int(weight or 1))
+    return weights
+
+def get_worker_count():
+    """Số worker đang chạy (run.py set WEB_CONCURRENCY trước khi spawn worker)"""
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+def usable_connections(max_connections=None):
+    """Số kết nối app được phép dùng trên toàn cluster"""
+    max_connections = max_connections or DB_MAX_CONNECTIONS
+    return max_connections - DB_RESERVED_CONNECTIONS
+
+def max_workers(weights=None, max_connections=None):
+    """Số worker tối đa mà mỗi engine vẫn có đủ MIN_CONNECTIONS_PER_ENGINE"""
+    weights = weights or parse_weights()
+    per_worker_min = len(weights) * MIN_CONNECTIONS_PER_ENGINE
+    return max(1, usable_connections(max_connections) // per_worker_min)
+
+def total_connections(budget, workers=None):
+    """Tổng số kết nối tối đa mà tất cả worker có thể mở"""
+    workers = workers or get_worker_count()
+    return workers * sum(p["pool_size"] + p["max_overflow"] for p in budget.values())
+
+def _budget_exceeded(message):
+    """Xử lý khi vượt ngân sách theo DB_POOL_BUDGET_MODE"""
+    if DB_POOL_BUDGET_MODE == "strict":
+        log_debug(f"❌ {message}", "ERROR")
+        raise PoolBudgetError(message)
+    log_debug(f"⚠️ {message} - degrading pool sizes", "WARNING")
+
+def compute_pool_budget(workers=None, weights=None, max_connections=None):
+    """Tính pool_size/max_overflow cho từng engine sao cho
+    workers × Σ(pool_size + max_overflow) <= max_connections - reserved
+
+    Tất cả engine được tính chung một ngân sách vì HAProxy có thể chuyển
+    traffic sang bất kỳ node nào khi failover.
+    """
+    workers = workers or get_worker_count()
+    weights = weights or parse_weights()
+    usable = usable_connections(max_connections)
+    per_worker = usable // workers
+
+    if per_worker < len(weights) * MIN_CONNECTIONS_PER_ENGINE:
+        _budget_exceeded(
+            f"DB connection budget too small: {workers} workers x {len(weights)} engines "
+            f"need at least {workers * len(weights) * MIN_CONNECTIONS_PER_ENGINE}, only {usable} available"
+        )
+        return {role: {"pool_size": 1, "max_overflow": 0} for role in weights}
+
+    total_weight = sum(weights.values())
+    shares = {
+        role: max(MIN_CONNECTIONS_PER_ENGINE, per_worker * weight // total_weight)
+        for role, weight in weights.items()
+    }
+    # Làm tròn lên MIN có thể vượt phần của worker, trừ bớt từ engine lớn nhất
+    while sum(shares.values()) > per_worker:
+        largest = max(shares, key=shares.get)
+        shares[largest] -= 1
+
+    budget = {}
+    for role, share in shares.items():
+        max_overflow = int(share * DB_POOL_OVERFLOW_RATIO)
+        budget[role] = {"pool_size": share - max_overflow, "max_overflow": max_overflow}
+
+    if DB_POOL_SIZE is not None or DB_MAX_OVERFLOW is not None:
+        override = {
+            role: {
+                "pool_size": int(DB_POOL_SIZE) if DB_POOL_SIZE is not None else sizes["pool_size"],
+                "max_overflow": int(DB_MAX_OVERFLOW) if DB_MAX_OVERFLOW is not None else sizes["max_overflow"],
+            }
+            for role, sizes in budget.items()
+        }
+        planned = total_connections(override, workers)
+        if planned > usable:
+            _budget_exceeded(
+                f"DB_POOL_SIZE/DB_MAX_OVERFLOW allow {planned} connections, budget is {usable}"
+            )
+        else:
+            budget = override
+
+    log_debug(
+        f"📊 DB pool budget: {workers} workers, {total_connections(budget, workers)}/{usable} connections - {budget}",
+        "INFO"
+    )
+    return budget
+
+def verify_server_budget(conn, budget, workers=None):
+    """So sánh ngân sách với max_connections thực tế của server (gọi lúc startup)
+
+    Vượt giới hạn: strict thì raise PoolBudgetError, degrade thì tính lại ngân sách theo
+    max_connections của server và trả về trong "budget" để caller tạo lại các engine
+    (connection.resize_pools); "budget" là None khi ngân sách hiện tại vẫn vừa.
+    """
+    max_connections = int(conn.execute(text("SHOW max_connections")).scalar())
+    superuser_reserved = int(conn.execute(text("SHOW superuser_reserved_connections")).scalar())
+    available = max_connections - superuser_reserved
+    planned = total_connections(budget, workers)
+    degraded = None
+    if planned > available:
+        _budget_exceeded(
+            f"Pools may open {planned} connections but server allows {available} "
+            f"(max_connections={max_connections}); set DB_MAX_CONNECTIONS={max_connections}"
+        )
+        # Phần chừa lại (DB_RESERVED_CONNECTIONS) không được nhỏ hơn phần dành cho superuser của server
+        degraded = compute_pool_budget(
+            workers, max_connections=min(max_connections, available + DB_RESERVED_CONNECTIONS)
+        )
+    else:
+        log_debug(f"✅ DB pool budget fits server limit: {planned}/{available} connections", "INFO")
+    return {"max_connections": max_connections, "available": available, "planned": planned, "budget": degraded}
@@ -0,0 +1,376 @@
+"""
+Đo độ trễ replication (byte và thời gian) của các replica so với primary
+
+    python -m app.database.replication_lag --interval 1 --duration 600
+
+Mỗi lần lấy mẫu ghi một dòng cho mỗi replica vào cluster_reports/replication_lag.csv
+và .jsonl (cùng schema với cluster_report.csv/.jsonl), file được xoay vòng theo kích
+thước. Trong app, sampler chạy nền khi đặt REPLICATION_LAG_INTERVAL > 0; mọi worker đều
+lấy mẫu cho riêng mình nhưng chỉ worker giữ khoá replication_lag.lock ghi report. Giá trị mới
+nhất có trong /health và được get_replica_db dùng để chuyển đọc về primary khi replica
+trễ quá REPLICA_MAX_LAG_SECONDS hoặc không đo được lag.
+"""
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from app.utils.logger import log_debug
+from dotenv import load_dotenv
+from datetime import datetime
+import argparse
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+load_dotenv()
+
+# Chu kỳ lấy mẫu trong app (giây), 0 = tắt
+REPLICATION_LAG_INTERVAL = float(os.getenv("REPLICATION_LAG_INTERVAL", "0"))
+# URL các replica cần đo thêm, phân cách bằng dấu phẩy (mặc định chỉ engine replica)
+REPLICATION_LAG_REPLICAS = [u.strip() for u in os.getenv("REPLICATION_LAG_REPLICAS", "").split(",") if u.strip()]
+REPLICATION_LAG_DIR = os.getenv("REPLICATION_LAG_DIR", "cluster_reports")
+# Xoay vòng file khi vượt kích thước này, giữ lại REPLICATION_LAG_BACKUPS file cũ
+REPLICATION_LAG_MAX_BYTES = int(os.getenv("REPLICATION_LAG_MAX_BYTES", str(5 * 1024 * 1024)))
+REPLICATION_LAG_BACKUPS = int(os.getenv("REPLICATION_LAG_BACKUPS", "3"))
+# Đọc qua get_replica_db chuyển sang primary khi replica trễ hơn ngưỡng này (trống = không chuyển)
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS")) if os.getenv("REPLICA_MAX_LAG_SECONDS") else None
+
+# Cùng cột với cluster_reports/cluster_report.csv
+REPORT_COLUMNS = [
+    "ts", "event", "primary_in_recovery", "primary_lsn", "replica_in_recovery",
+    "replica_receive_lsn", "replica_replay_lsn", "row_id", "payload", "note",
+]
+
+PRIMARY_SQL = text(
+    "SELECT pg_is_in_recovery(), "
+    "CASE WHEN pg_is_in_recovery() THEN NULL ELSE pg_current_wal_lsn()::text END"
+)
+# Trạng thái WAL receiver (NULL khi không có receiver, ví dụ mất kết nối tới primary) và tuổi của
+# transaction replay gần nhất; lag theo giây được quyết định trong sample_replica
+REPLICA_SQL = text(
+    "SELECT pg_is_in_recovery(), pg_last_wal_receive_lsn()::text, pg_last_wal_replay_lsn()::text, "
+    "(SELECT status FROM pg_stat_wal_receiver), "
+    "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+)
+
+def lsn_to_int(lsn):
+    """'16/B374D848' -> vị trí byte trong WAL"""
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+def sample_primary(primary_engine):
+    with primary_engine.connect() as conn:
+        in_recovery, lsn = conn.execute(PRIMARY_SQL).one()
+    return {"in_recovery": in_recovery, "current_wal_lsn": lsn}
+
+def sample_replica(replica_engine, primary):
+    """Lag theo giây: 0 khi replica đã replay tới vị trí WAL hiện tại của primary (primary
+    không có ghi mới), ngược lại là tuổi của transaction replay gần nhất. Không so được
+    với primary thì lag_seconds = None (không đo được)."""
+    with replica_engine.connect() as conn:
+        in_recovery, receive_lsn, replay_lsn, receiver_status, replay_age = conn.execute(REPLICA_SQL).one()
+    lag_bytes = None
+    if primary["current_wal_lsn"] and replay_lsn:
+        lag_bytes = max(0, lsn_to_int(primary["current_wal_lsn"]) - lsn_to_int(replay_lsn))
+    lag_seconds = None
+    if lag_bytes == 0:
+        lag_seconds = 0.0
+    elif lag_bytes is not None and replay_age is not None:
+        lag_seconds = round(float(replay_age), 3)
+    return {
+        "in_recovery": in_recovery,
+        "receiver_status": receiver_status,
+        "receive_lsn": receive_lsn,
+        "replay_lsn": replay_lsn,
+        "lag_bytes": lag_bytes,
+        "lag_seconds": lag_seconds,
+    }
+
+def primary_wal_lsn(conn):
+    """Vị trí WAL đã insert trên primary: mọi transaction commit trước đó nằm trước vị trí này
+    (đúng cả khi synchronous_commit=off, khác pg_current_wal_lsn)"""
+    return conn.execute(text("SELECT pg_current_wal_insert_lsn()::text")).scalar()
+
+class NotInRecoveryError(RuntimeError):
+    """Node được đợi replay không phải standby (đã promote hoặc trỏ nhầm vào primary)"""
+
+def wait_for_replay(replica_engine, lsn, timeout=10, poll_interval=0.005):
+    """Đợi replica replay tới `lsn`; trả về số giây đã đợi, None nếu hết timeout
+
+    Node không ở recovery thì pg_last_wal_replay_lsn() là NULL và sẽ không bao giờ tới
+    `lsn`: raise NotInRecoveryError ngay thay vì đợi hết timeout.
+    """
+    started = time.perf_counter()
+    deadline = started + timeout
+    query = text("SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)")
+    while True:
+        try:
+            with replica_engine.connect() as conn:
+                while True:
+                    in_recovery, replayed = conn.execute(query, {"lsn": lsn}).one()
+                    if not in_recovery:
+                        raise NotInRecoveryError(
+                            f"{replica_engine.url.host} is not in recovery, cannot wait for replay of {lsn}"
+                        )
+                    if replayed:
+                        return time.perf_counter() - started
+                    if time.perf_counter() >= deadline:
+                        return None
+                    time.sleep(poll_interval)
+        except NotInRecoveryError:
+            raise
+        except Exception as e:
+            # Replica đang khởi động lại: thử kết nối lại tới khi hết timeout
+            log_debug(f"⏳ Waiting for replica replay: {str(e)}", "WARNING")
+            if time.perf_counter() >= deadline:
+                return None
+            time.sleep(min(0.5, max(0, deadline - time.perf_counter())))
+
+def try_lock_file(f):
+    """Khoá độc quyền không chặn trên file đang mở; OS tự nhả khi process chết"""
+    try:
+        import fcntl
+    except ImportError:
+        # Windows
+        import msvcrt
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+class RotatingReport:
+    """Cặp file .csv/.jsonl theo schema cluster_report, xoay vòng theo kích thước
+
+    Có `lock_path` thì chỉ process giữ được khoá file đó mới ghi (nhiều worker uvicorn dùng
+    chung một report); process giữ khoá chết thì worker khác lấy lại ở lần ghi sau.
+    """
+
+    def __init__(self, directory, name, max_bytes=REPLICATION_LAG_MAX_BYTES, backups=REPLICATION_LAG_BACKUPS,
+                 lock_path=None):
+        self.paths = {
+            "csv": os.path.join(directory, f"{name}.csv"),
+            "jsonl": os.path.join(directory, f"{name}.jsonl"),
+        }
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock_path = lock_path
+        self._lock_file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def is_writer(self):
+        """True nếu process này được ghi report (không dùng khoá hoặc đang giữ khoá)"""
+        if self.lock_path is None or self._lock_file is not None:
+            return True
+        f = open(self.lock_path, "a")
+        if try_lock_file(f):
+            self._lock_file = f
+            log_debug(f"📝 Replication lag report written by pid {os.getpid()}", "INFO")
+            return True
+        f.close()
+        return False
+
+    def close(self):
+        """Nhả khoá ghi report (nếu đang giữ)"""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _rotate(self, path):
+        if not os.path.exists(path) or os.path.getsize(path) < self.max_bytes:
+            return
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{index}"):
+                os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def write(self, record):
+        """record: dict dạng một dòng cluster_report.jsonl"""
+        if not self.is_writer():
+            return
+        primary = record["nodes"].get("primary", {})
+        replica = record["nodes"].get("replica", {})
+        row = {
+            "ts": record["ts"],
+            "event": record["event"],
+            "primary_in_recovery": primary.get("in_recovery"),
+            "primary_lsn": primary.get("current_wal_lsn"),
+            "replica_in_recovery": replica.get("in_recovery"),
+            "replica_receive_lsn": replica.get("receive_lsn"),
+            "replica_replay_lsn": replica.get("replay_lsn"),
+            "row_id": record.get("row_id"),
+            "payload": record.get("payload"),
+            "note": record.get("note"),
+        }
+        for path in self.paths.values():
+            self._rotate(path)
+        new_csv = not os.path.exists(self.paths["csv"])
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=REPORT_COLUMNS)
+        if new_csv:
+            writer.writeheader()
+        writer.writerow(row)
+        with open(self.paths["csv"], "a", newline="") as f:
+            f.write(buffer.getvalue())
+        with open(self.paths["jsonl"], "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+class ReplicationLagSampler:
+    """Lấy mẫu lag định kỳ trong một thread nền, giữ mẫu mới nhất của từng replica"""
+
+    def __init__(self):
+        self.latest = {}
+        self.interval = None
+        self.redirected_reads = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._report = None
+
+    def sample(self, primary_engine, replica_engines, report=None):
+        """Lấy một mẫu cho mọi replica, ghi report (nếu có), trả về {replica: mẫu}"""
+        ts = datetime.now().isoformat()
+        try:
+            primary = sample_primary(primary_engine)
+        except Exception as e:
+            primary = {"in_recovery": None, "current_wal_lsn": None}
+            log_debug(f"❌ Replication lag: primary unreachable: {str(e)}", "WARNING")
+        results = {}
+        for name, replica_engine in replica_engines.items():
+            record = {"ts": ts, "event": "lag_sample", "nodes": {"primary": primary}, "payload": name}
+            try:
+                replica = sample_replica(replica_engine, primary)
+                record["nodes"]["replica"] = replica
+                record["note"] = (f"lag_bytes={replica['lag_bytes']};lag_seconds={replica['lag_seconds']};"
+                                  f"receiver={replica['receiver_status']}")
+                results[name] = {"ts": ts, **replica}
+            except Exception as e:
+                record["event"] = "lag_sample_error"
+                record["note"] = str(e).splitlines()[0]
+                results[name] = {"ts": ts, "error": record["note"]}
+            if report:
+                report.write(record)
+        with self._lock:
+            self.latest.update(results)
+        return results
+
+    def start(self, primary_engine, replica_engines, interval, report=None):
+        """Chạy sample() mỗi `interval` giây trong thread daemon"""
+        self.interval = interval
+        self._report = report
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                started = time.monotonic()
+                self.sample(primary_engine, replica_engines, report)
+                self._stop.wait(max(0, interval - (time.monotonic() - started)))
+
+        self._thread = threading.Thread(target=run, name="replication-lag-sampler", daemon=True)
+        self._thread.start()
+        log_debug(f"📈 Replication lag sampler started ({interval}s, {len(replica_engines)} replicas)", "INFO")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._report:
+            self._report.close()
+            self._report = None
+
+    def lag_seconds(self, name="replica"):
+        """Lag (giây) của replica `name` (mặc định engine replica mà get_replica_db đọc) theo
+        mẫu mới nhất; None nếu không đo được: chưa có mẫu, mẫu quá 3 chu kỳ, lấy mẫu lỗi,
+        WAL receiver không streaming hoặc không so được với primary"""
+        with self._lock:
+            sample = self.latest.get(name)
+        if sample is None or self.interval is None:
+            return None
+        age = (datetime.now() - datetime.fromisoformat(sample["ts"])).total_seconds()
+        if age > 3 * self.interval or sample.get("receiver_status") != "streaming":
+            return None
+        return sample.get("lag_seconds")
+
+    def replica_too_stale(self, max_lag_seconds=REPLICA_MAX_LAG_SECONDS):
+        """True khi nên đọc từ primary thay vì replica; replica không đo được lag
+        (mất kết nối, receiver ngắt...) cũng bị coi là quá trễ"""
+        if max_lag_seconds is None or self.interval is None:
+            return False
+        lag = self.lag_seconds()
+        if lag is not None and lag <= max_lag_seconds:
+            return False
+        with self._lock:
+            self.redirected_reads += 1
+        return True
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+                "redirected_reads": self.redirected_reads,
+                "replicas": {name: dict(sample) for name, sample in self.latest.items()},
+            }
+
+lag_sampler = ReplicationLagSampler()
+
+def replica_name(url):
+    url = make_url(url)
+    return f"{url.host}:{url.port or 5432}"
+
+def replica_engines(extra_urls=REPLICATION_LAG_REPLICAS):
+    """Engine replica của app cộng các replica khai báo trong REPLICATION_LAG_REPLICAS"""
+    from app.database.connection import get_engine
+    engines = {"replica": get_engine("replica")}
+    for url in extra_urls:
+        engines[replica_name(url)] = create_engine(url, pool_size=1, max_overflow=0, pool_pre_ping=True)
+    return engines
+
+def start_app_sampler():
+    """Gọi lúc startup: bật sampler nền nếu REPLICATION_LAG_INTERVAL > 0"""
+    if REPLICATION_LAG_INTERVAL <= 0:
+        return False
+    from app.database.connection import get_engine
+    # Mỗi worker giữ mẫu trong bộ nhớ của mình (cho /health, get_replica_db) nhưng chỉ một worker ghi file
+    report = RotatingReport(REPLICATION_LAG_DIR, "replication_lag",
+                            lock_path=os.path.join(REPLICATION_LAG_DIR, "replication_lag.lock"))
+    lag_sampler.start(get_engine("primary"), replica_engines(), REPLICATION_LAG_INTERVAL, report)
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sample replication lag into cluster_reports")
+    parser.add_argument("--interval", type=float, default=1, help="Seconds between samples")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds (default: run until Ctrl+C)")
+    parser.add_argument("--output-dir", default=REPLICATION_LAG_DIR)
+    parser.add_argument("--name", default="replication_lag", help="Base file name for .csv/.jsonl")
+    args = parser.parse_args()
+
+    from app.database.connection import get_engine
+    report = RotatingReport(args.output_dir, args.name)
+    engines = replica_engines()
+    primary_engine = get_engine("primary")
+    deadline = time.monotonic() + args.duration if args.duration else None
+    print(f"📈 Sampling replication lag every {args.interval}s -> {report.paths['csv']}")
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            started = time.monotonic()
+            for name, sample in lag_sampler.sample(primary_engine, engines, report).items():
+                if "error" in sample:
+                    print(f"❌ {name}: {sample['error']}")
+                else:
+                    print(f"{sample['ts']} {name}: {sample['lag_bytes']} bytes, {sample['lag_seconds']}s")
+            time.sleep(max(0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    print(f"✅ Samples written to {report.paths['csv']} and {report.paths['jsonl']}")
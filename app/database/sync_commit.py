@@ -0,0 +1,86 @@
+from sqlalchemy import event, text
+from app.database.disconnect_handling import ReadRetrySession
+from app.utils.logger import log_debug
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+load_dotenv()
+
+# Mức synchronous_commit chọn được cho từng loại thao tác ghi, từ bền nhất tới nhanh nhất
+SYNCHRONOUS_COMMIT_LEVELS = ("remote_apply", "on", "remote_write", "local", "off")
+# Các mức phải đợi standby (khi server có synchronous_standby_names)
+REMOTE_COMMIT_LEVELS = ("remote_apply", "on", "remote_write")
+
+# application_name của standby đồng bộ, trùng synchronous_standby_names trong postgresql.conf
+# (replica phục vụ đọc qua REPLICA_DATABASE_URL)
+DB_SYNC_STANDBY_NAME = os.getenv("DB_SYNC_STANDBY_NAME", "postgres_replica_1")
+# Thời gian tối đa cho flush + commit khi đợi standby; quá hạn thì hủy phần đợi, transaction
+# vẫn đã commit trên primary (tương đương synchronous_commit = local)
+DB_SYNC_COMMIT_TIMEOUT = float(os.getenv("DB_SYNC_COMMIT_TIMEOUT", "5"))
+# Kết quả kiểm tra pg_stat_replication được dùng lại trong khoảng này
+DB_SYNC_STANDBY_CHECK_SECONDS = float(os.getenv("DB_SYNC_STANDBY_CHECK_SECONDS", "5"))
+
+SYNC_STANDBY_SQL = text(
+    "SELECT EXISTS (SELECT 1 FROM pg_stat_replication "
+    "WHERE application_name = :name AND state = 'streaming')"
+)
+
+class SyncStandbyStatus:
+    """Cache trong process: standby đồng bộ có đang streaming không"""
+
+    def __init__(self):
+        self.available = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_available(self, connection):
+        with self._lock:
+            if time.monotonic() - self.checked_at < DB_SYNC_STANDBY_CHECK_SECONDS:
+                return self.available
+        available = bool(connection.execute(SYNC_STANDBY_SQL, {"name": DB_SYNC_STANDBY_NAME}).scalar())
+        with self._lock:
+            if self.available and not available:
+                log_debug(f"⚠️ Sync standby {DB_SYNC_STANDBY_NAME} not streaming, remote commits degrade to local", "WARNING")
+            self.available = available
+            self.checked_at = time.monotonic()
+        return available
+
+sync_standby = SyncStandbyStatus()
+
+@event.listens_for(ReadRetrySession, "after_begin")
+def apply_synchronous_commit(session, transaction, connection):
+    """SET LOCAL ở đầu mỗi transaction của session có chọn mức synchronous_commit;
+    mức đợi standby giảm xuống local khi standby đồng bộ không streaming"""
+    level = session.info.get("synchronous_commit")
+    if not level:
+        return
+    if level in REMOTE_COMMIT_LEVELS and not sync_standby.is_available(connection):
+        level = "local"
+    session.info["effective_synchronous_commit"] = level
+    connection.exec_driver_sql(f"SET LOCAL synchronous_commit = {level}")
+
+@event.listens_for(ReadRetrySession, "before_commit")
+def start_commit_timer(session):
+    """Hủy phần đợi standby (cancel request của libpq) nếu commit kéo dài quá DB_SYNC_COMMIT_TIMEOUT"""
+    if session.info.get("effective_synchronous_commit") not in REMOTE_COMMIT_LEVELS or not session.in_transaction():
+        return
+    dbapi_connection = session.connection().connection.dbapi_connection
+    timer = threading.Timer(DB_SYNC_COMMIT_TIMEOUT, dbapi_connection.cancel)
+    timer.daemon = True
+    session.info["commit_timer"] = (timer, dbapi_connection)
+    timer.start()
+
+@event.listens_for(ReadRetrySession, "after_transaction_end")
+def stop_commit_timer(session, transaction):
+    if transaction.parent is not None:
+        return
+    timer, dbapi_connection = session.info.pop("commit_timer", (None, None))
+    if timer is None:
+        return
+    timer.cancel()
+    # Postgres báo WARNING khi phần đợi bị hủy: đã commit local nhưng có thể chưa tới standby
+    if any("synchronous replication" in notice for notice in getattr(dbapi_connection, "notices", [])):
+        log_debug(f"⚠️ Sync commit wait exceeded {DB_SYNC_COMMIT_TIMEOUT}s, committed locally only", "WARNING")
+        del dbapi_connection.notices[:]
@@ -0,0 +1,62 @@
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.main import app
+from app.database.connection import replica_engine
+from app.utils.jwt_utils import create_access_token
+from app.utils.query_budget import QueryRecorder, budget_violations
+import time
+
+READY_TIMEOUT = 30
+
+def sample_path_params(conn):
+    """Giá trị thật cho các path param của route (lấy từ DB)"""
+    return {"post_id": conn.execute(text("SELECT min(id) FROM posts")).scalar() or 1}
+
+def wait_until_ready(client):
+    """Đợi warm-up lúc startup chạy xong để câu SQL của nó không bị tính vào route đầu tiên"""
+    deadline = time.time() + READY_TIMEOUT
+    while client.get("/ready").status_code != 200:
+        assert time.time() < deadline, "App did not become ready"
+        time.sleep(0.5)
+
+def budgeted_routes():
+    """Các route GET có khai báo @query_budget"""
+    for route in app.routes:
+        if isinstance(route, APIRoute) and "GET" in route.methods and hasattr(route.endpoint, "query_budget"):
+            yield route, route.endpoint.query_budget
+
+def test_query_budgets():
+    """Gọi từng route có ngân sách qua TestClient, kiểm tra số câu SQL và số dòng đọc"""
+    print("🔍 Checking query budgets per route...")
+    with replica_engine.connect() as conn:
+        path_params = sample_path_params(conn)
+        username = conn.execute(text("SELECT username FROM users WHERE is_active ORDER BY is_admin DESC, id LIMIT 1")).scalar()
+    assert username, "Need at least one active user to call authenticated routes"
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+
+    failed = 0
+    checked = 0
+    with TestClient(app, raise_server_exceptions=False) as client:
+        wait_until_ready(client)
+        for route, budget in budgeted_routes():
+            url = route.path.format(**path_params)
+            with QueryRecorder() as recorder:
+                response = client.get(url, params=budget["query"], headers=headers, follow_redirects=False)
+            checked += 1
+            summary = f"{recorder.statements} statements, {recorder.rows} rows, {recorder.total_ms:.1f}ms"
+            violations = budget_violations(recorder, budget)
+            if response.status_code >= 400:
+                violations.append(f"HTTP {response.status_code}")
+            if violations:
+                failed += 1
+                print(f"❌ {route.name} {url}: {summary} - {'; '.join(violations)}")
+                for query in recorder.queries:
+                    print(f"     {query['rows']:>5} rows  {query['statement'].splitlines()[0][:100]}")
+            else:
+                print(f"✅ {route.name} {url}: {summary}")
+    print(f"📊 {checked - failed}/{checked} routes within their query budget")
+    assert failed == 0, f"{failed} routes exceed their query budget"
+
+if __name__ == "__main__":
+    test_query_budgets()
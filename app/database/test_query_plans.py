@@ -0,0 +1,79 @@
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from app.database.connection import replica_engine
+from app.api.posts import build_post_listing, parse_post_fields
+from datetime import datetime, timedelta
+
+# (mô tả, bộ lọc, kiểu sắp xếp, fields, index phải dùng) - giống các tham số của GET /api/posts/;
+# fields=None là bộ field mặc định (JOIN kols, categories, users)
+LISTING_SCENARIOS = [
+    ("newest posts", {}, "newest", None, "ix_posts_created_at"),
+    ("KOL page, newest first", {"kol_id": 1}, "newest", None, "ix_posts_kol_id_created_at"),
+    ("KOL page, date range", {"kol_id": 1, "created_from": datetime.utcnow() - timedelta(days=30)}, "newest",
+     "id,title,created_at", "ix_posts_kol_id_created_at"),
+    ("category filter", {"category_id": 1}, "newest", None, "ix_posts_category_id"),
+    ("author filter", {"author_id": 1}, "oldest", "id,title,author_username", "ix_posts_author_id"),
+    ("date range only", {"created_from": datetime.utcnow() - timedelta(days=7), "created_to": datetime.utcnow()}, "newest",
+     None, "ix_posts_created_at"),
+]
+
+# Cột đầu của index: lọc theo cột này thì nó phải nằm trong Index Cond, không chỉ là Filter
+INDEX_LEADING_COLUMNS = {
+    "ix_posts_created_at": "created_at",
+    "ix_posts_kol_id_created_at": "kol_id",
+    "ix_posts_category_id": "category_id",
+    "ix_posts_author_id": "author_id",
+}
+
+def plan_nodes(plan):
+    """Duyệt toàn bộ node trong plan JSON của EXPLAIN"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+def explain_listing(conn, filters, sort, fields=None, limit=10):
+    """EXPLAIN đúng truy vấn endpoint chạy (build_post_listing), trả về danh sách node"""
+    with Session(bind=conn) as session:
+        query = build_post_listing(session, parse_post_fields(fields), filters, sort, limit=limit)
+        sql = query.statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    return list(plan_nodes(plan[0]["Plan"]))
+
+def uses_index(nodes, index_name, filters):
+    """Plan có quét index_name không, và khi lọc theo cột đầu của index thì cột đó phải
+    là điều kiện của index (Index Cond/Recheck Cond) chứ không phải Filter sau khi quét"""
+    column = INDEX_LEADING_COLUMNS[index_name]
+    filtered = {"created_at" if name.startswith("created_") else name for name in filters}
+    for node in nodes:
+        if node.get("Index Name") != index_name:
+            continue
+        if column not in filtered:
+            return True
+        condition = node.get("Index Cond", "") + node.get("Recheck Cond", "")
+        if column in condition:
+            return True
+    return False
+
+def test_query_plans():
+    """Kiểm tra mỗi bộ lọc của listing dùng đúng index dự kiến với cột lọc là điều kiện của index"""
+    print("🔍 Checking query plans for GET /api/posts/ filters...")
+    failed = 0
+    with replica_engine.connect() as conn:
+        # Bảng nhỏ thì planner luôn chọn Seq Scan, tắt đi để kiểm tra index có dùng được hay không;
+        # vì vậy không chỉ kiểm tra "không Seq Scan" mà kiểm tra đúng index và Index Cond
+        conn.execute(text("SET enable_seqscan = off"))
+        for description, filters, sort, fields, expected_index in LISTING_SCENARIOS:
+            nodes = explain_listing(conn, filters, sort, fields)
+            indexes = sorted({n["Index Name"] for n in nodes if "Index Name" in n})
+            if uses_index(nodes, expected_index, filters):
+                print(f"✅ {description}: {', '.join(indexes)}")
+            else:
+                failed += 1
+                print(f"❌ {description}: expected {expected_index} on "
+                      f"{INDEX_LEADING_COLUMNS[expected_index]}, plan uses {', '.join(indexes) or 'no index'}")
+    print(f"📊 {len(LISTING_SCENARIOS) - failed}/{len(LISTING_SCENARIOS)} listing queries use their index")
+    assert failed == 0, f"{failed} listing queries do not use the expected index"
+
+if __name__ == "__main__":
+    test_query_plans()
@@ -1,8 +1,7 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.controllers.user_controller import router as user_router
 from app.controllers.post_controller import router as post_router
@@ -13,16 +12,24 @@ from app.api.users import router as users_api_router
 from app.api.kols import router as kols_api_router
 from app.api.categories import router as categories_api_router
 from app.utils.jwt_utils import verify_token
-from app.database.connection import get_db, engine, Base
+from app.database.connection import get_db, get_engine, dispose_engines, resize_pools, POOL_BUDGET
+from app.database.pool_budget import verify_server_budget, PoolBudgetError
+from app.database.node_health import cluster_enabled, node_registry
+from app.database.disconnect_handling import disconnect_stats
+from app.database.replication_lag import lag_sampler, start_app_sampler
 from app.middleware.models.user_model import UserModel
 from app.middleware.models.post_model import PostModel
 from app.middleware.logging_middleware import logging_middleware
 from app.middleware.auth_middleware import auth_middleware
 from app.utils.logger import log_debug
+from app.utils.templates import templates, precompile_templates
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 from sqlalchemy import text
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import SQLAlchemyError
+import asyncio
+import signal
+import sys
 import time
 import os
 
@@ -70,11 +77,13 @@ app = FastAPI(
     - **Post Detail**: GET /post/{member}-post-detail/{post_id}
     
     ###  Posts API (JSON) - Requires Authentication
-    - **Get All Posts**: GET /api/posts/
+    - **Get All Posts**: GET /api/posts/ (filters: kol_id, category_id, author_id, created_from, created_to, sort; fields=title,excerpt,...)
+    - **Search Posts**: GET /api/posts/search?q=...
     - **Get Post by ID**: GET /api/posts/{post_id}
     - **Create Post**: POST /api/posts/
     - **Update Post**: PUT /api/posts/{post_id}
     - **Delete Post**: DELETE /api/posts/{post_id}
+    - **Bulk Create / Update / Delete Posts**: POST / PUT / DELETE /api/posts/bulk
     
     ### 👥 KOLs API (JSON) - Requires Authentication
     - **Get All KOLs**: GET /api/kols/
@@ -90,6 +99,7 @@ app = FastAPI(
     
     ### 🔧 System
     - **Health Check**: GET /health
+    - **Readiness Check**: GET /ready
     - **API Discovery**: GET /api/discovery
     - **Current User**: GET /me
     - **API Docs**: GET /docs
@@ -163,9 +173,6 @@ app = FastAPI(
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# Configure templates
-templates = Jinja2Templates(directory="app/templates")
-
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -271,6 +278,11 @@ async def health_check():
         "message": "BLACKPINK Fan Site API is running",
         "version": "2.0.0",
         "database": "connected",
+        # Trạng thái node khi kết nối thẳng tới cluster (DB_CLUSTER_HOSTS)
+        "nodes": node_registry.snapshot() if cluster_enabled() else None,
+        "db_disconnects": disconnect_stats.snapshot(),
+        # Lag replica mới nhất (REPLICATION_LAG_INTERVAL > 0)
+        "replication": lag_sampler.snapshot() if lag_sampler.interval else None,
         "endpoints": {
             "html_routes": ["/user/*", "/post/*"],
             "api_routes": ["/api/*"],
@@ -278,6 +290,15 @@ async def health_check():
         }
     }
 
+@app.get("/ready", name="readiness_check")
+async def readiness_check():
+    """Kiểm tra ứng dụng đã warm-up xong chưa (dùng cho load balancer/autoscaler)"""
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content={
+        "status": "ready" if readiness["ready"] else "starting",
+        **readiness
+    })
+
 # ==================== ERROR HANDLERS ====================
 
 @app.exception_handler(401)
@@ -321,28 +342,100 @@ async def not_found_handler(request: Request, exc: HTTPException):
 
 # ==================== STARTUP EVENTS ====================
 
+# Trạng thái warm-up, /ready trả 503 cho tới khi DB và template sẵn sàng
+# Quá DB_STARTUP_TIMEOUT giây mà chưa kết nối được thì /ready báo lỗi, warm-up vẫn thử tiếp
+DB_STARTUP_TIMEOUT = float(os.getenv("DB_STARTUP_TIMEOUT", "30"))
+DB_STARTUP_MAX_DELAY = float(os.getenv("DB_STARTUP_MAX_DELAY", "5"))
+readiness = {
+    "ready": False,
+    "database": False,
+    "templates": False,
+    "error": None,
+    "warmup_seconds": None,
+}
+warmup_task = None
+
+def check_database():
+    """Kết nối thử tới DB qua HAProxy và kiểm tra ngân sách pool (chạy trong thread)"""
+    with get_engine("haproxy").connect() as conn:
+        conn.execute(text("SELECT 1"))
+        # Báo lỗi (strict) hoặc tính lại pool (degrade) nếu vượt max_connections thực tế của server
+        server_budget = verify_server_budget(conn, POOL_BUDGET)
+    if server_budget["budget"]:
+        resize_pools(server_budget["budget"])
+        log_debug(f"📉 DB pools resized to server limit: {server_budget['budget']}", "WARNING")
+
+async def wait_for_database(timeout=DB_STARTUP_TIMEOUT):
+    """Đợi DB/HAProxy sẵn sàng với backoff, không chặn event loop
+
+    Không bỏ cuộc: DB lên muộn (restart cluster, failover) thì worker vẫn ready được
+    mà không cần restart. Sau `timeout` giây lỗi được ghi vào readiness để /ready báo rõ.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = 0.5
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            await asyncio.to_thread(check_database)
+            readiness["error"] = None
+            return
+        except PoolBudgetError:
+            raise
+        except SQLAlchemyError as e:
+            log_debug(f"⏳ Waiting for database (attempt {attempt}): {str(e)}", "WARNING")
+        if readiness["error"] is None and loop.time() >= deadline:
+            readiness["error"] = f"Database not reachable after {timeout}s, still retrying"
+            log_debug(f"❌ {readiness['error']}", "ERROR")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, DB_STARTUP_MAX_DELAY)
+
+def stop_server():
+    """Dừng server khi cấu hình sai. Chỉ gửi SIGTERM cho process cha khi nó chắc chắn là
+    supervisor của run.py (BLINK_SUPERVISED=1), nếu không supervisor spawn lại worker và lỗi lặp mãi.
+    Các trường hợp khác (gunicorn, systemd, docker...) chỉ thoát worker này với exit code 1."""
+    if os.getenv("BLINK_SUPERVISED") == "1":
+        os.kill(os.getppid(), signal.SIGTERM)
+        os.kill(os.getpid(), signal.SIGTERM)
+        return
+    sys.exit(1)
+
+async def warm_up():
+    """Warm-up chạy nền: compile template, đợi DB, rồi đánh dấu ready"""
+    started = time.perf_counter()
+    try:
+        # Compile sẵn template để request đầu tiên không phải parse
+        await asyncio.to_thread(precompile_templates)
+        readiness["templates"] = True
+
+        await wait_for_database()
+        readiness["database"] = True
+        log_debug("📊 Database connected", "INFO")
+    except PoolBudgetError as e:
+        # DB_POOL_BUDGET_MODE=strict: cấu hình pool sai thì không chạy tiếp
+        readiness["error"] = str(e)
+        log_debug(f"❌ Stopping server, DB pool budget exceeded: {str(e)}", "ERROR")
+        stop_server()
+        return
+    except Exception as e:
+        readiness["error"] = str(e)
+        log_debug(f"❌ Warm-up failed: {str(e)}", "ERROR")
+        return
+
+    readiness["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    readiness["ready"] = True
+    log_debug(f"✅ Application warm in {readiness['warmup_seconds']}s", "INFO")
+
 @app.on_event("startup")
 async def startup_event():
     """Chạy khi ứng dụng khởi động"""
+    global warmup_task
     log_debug("🚀 Application starting up...", "INFO")
-    # Đợi DB/HAProxy sẵn sàng với retry
-    max_attempts = 30
-    for attempt in range(1, max_attempts + 1):
-        try:
-            with engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
-            # Khi kết nối OK thì tiến hành tạo bảng
-            Base.metadata.create_all(bind=engine)
-            log_debug("📊 Database connected & tables ensured", "INFO")
-            break
-        except OperationalError as e:
-            log_debug(f"⏳ Waiting for database (attempt {attempt}/{max_attempts}): {str(e)}", "WARNING")
-        except Exception as e:
-            log_debug(f"⚠️ Unexpected DB init error (attempt {attempt}/{max_attempts}): {str(e)}", "ERROR")
-        time.sleep(2)
-    else:
-        # Hết retry nhưng vẫn không kết nối được
-        log_debug("❌ Could not connect to database after retries", "ERROR")
+    # Không tạo bảng ở đây nữa: schema do bước migration (app/database/init_db.py) đảm nhận.
+    # Warm-up chạy nền để worker nhận request ngay, /ready báo khi nào đã sẵn sàng.
+    warmup_task = asyncio.create_task(warm_up())
+    start_app_sampler()
     log_debug("🔧 Middleware configured", "INFO")
     log_debug("📚 API documentation available at /docs", "INFO")
 
@@ -350,6 +443,12 @@ async def startup_event():
 async def shutdown_event():
     """Chạy khi ứng dụng tắt"""
     log_debug("🛑 Application shutting down...", "INFO")
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    lag_sampler.stop()
+    # Trả lại các connection trong pool cho Postgres khi worker dừng
+    dispose_engines()
+    log_debug("🔌 Database connection pools disposed", "INFO")
 
 # ==================== DEBUG INFO ====================
 
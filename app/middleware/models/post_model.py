@@ -1,8 +1,19 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from app.database.connection import Base
 
+# Cấu hình full-text search: 'simple' vì nội dung trộn tiếng Việt và tiếng Anh
+SEARCH_CONFIG = "simple"
+
+# Biểu thức trigger dùng để tính search_vector (migration 0003), title > excerpt > content
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(excerpt, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(content, '')), 'C')"
+)
+
 class PostModel(Base):
     __tablename__ = "posts"
     
@@ -11,20 +22,31 @@ class PostModel(Base):
     content = Column(Text, nullable=False)
     excerpt = Column(String(500), nullable=True)
     images = Column(String(255), nullable=True)
-    author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    author_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     
     # Khóa ngoại đến KOL và Category
     kol_id = Column(Integer, ForeignKey("kols.id"), nullable=False)
-    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False, index=True)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Trigger posts_search_vector_trigger tự tính (migration 0003), app không ghi trực tiếp;
+    # deferred để không bị SELECT kèm trong các truy vấn thường
+    search_vector = deferred(Column(TSVECTOR, nullable=True, info={"trigger_maintained": True}))
+    
     # Relationships - chỉ dùng string để tránh circular import
     kol = relationship("KOLModel", back_populates="posts")
     category = relationship("CategoryModel", back_populates="posts")
     author = relationship("UserModel")
     
+    # Index tạo bằng migration 0002/0003 (CREATE INDEX CONCURRENTLY), khai báo ở đây để metadata khớp
+    __table_args__ = (
+        # Trang member / listing: WHERE kol_id = ? ORDER BY created_at DESC
+        Index("ix_posts_kol_id_created_at", kol_id, created_at.desc()),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+    )
+    
     def __repr__(self):
         return f"<PostModel(id={self.id}, title='{self.title}', kol_id={self.kol_id}, category_id={self.category_id})>"
     
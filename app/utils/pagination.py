@@ -0,0 +1,18 @@
+import base64
+import json
+
+def encode_cursor(values):
+    """Mã hóa giá trị keyset (vd. [rank, id]) thành cursor an toàn cho URL"""
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor, size):
+    """Giải mã cursor, trả về list `size` phần tử hoặc raise ValueError nếu không hợp lệ"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
@@ -0,0 +1,67 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import threading
+import time
+
+def query_budget(statements, rows=None, query=None):
+    """Khai báo ngân sách truy vấn ngay trên route (đặt dưới @router.get)
+
+    statements: số câu SQL tối đa cho một request
+    rows: tổng số dòng SELECT trả về tối đa (None = không giới hạn)
+    query: query string dùng khi kiểm tra (app/database/test_query_budgets.py)
+    """
+    def decorator(func):
+        func.query_budget = {"statements": statements, "rows": rows, "query": query or {}}
+        return func
+    return decorator
+
+class QueryRecorder:
+    """Ghi lại mọi câu SQL (trên mọi engine) chạy trong khối with
+
+    Dùng event before/after_cursor_execute của SQLAlchemy nên đếm đúng cả các câu
+    lazy-load phát sinh khi serialize response hoặc render template.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start_time"].pop()
+        # rowcount của SELECT là số dòng trả về (psycopg2), -1 nếu driver không biết
+        fetched = cursor.rowcount if cursor.description is not None and cursor.rowcount > 0 else 0
+        with self._lock:
+            self.queries.append({"statement": statement, "duration": duration, "rows": fetched})
+
+    @property
+    def statements(self):
+        return len(self.queries)
+
+    @property
+    def rows(self):
+        return sum(q["rows"] for q in self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(q["duration"] for q in self.queries) * 1000
+
+def budget_violations(recorder, budget):
+    """Danh sách vi phạm ngân sách (rỗng nếu đạt)"""
+    violations = []
+    if recorder.statements > budget["statements"]:
+        violations.append(f"{recorder.statements} statements > budget {budget['statements']}")
+    if budget["rows"] is not None and recorder.rows > budget["rows"]:
+        violations.append(f"{recorder.rows} rows > budget {budget['rows']}")
+    return violations
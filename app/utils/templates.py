@@ -0,0 +1,57 @@
+from fastapi.templating import Jinja2Templates
+from fastapi.responses import StreamingResponse
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from app.utils.logger import log_debug
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+TEMPLATES_DIR = "app/templates"
+
+# Thư mục lưu bytecode đã compile (None = thư mục tạm mặc định của Jinja)
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")
+
+# Chỉ bật auto-reload khi dev, production không cần stat() file mỗi lần render
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", os.getenv("DEBUG", "False")).lower() == "true"
+
+# Số đoạn output Jinja gom lại trước khi gửi một chunk khi stream
+TEMPLATE_STREAM_BUFFER = int(os.getenv("TEMPLATE_STREAM_BUFFER", "20"))
+
+def create_template_environment():
+    """Tạo Jinja2 Environment dùng chung với bytecode cache trên filesystem"""
+    if TEMPLATE_CACHE_DIR:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        auto_reload=TEMPLATE_AUTO_RELOAD,
+        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+    )
+
+# Một Environment duy nhất cho toàn bộ app (main + các controller)
+template_env = create_template_environment()
+templates = Jinja2Templates(env=template_env)
+
+def precompile_templates():
+    """Compile trước tất cả template để lần render đầu tiên sau deploy không phải parse"""
+    compiled = 0
+    for name in template_env.list_templates(extensions=["html"]):
+        try:
+            template_env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            log_debug(f"⚠️ Could not precompile template {name}: {str(e)}", "WARNING")
+    log_debug(f"🧩 Precompiled {compiled} templates (auto_reload={TEMPLATE_AUTO_RELOAD})", "INFO")
+    return compiled
+
+def stream_template(name, context, status_code=200):
+    """Render template theo từng chunk (Template.generate) và trả về StreamingResponse
+
+    Context phải chứa sẵn mọi dữ liệu cần render: session DB đã đóng khi body
+    được stream nên không được lazy-load relationship trong template.
+    """
+    template = template_env.get_template(name)
+    stream = template.stream(context)
+    stream.enable_buffering(TEMPLATE_STREAM_BUFFER)
+    return StreamingResponse(stream, status_code=status_code, media_type="text/html")
@@ -22,15 +22,56 @@ class PostResponseView(BaseModel):
     class Config:
         from_attributes = True
 
+class PostListItemView(BaseModel):
+    """Một bài viết trong listing: mặc định không có content, chỉ các field được chọn qua fields="""
+    id: int
+    title: Optional[str] = None
+    excerpt: Optional[str] = None
+    content: Optional[str] = None
+    author_id: Optional[int] = None
+    kol_id: Optional[int] = None
+    category_id: Optional[int] = None
+    images: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    
+    # Related data
+    kol_name: Optional[str] = None
+    category_name: Optional[str] = None
+    author_username: Optional[str] = None
+
 class PostsResponseView(BaseModel):
     message: str
     total_posts: int
-    posts: List[PostResponseView]
+    posts: List[PostListItemView]
 
 class PostDetailResponseView(BaseModel):
     message: str
     post: PostResponseView
 
+class PostSearchResultView(BaseModel):
+    id: int
+    title: str
+    excerpt: Optional[str] = None
+    author_id: int
+    kol_id: int
+    category_id: int
+    images: Optional[str] = None
+    created_at: Optional[datetime] = None
+    kol_name: Optional[str] = None
+    category_name: Optional[str] = None
+    
+    # Điểm xếp hạng ts_rank_cd và đoạn trích có đánh dấu <mark>
+    rank: float
+    snippet: Optional[str] = None
+
+class PostSearchResponseView(BaseModel):
+    message: str
+    query: str
+    count: int
+    next_cursor: Optional[str] = None
+    results: List[PostSearchResultView]
+
 class CreatePostView(BaseModel):
     title: str
     excerpt: Optional[str] = None
@@ -47,6 +88,32 @@ class UpdatePostView(BaseModel):
     category_id: Optional[int] = None
     images: Optional[str] = None
 
+# Bulk operations
+class BulkCreatePostsView(BaseModel):
+    posts: List[CreatePostView]
+
+class BulkUpdatePostItemView(UpdatePostView):
+    id: int
+
+class BulkUpdatePostsView(BaseModel):
+    posts: List[BulkUpdatePostItemView]
+
+class BulkDeletePostsView(BaseModel):
+    ids: List[int]
+
+class BulkItemResultView(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status: str  # created / updated / deleted / error
+    error: Optional[str] = None
+
+class BulkResponseView(BaseModel):
+    message: str
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BulkItemResultView]
+
 # Additional views for KOLs and Categories
 class KOLResponseView(BaseModel):
     id: int
@@ -2,12 +2,25 @@
 """
 Auto-failover script for PostgreSQL cluster
 Monitors primary database and promotes replica when primary is down
+
+    python auto-failover.py                                   # chạy monitor
+    python auto-failover.py switchover --to postgres-primary  # chuyển primary có kiểm soát
+
+Switchover chạy khi monitor đã dừng; chạy lại monitor sau đó, nó tự tìm primary hiện tại.
 """
 
+import argparse
+import asyncio
+import asyncpg
 import psycopg2
 import time
 import subprocess
 import logging
+import json
+import os
+import random
+import socket
+from collections import deque
 from datetime import datetime
 
 # Configuration
@@ -27,6 +40,44 @@ REPLICA_CONFIG = {
     'password': '12345'
 }
 
+# Tên node = tên container = tên server trong HAProxy
+NODES = {
+    'postgres-primary': PRIMARY_CONFIG,
+    'postgres-replica-1': REPLICA_CONFIG,
+}
+INITIAL_PRIMARY = 'postgres-primary'
+
+# Promotion settings
+CONNECT_TIMEOUT = int(os.getenv("FAILOVER_CONNECT_TIMEOUT", "2"))
+PROMOTE_TIMEOUT = int(os.getenv("FAILOVER_PROMOTE_TIMEOUT", "30"))  # giây chờ pg_is_in_recovery() = false
+
+# HAProxy: đổi routing qua runtime API (không reload), file config chỉ là fallback
+HAPROXY_CONTAINER = os.getenv("HAPROXY_CONTAINER", "haproxy")
+HAPROXY_BACKEND = os.getenv("HAPROXY_BACKEND", "postgres")
+# Runtime API chỉ publish trên loopback của host (docker-compose.ha-simple.yml)
+HAPROXY_RUNTIME_API = os.getenv("HAPROXY_RUNTIME_API", "127.0.0.1:9999")
+# Config sinh lúc chạy nằm trong thư mục mount vào container, không ghi đè file được track
+# (haproxy-ha-simple.cfg chỉ là config khởi tạo)
+HAPROXY_CONFIG_PATH = os.getenv("HAPROXY_CONFIG_PATH", "haproxy-runtime/haproxy.cfg")
+HAPROXY_PRIMARY_WEIGHT = 100
+HAPROXY_BACKUP_WEIGHT = 50
+
+# Health check settings (sub-second detection)
+CHECK_INTERVAL = float(os.getenv("FAILOVER_CHECK_INTERVAL", "0.5"))      # giây giữa 2 lần probe
+CHECK_TIMEOUT = float(os.getenv("FAILOVER_CHECK_TIMEOUT", "0.5"))        # timeout của một probe
+CHECK_JITTER = float(os.getenv("FAILOVER_CHECK_JITTER", "0.2"))          # ±20% để các monitor không probe đồng loạt
+CHECK_BACKOFF_MAX = float(os.getenv("FAILOVER_CHECK_BACKOFF_MAX", "5"))  # probe thưa dần khi node đã bị coi là down
+# Debounce kiểu quorum: node down khi FAILURE_THRESHOLD trong FAILURE_WINDOW probe gần nhất lỗi
+FAILURE_WINDOW = int(os.getenv("FAILOVER_FAILURE_WINDOW", "5"))
+FAILURE_THRESHOLD = int(os.getenv("FAILOVER_FAILURE_THRESHOLD", "3"))
+# Promote lỗi thì thử lại tối đa FAILOVER_MAX_ATTEMPTS lần cho mỗi sự cố, cách nhau
+# FAILOVER_RETRY_BACKOFF giây (gấp đôi sau mỗi lần, tối đa FAILOVER_RETRY_BACKOFF_MAX)
+FAILOVER_MAX_ATTEMPTS = int(os.getenv("FAILOVER_MAX_ATTEMPTS", "3"))
+FAILOVER_RETRY_BACKOFF = float(os.getenv("FAILOVER_RETRY_BACKOFF", "5"))
+FAILOVER_RETRY_BACKOFF_MAX = float(os.getenv("FAILOVER_RETRY_BACKOFF_MAX", "60"))
+STATUS_LOG_INTERVAL = float(os.getenv("FAILOVER_STATUS_LOG_INTERVAL", "10"))
+FAILOVER_EVENTS_FILE = os.getenv("FAILOVER_EVENTS_FILE", "failover_events.jsonl")
+
 # Logging setup
 logging.basicConfig(
     level=logging.INFO,
@@ -51,21 +102,147 @@ def check_database_health(config):
         logging.error(f"Database health check failed: {e}")
         return False
 
-def promote_replica_to_primary():
-    """Promote replica to primary by stopping primary and updating HAProxy config"""
+def connect_node(name):
+    """Kết nối psycopg2 (autocommit) tới một node theo tên"""
+    conn = psycopg2.connect(connect_timeout=CONNECT_TIMEOUT, **NODES[name])
+    conn.autocommit = True
+    return conn
+
+def replica_positions(exclude):
+    """Vị trí WAL đã replay của các replica còn sống: {name: (bytes, lsn)}"""
+    positions = {}
+    for name in NODES:
+        if name == exclude:
+            continue
+        try:
+            conn = connect_node(name)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT pg_is_in_recovery(), "
+                    "pg_wal_lsn_diff(pg_last_wal_replay_lsn(), '0/0')::bigint, "
+                    "pg_last_wal_replay_lsn()::text"
+                )
+                in_recovery, position, lsn = cursor.fetchone()
+            finally:
+                conn.close()
+            if in_recovery and position is not None:
+                positions[name] = (position, lsn)
+                logging.info(f"📍 {name}: replayed up to {lsn}")
+            else:
+                logging.warning(f"⚠️ {name} is not a streaming replica, skipping")
+        except Exception as e:
+            logging.warning(f"⚠️ {name} unreachable: {e}")
+    return positions
+
+def choose_promotion_candidate(exclude):
+    """Replica đã replay WAL xa nhất (ít mất dữ liệu nhất)"""
+    positions = replica_positions(exclude)
+    if not positions:
+        return None, None
+    name = max(positions, key=lambda n: positions[n][0])
+    return name, positions[name][1]
+
+def promote_node(name):
+    """pg_promote() rồi đợi tới khi pg_is_in_recovery() trả về false"""
+    conn = connect_node(name)
     try:
-        logging.info("🔄 Promoting replica to primary...")
-        
-        # Stop primary container
-        subprocess.run(["docker", "stop", "postgres-primary"], check=True)
-        logging.info("✅ Primary container stopped")
-        
-        # Update HAProxy config to route traffic to replica
-        haproxy_config = """
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_promote(true, %s)", (PROMOTE_TIMEOUT,))
+        deadline = time.time() + PROMOTE_TIMEOUT
+        while True:
+            cursor.execute("SELECT pg_is_in_recovery()")
+            if not cursor.fetchone()[0]:
+                return True
+            if time.time() > deadline:
+                return False
+            time.sleep(0.1)
+    finally:
+        conn.close()
+
+def node_is_read_only(name):
+    """Kiểm tra bằng kết nối mới (session mới mới chắc chắn nhận config sau reload)"""
+    try:
+        conn = connect_node(name)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SHOW default_transaction_read_only")
+            return cursor.fetchone()[0] == "on"
+        finally:
+            conn.close()
+    except Exception:
+        return False
+
+def set_read_only(name):
+    """ALTER SYSTEM read-only + ngắt mọi client; True khi session mới xác nhận read-only"""
+    try:
+        conn = connect_node(name)
+    except psycopg2.OperationalError as e:
+        logging.warning(f"⚠️ {name} unreachable for SQL fencing ({e})")
+        return False
+    try:
+        cursor = conn.cursor()
+        cursor.execute("ALTER SYSTEM SET default_transaction_read_only = on")
+        cursor.execute("SELECT pg_reload_conf()")
+        cursor.execute(
+            "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+            "WHERE backend_type = 'client backend' AND pid <> pg_backend_pid()"
+        )
+    except psycopg2.Error as e:
+        logging.warning(f"⚠️ SQL fencing of {name} failed: {e}")
+    finally:
+        conn.close()
+    read_only = node_is_read_only(name)
+    if read_only:
+        logging.info(f"🔒 {name} set to read-only and client connections terminated")
+    return read_only
+
+def reset_read_only(name):
+    """Bỏ read-only do fence ghi vào postgresql.auto.conf (giá trị này còn sau restart)"""
+    conn = connect_node(name)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("ALTER SYSTEM RESET default_transaction_read_only")
+        cursor.execute("SELECT pg_reload_conf()")
+    finally:
+        conn.close()
+
+def fence_node(name):
+    """Chặn primary cũ nhận ghi (tránh split-brain): read-only + ngắt client, rồi dừng container
+
+    Trả về True chỉ khi đã xác nhận được: read-only (kiểm tra bằng session mới) hoặc
+    `docker stop` thành công. Không kết nối được tới node không phải là bằng chứng
+    node đã dừng (có thể chỉ là mất mạng giữa monitor và node), nên không tính là fence.
+    """
+    read_only = set_read_only(name)
+    # Container dừng hẳn để không thể quay lại làm primary thứ hai
+    result = subprocess.run(["docker", "stop", name], capture_output=True, text=True)
+    stopped = result.returncode == 0
+    if stopped:
+        logging.info(f"✅ {name} container stopped")
+    else:
+        logging.warning(f"⚠️ Could not stop {name}: {result.stderr.strip()}")
+    if not (read_only or stopped):
+        record_failover_event({
+            "event": "fence_failed",
+            "node": name,
+            "ts": datetime.now().isoformat(),
+            "docker_stop_error": result.stderr.strip() or None,
+        })
+    return read_only or stopped
+
+# Template duy nhất cho file config HAProxy, server được sinh theo primary hiện tại
+HAPROXY_TEMPLATE = """
 global
     daemon
     maxconn 256
     log stdout local0
+    # Chạy với quyền root chỉ để chép config khởi tạo, sau khi bind thì hạ quyền
+    user haproxy
+    group haproxy
+    # Runtime API: auto-failover.py đổi state/weight của server mà không cần reload.
+    # Port chỉ publish trên 127.0.0.1 của host, không mở ra mọi interface
+    stats socket ipv4@*:9999 level admin
 
 defaults
     mode tcp
@@ -74,6 +251,18 @@ defaults
     timeout server 50000ms
     option tcplog
 
+# Docker DNS resolver so backend names can disappear/reappear without blocking startup
+resolvers docker
+    nameserver dns 127.0.0.11:53
+    resolve_retries 3
+    timeout resolve 1s
+    timeout retry 1s
+    hold other 30s
+    hold refused 30s
+    hold nx 30s
+    hold timeout 30s
+    hold valid 10s
+
 # HAProxy Statistics
 listen stats
     bind *:5000
@@ -83,8 +272,8 @@ listen stats
     stats refresh 5s
     stats admin if TRUE
 
-# PostgreSQL Cluster - Replica promoted to primary
-listen postgres
+# PostgreSQL Cluster với health checks
+listen {backend}
     bind *:5432
     mode tcp
     option tcplog
@@ -92,8 +281,7 @@ listen postgres
     option tcp-check
     tcp-check connect port 5432
     
-    # Replica server (now acting as primary)
-    server postgres-replica-1 postgres-replica-1:5432 check port 5432 inter 3s rise 2 fall 3 weight 100
+{servers}
 
 # Health check endpoint
 listen health
@@ -102,138 +290,416 @@ listen health
     option httpchk GET /health
     http-check expect status 200
 """
+
+HAPROXY_SERVER_LINE = (
+    "    server {name} {name}:5432 check port 5432 inter 3s rise 2 fall 3 weight {weight}"
+    "{backup} resolvers docker resolve-prefer ipv4 init-addr none"
+)
+
+def render_haproxy_config(primary):
+    """Sinh config HAProxy: primary nhận traffic, các node còn lại là backup"""
+    servers = []
+    for name in NODES:
+        role = "Primary server" if name == primary else "Standby server (backup)"
+        servers.append(f"    # {role}")
+        servers.append(HAPROXY_SERVER_LINE.format(
+            name=name,
+            weight=HAPROXY_PRIMARY_WEIGHT if name == primary else HAPROXY_BACKUP_WEIGHT,
+            backup="" if name == primary else " backup",
+        ))
+    return HAPROXY_TEMPLATE.format(backend=HAPROXY_BACKEND, servers="\n".join(servers)).lstrip("\n")
+
+def haproxy_command(command):
+    """Gửi một lệnh tới HAProxy runtime API, lỗi nếu HAProxy trả về thông báo"""
+    host, _, port = HAPROXY_RUNTIME_API.rpartition(":")
+    with socket.create_connection((host, int(port)), timeout=CONNECT_TIMEOUT) as sock:
+        sock.sendall(f"{command}\n".encode())
+        response = b""
+        while chunk := sock.recv(4096):
+            response += chunk
+    response = response.decode().strip()
+    if response:
+        raise RuntimeError(f"HAProxy '{command}': {response}")
+
+def apply_routing_runtime(primary, fenced=()):
+    """Đổi routing qua runtime API, không reload nên không cắt kết nối đang chạy
+
+    Primary: ready + weight đầy đủ. Node bị fence: maint và ngắt mọi session.
+    Node còn lại (standby): drain, vẫn được health check nhưng không nhận kết nối mới.
+    """
+    for name in NODES:
+        server = f"{HAPROXY_BACKEND}/{name}"
+        if name == primary:
+            haproxy_command(f"set server {server} state ready")
+            haproxy_command(f"set server {server} weight {HAPROXY_PRIMARY_WEIGHT}")
+        elif name in fenced:
+            haproxy_command(f"set server {server} state maint")
+            haproxy_command(f"shutdown sessions server {server}")
+        else:
+            haproxy_command(f"set server {server} state drain")
+
+def write_haproxy_config(primary):
+    """Kiểm tra config trong container rồi thay file config runtime
+
+    Cả thư mục được bind-mount nên có thể ghi file tạm rồi os.replace (file cũ có thể do
+    container tạo với owner root, vẫn thay được vì thư mục thuộc về user chạy script).
+    """
+    config = render_haproxy_config(primary)
+    subprocess.run(
+        ["docker", "exec", "-i", HAPROXY_CONTAINER, "haproxy", "-c", "-f", "/dev/stdin"],
+        input=config, text=True, capture_output=True, check=True
+    )
+    config_dir = os.path.dirname(HAPROXY_CONFIG_PATH) or "."
+    os.makedirs(config_dir, exist_ok=True)
+    tmp_path = f"{HAPROXY_CONFIG_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(config)
+    os.replace(tmp_path, HAPROXY_CONFIG_PATH)
+
+def apply_routing(primary, fenced=()):
+    """Chuyển traffic về primary: runtime API trước, lỗi thì ghi config + reload"""
+    try:
+        apply_routing_runtime(primary, fenced)
+        logging.info(f"✅ HAProxy routing switched to {primary} via runtime API")
+        # Lưu file để HAProxy khởi động lại vẫn đúng routing (không reload)
+        try:
+            write_haproxy_config(primary)
+        except Exception as e:
+            logging.warning(f"⚠️ Could not persist HAProxy config: {e}")
+        return True
+    except Exception as e:
+        logging.warning(f"⚠️ HAProxy runtime API failed ({e}), falling back to config reload")
+    write_haproxy_config(primary)
+    subprocess.run(["docker", "kill", "-s", "HUP", HAPROXY_CONTAINER], check=True)
+    logging.info(f"✅ HAProxy config for {primary} written and reloaded")
+    return True
+
+def promote_replica_to_primary(failed_primary=INITIAL_PRIMARY):
+    """Fence primary cũ, promote replica đã replay xa nhất bằng pg_promote() rồi mới đổi routing
+
+    Không xác nhận được primary cũ đã read-only hoặc đã dừng (kể cả khi không kết nối
+    được tới nó) thì bỏ promote để không có hai primary cùng nhận ghi.
+    Trả về tên node mới làm primary, None nếu thất bại.
+    """
+    try:
+        logging.info("🔄 Promoting replica to primary...")
+        
+        candidate, lsn = choose_promotion_candidate(exclude=failed_primary)
+        if not candidate:
+            logging.error("❌ No reachable replica to promote")
+            return None
         
-        with open('haproxy-failover-active.cfg', 'w') as f:
-            f.write(haproxy_config)
+        # Fence trước khi promote: primary cũ chỉ "chậm" mà vẫn nhận ghi thì sẽ thành split-brain
+        if not fence_node(failed_primary):
+            logging.error(f"❌ Could not fence {failed_primary}, aborting promotion to avoid split-brain")
+            return None
         
-        # Reload HAProxy configuration
-        subprocess.run(["docker", "exec", "haproxy", "haproxy", "-f", "/usr/local/etc/haproxy/haproxy.cfg", "-c"], check=True)
-        subprocess.run(["docker", "exec", "haproxy", "haproxy", "-f", "/usr/local/etc/haproxy/haproxy.cfg", "-sf", "1"], check=True)
+        logging.info(f"🎯 Promoting {candidate} (replay LSN {lsn})")
+        if not promote_node(candidate):
+            logging.error(f"❌ {candidate} still in recovery after {PROMOTE_TIMEOUT}s")
+            return None
+        logging.info(f"✅ {candidate} is out of recovery and accepts writes")
+        
+        # Chỉ đổi routing khi node mới đã thật sự nhận ghi
+        apply_routing(candidate, fenced=[failed_primary])
         
-        logging.info("✅ HAProxy configuration updated")
         logging.info("✅ Failover completed successfully!")
         
-        return True
+        return candidate
     except Exception as e:
         logging.error(f"❌ Failover failed: {e}")
-        return False
+        return None
 
-def restore_primary():
-    """Restore primary database and update HAProxy config"""
+def node_status(name):
+    """(pg_is_in_recovery(), vị trí WAL): replay LSN trên standby, flush LSN trên primary"""
+    conn = connect_node(name)
     try:
-        logging.info("🔄 Restoring primary database...")
-        
-        # Start primary container
-        subprocess.run(["docker", "start", "postgres-primary"], check=True)
-        logging.info("✅ Primary container started")
-        
-        # Wait for primary to be ready
-        time.sleep(30)
-        
-        # Check if primary is healthy
-        if check_database_health(PRIMARY_CONFIG):
-            # Update HAProxy config back to normal
-            haproxy_config = """
-global
-    daemon
-    maxconn 256
-    log stdout local0
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT pg_is_in_recovery(), CASE WHEN pg_is_in_recovery() "
+            "THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_flush_lsn() END::text"
+        )
+        return cursor.fetchone()
+    finally:
+        conn.close()
 
-defaults
-    mode tcp
-    timeout connect 5000ms
-    timeout client 50000ms
-    timeout server 50000ms
-    option tcplog
+def wait_for_lsn(name, lsn, timeout=PROMOTE_TIMEOUT):
+    """Đợi standby `name` replay tới `lsn`"""
+    conn = connect_node(name)
+    try:
+        cursor = conn.cursor()
+        deadline = time.time() + timeout
+        while True:
+            cursor.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn", (lsn,))
+            if cursor.fetchone()[0]:
+                return True
+            if time.time() > deadline:
+                return False
+            time.sleep(0.1)
+    finally:
+        conn.close()
 
-# HAProxy Statistics
-listen stats
-    bind *:5000
-    mode http
-    stats enable
-    stats uri /stats
-    stats refresh 5s
-    stats admin if TRUE
+def find_primary():
+    """Node duy nhất không ở recovery; None nếu không có hoặc có nhiều hơn một"""
+    primaries = []
+    for name in NODES:
+        try:
+            in_recovery, _ = node_status(name)
+        except Exception as e:
+            logging.warning(f"⚠️ {name} unreachable: {e}")
+            continue
+        if not in_recovery:
+            primaries.append(name)
+    if len(primaries) > 1:
+        logging.error(f"❌ More than one node accepts writes: {', '.join(primaries)}")
+        return None
+    return primaries[0] if primaries else None
 
-# PostgreSQL Cluster - Normal operation
-listen postgres
-    bind *:5432
-    mode tcp
-    option tcplog
-    balance roundrobin
-    option tcp-check
-    tcp-check connect port 5432
-    
-    # Primary server (restored)
-    server postgres-primary postgres-primary:5432 check port 5432 inter 3s rise 2 fall 3 weight 100
-    
-    # Replica server (backup)
-    server postgres-replica-1 postgres-replica-1:5432 check port 5432 inter 3s rise 2 fall 3 weight 50 backup
+def switchover(target, current):
+    """Chuyển primary có kiểm soát từ `current` sang standby `target` (vd. đưa
+    postgres-primary về lại vai primary sau khi đã dựng nó thành replica và bắt kịp)
 
-# Health check endpoint
-listen health
-    bind *:8080
-    mode http
-    option httpchk GET /health
-    http-check expect status 200
-"""
-            
-            with open('haproxy-failover-active.cfg', 'w') as f:
-                f.write(haproxy_config)
-            
-            # Reload HAProxy configuration
-            subprocess.run(["docker", "exec", "haproxy", "haproxy", "-f", "/usr/local/etc/haproxy/haproxy.cfg", "-c"], check=True)
-            subprocess.run(["docker", "exec", "haproxy", "haproxy", "-f", "/usr/local/etc/haproxy/haproxy.cfg", "-sf", "1"], check=True)
-            
-            logging.info("✅ Primary restored and HAProxy configuration updated")
-            return True
-        else:
-            logging.error("❌ Primary is not healthy after restart")
+    current read-only -> target replay hết WAL của current -> dừng current ->
+    pg_promote() target -> xác nhận target ra khỏi recovery và ghi được -> đổi routing.
+    Lỗi trước bước promote thì bỏ read-only trên current, routing giữ nguyên.
+    """
+    if target == current:
+        logging.error(f"❌ {target} is already the primary")
+        return False
+    started = time.time()
+    logging.info(f"🔄 Switchover {current} -> {target}")
+    try:
+        in_recovery, target_lsn = node_status(target)
+        if not in_recovery:
+            logging.error(f"❌ {target} is not a standby, refusing switchover (would leave two primaries)")
+            return False
+        current_in_recovery, _ = node_status(current)
+        if current_in_recovery:
+            logging.error(f"❌ {current} is not the primary")
+            return False
+
+        if not set_read_only(current):
+            logging.error(f"❌ Could not make {current} read-only, switchover aborted")
+            return False
+        # Mọi client đã bị ngắt và không ghi được nữa: vị trí WAL này là điểm cuối của current
+        _, final_lsn = node_status(current)
+        if not wait_for_lsn(target, final_lsn):
+            logging.error(f"❌ {target} did not replay up to {final_lsn} within {PROMOTE_TIMEOUT}s, "
+                          f"switchover aborted")
+            reset_read_only(current)
+            return False
+        logging.info(f"📍 {target} replayed up to {final_lsn}")
+
+        # Current dừng hẳn, phải dựng lại thành replica của target trước khi dùng lại
+        result = subprocess.run(["docker", "stop", current], capture_output=True, text=True)
+        if result.returncode != 0:
+            logging.warning(f"⚠️ Could not stop {current} ({result.stderr.strip()}), it stays read-only")
+
+        # Standby có thể mang read-only từ lần bị fence trước (postgresql.auto.conf)
+        reset_read_only(target)
+        if not promote_node(target):
+            logging.error(f"❌ {target} still in recovery after {PROMOTE_TIMEOUT}s")
+            return False
+        if node_is_read_only(target):
+            logging.error(f"❌ {target} left recovery but is still read-only")
             return False
-            
+        logging.info(f"✅ {target} is out of recovery and accepts writes")
+
+        apply_routing(target, fenced=[current])
+        record_failover_event({
+            "event": "switchover",
+            "success": True,
+            "old_primary": current,
+            "new_primary": target,
+            "final_lsn": final_lsn,
+            "total_ms": round((time.time() - started) * 1000),
+        })
+        logging.info("✅ Switchover completed successfully!")
+        return True
     except Exception as e:
-        logging.error(f"❌ Primary restoration failed: {e}")
+        logging.error(f"❌ Switchover failed: {e}")
         return False
 
-def main():
-    """Main monitoring loop"""
-    logging.info("🚀 Starting PostgreSQL auto-failover monitor...")
-    
-    failover_active = False
-    
-    while True:
+class ProbeConnection:
+    """Kết nối probe giữ mở lâu dài, chỉ kết nối lại khi probe lỗi"""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.conn = None
+        self.last_latency = None
+        self.last_error = None
+
+    async def check(self):
+        """SELECT 1 qua kết nối sẵn có, trả về True/False"""
+        started = time.perf_counter()
         try:
-            # Check primary health
-            primary_healthy = check_database_health(PRIMARY_CONFIG)
-            
-            if not primary_healthy and not failover_active:
-                logging.warning("⚠️  Primary database is down!")
-                if promote_replica_to_primary():
-                    failover_active = True
-                    logging.info("🔄 Failover activated - monitoring for primary recovery...")
-            elif primary_healthy and failover_active:
-                logging.info("✅ Primary database is back online!")
-                if restore_primary():
-                    failover_active = False
-                    logging.info("🔄 Normal operation restored")
-            
-            # Log status
-            status = "FAILOVER ACTIVE" if failover_active else "NORMAL"
-            logging.info(f"📊 Status: {status} - Primary: {'✅' if primary_healthy else '❌'}")
-            
-            # Wait before next check
-            time.sleep(10)
-            
-        except KeyboardInterrupt:
-            logging.info("🛑 Monitor stopped by user")
-            break
+            if self.conn is None or self.conn.is_closed():
+                self.conn = await asyncpg.connect(timeout=CHECK_TIMEOUT, **self.config)
+            await self.conn.fetchval("SELECT 1", timeout=CHECK_TIMEOUT)
+            self.last_latency = time.perf_counter() - started
+            self.last_error = None
+            return True
         except Exception as e:
-            logging.error(f"❌ Monitor error: {e}")
-            time.sleep(30)
+            self.last_error = str(e) or type(e).__name__
+            await self.close()
+            return False
 
-if __name__ == "__main__":
-    main()
+    async def close(self):
+        if self.conn is not None:
+            self.conn.terminate()
+            self.conn = None
+
+class HealthWindow:
+    """M kết quả probe gần nhất, quyết định down/up theo ngưỡng N-of-M"""
+
+    def __init__(self, window=FAILURE_WINDOW, threshold=FAILURE_THRESHOLD):
+        self.results = deque(maxlen=window)
+        self.threshold = threshold
+        self.consecutive_failures = 0
+        self.first_failure_at = None
+
+    def record(self, healthy):
+        self.results.append(healthy)
+        if healthy:
+            self.consecutive_failures = 0
+            self.first_failure_at = None
+        else:
+            self.consecutive_failures += 1
+            self.first_failure_at = self.first_failure_at or time.time()
+
+    def is_down(self):
+        return sum(1 for healthy in self.results if not healthy) >= self.threshold
 
+    def is_up(self):
+        return len(self.results) == self.results.maxlen and all(self.results)
 
+    def reset(self):
+        self.results.clear()
+        self.consecutive_failures = 0
+        self.first_failure_at = None
 
+def next_delay(window):
+    """Khoảng chờ tới probe kế tiếp: nhanh khi còn nghi ngờ, backoff khi node đã down"""
+    delay = CHECK_INTERVAL
+    if window.is_down():
+        delay = min(CHECK_BACKOFF_MAX, CHECK_INTERVAL * 2 ** (window.consecutive_failures - FAILURE_THRESHOLD))
+    return delay * random.uniform(1 - CHECK_JITTER, 1 + CHECK_JITTER)
 
+def record_failover_event(event):
+    """Ghi timing của một lần failover/switchover ra file JSONL"""
+    logging.info(f"⏱️ {event['event']}: " + ", ".join(
+        f"{key}={value}" for key, value in event.items() if key.endswith("_ms")
+    ))
+    with open(FAILOVER_EVENTS_FILE, "a") as f:
+        f.write(json.dumps(event) + "\n")
+
+async def monitor():
+    """Vòng lặp asyncio: probe primary hiện tại liên tục, failover khi N-of-M probe lỗi"""
+    # Sau failover/switchover primary có thể không còn là INITIAL_PRIMARY
+    current_primary = await asyncio.to_thread(find_primary) or INITIAL_PRIMARY
+    logging.info(f"🎯 Monitoring primary {current_primary}")
+    primary = ProbeConnection(current_primary, NODES[current_primary])
+    window = HealthWindow()
+    failover_active = False
+    last_status_log = 0
+    # Sự cố hiện tại: số lần promote đã thử và thời điểm sớm nhất được thử lại
+    attempts = 0
+    next_attempt_at = 0
+
+    try:
+        while True:
+            healthy = await primary.check()
+            window.record(healthy)
+            if not healthy and window.consecutive_failures == 1:
+                logging.warning(f"⚠️ Primary probe failed ({current_primary}): {primary.last_error}")
+
+            if attempts and window.is_up():
+                # Primary sống lại: kết thúc sự cố, lần down sau được thử lại từ đầu
+                logging.info(f"✅ Primary {current_primary} is healthy again after {attempts} failed promotion(s)")
+                attempts = 0
+
+            if window.is_down() and attempts < FAILOVER_MAX_ATTEMPTS and time.time() >= next_attempt_at:
+                attempts += 1
+                detected_at = time.time()
+                first_failure_at = window.first_failure_at or detected_at
+                logging.warning(f"⚠️  Primary database {current_primary} is down! "
+                                f"({FAILURE_THRESHOLD}/{FAILURE_WINDOW} probes failed)")
+                promoted = await asyncio.to_thread(promote_replica_to_primary, current_primary)
+                promoted_at = time.time()
+                record_failover_event({
+                    "event": "failover",
+                    "success": promoted is not None,
+                    "attempt": attempts,
+                    "failed_primary": current_primary,
+                    "new_primary": promoted,
+                    "first_failure_at": datetime.fromtimestamp(first_failure_at).isoformat(),
+                    "detection_ms": round((detected_at - first_failure_at) * 1000),
+                    "promotion_ms": round((promoted_at - detected_at) * 1000),
+                    "total_ms": round((promoted_at - first_failure_at) * 1000),
+                })
+                if promoted:
+                    # Node cũ đã bị fence, phải dựng lại thành replica của primary mới trước khi dùng lại
+                    logging.info(f"🔄 Failover activated - {promoted} is the new primary, "
+                                 f"rebuild {current_primary} as its replica before switching back "
+                                 f"(auto-failover.py switchover)")
+                    await primary.close()
+                    current_primary = promoted
+                    primary = ProbeConnection(current_primary, NODES[current_primary])
+                    failover_active = True
+                    attempts = 0
+                elif attempts < FAILOVER_MAX_ATTEMPTS:
+                    backoff = min(FAILOVER_RETRY_BACKOFF_MAX, FAILOVER_RETRY_BACKOFF * 2 ** (attempts - 1))
+                    next_attempt_at = time.time() + backoff
+                    logging.warning(f"⚠️ Promotion attempt {attempts}/{FAILOVER_MAX_ATTEMPTS} failed, "
+                                    f"retrying in {backoff:.0f}s if {current_primary} is still down")
+                else:
+                    logging.error(f"❌ Promotion failed {attempts} times, giving up until {current_primary} "
+                                  f"recovers - manual intervention required")
+                    record_failover_event({
+                        "event": "failover_gave_up",
+                        "failed_primary": current_primary,
+                        "attempts": attempts,
+                        "ts": datetime.now().isoformat(),
+                    })
+                # Mỗi lần thử dùng một cửa sổ probe mới: lần sau cần đủ N-of-M probe lỗi mới
+                window.reset()
+
+            if time.time() - last_status_log >= STATUS_LOG_INTERVAL:
+                last_status_log = time.time()
+                status = "FAILOVER ACTIVE" if failover_active else "NORMAL"
+                latency = f"{primary.last_latency * 1000:.1f}ms" if healthy and primary.last_latency else "-"
+                logging.info(f"📊 Status: {status} - Primary {current_primary}: "
+                             f"{'✅' if healthy else '❌'} (probe {latency})")
+
+            await asyncio.sleep(next_delay(window))
+    finally:
+        await primary.close()
+
+def main():
+    """Chạy monitor asyncio, hoặc switchover có kiểm soát"""
+    parser = argparse.ArgumentParser(description="PostgreSQL auto-failover monitor")
+    subparsers = parser.add_subparsers(dest="command")
+    switch = subparsers.add_parser("switchover", help="Controlled switchover to a caught-up standby")
+    switch.add_argument("--to", dest="target", default=INITIAL_PRIMARY, choices=list(NODES))
+    switch.add_argument("--from", dest="current", default=None, choices=list(NODES),
+                        help="Current primary (default: detected)")
+    args = parser.parse_args()
+
+    if args.command == "switchover":
+        current = args.current or find_primary()
+        if current is None:
+            logging.error("❌ Could not determine the current primary")
+            raise SystemExit(1)
+        raise SystemExit(0 if switchover(args.target, current) else 1)
+
+    logging.info("🚀 Starting PostgreSQL auto-failover monitor...")
+    logging.info(f"⚙️ Probe every {CHECK_INTERVAL}s (timeout {CHECK_TIMEOUT}s), "
+                 f"failover after {FAILURE_THRESHOLD}/{FAILURE_WINDOW} failed probes")
+    try:
+        asyncio.run(monitor())
+    except KeyboardInterrupt:
+        logging.info("🛑 Monitor stopped by user")
+
+if __name__ == "__main__":
+    main()
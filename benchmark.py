@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+HTTP Benchmark
+Đo throughput và p50/p95/p99 của các endpoint chính, so sánh với baseline đã lưu
+
+    python benchmark.py --target http://localhost:8000 --duration 30 --concurrency 16
+    python benchmark.py --in-process --save-baseline
+    python benchmark.py --mix member_page=60,api_posts=30,login=5,write=5
+
+Dữ liệu nên được sinh trước bằng app.database.generate_data (user1 / benchmark123).
+Kết quả ghi vào benchmark_results/latest.json; nếu có baseline.json thì p95 chậm hơn
+hoặc throughput thấp hơn quá --tolerance sẽ làm lệnh thoát với mã 1.
+"""
+
+from app.database.generate_data import GENERATED_PASSWORD
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+RESULTS_DIR = "benchmark_results"
+DEFAULT_MIX = "member_page=50,api_posts=35,login=5,write=10"
+MEMBER_PAGES = ["jisoo", "jennie", "rose", "lisa"]
+
+def log(message, level="INFO"):
+    """Log message với timestamp"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    icon = "✅" if level == "SUCCESS" else "❌" if level == "ERROR" else "ℹ️"
+    print(f"[{timestamp}] {icon} {message}")
+
+# ==================== SCENARIOS ====================
+# Mỗi scenario trả về (method, path, kwargs cho request)
+
+def member_page(rng, context):
+    """Trang member, không đăng nhập"""
+    return "GET", f"/post/{rng.choice(MEMBER_PAGES)}", {}
+
+def api_posts(rng, context):
+    """GET /api/posts/ có token, lọc theo KOL một nửa số lần"""
+    params = {"limit": 20, "skip": rng.choice([0, 0, 0, 20, 40])}
+    if rng.random() < 0.5 and context["kol_ids"]:
+        params["kol_id"] = rng.choice(context["kol_ids"])
+    return "GET", "/api/posts/", {"params": params, "headers": context["auth_headers"]}
+
+def login(rng, context):
+    """POST /api/auth/login (bcrypt nên tốn CPU)"""
+    return "POST", "/api/auth/login", {"json": context["credentials"]}
+
+def write(rng, context):
+    """POST /api/posts/ tạo một bài viết"""
+    body = {
+        "title": f"Benchmark post {rng.randint(1, 10 ** 9)}",
+        "excerpt": "benchmark",
+        "content": "benchmark " * rng.randint(20, 200),
+        "kol_id": rng.choice(context["kol_ids"]),
+        "category_id": rng.choice(context["category_ids"]),
+    }
+    return "POST", "/api/posts/", {"json": body, "headers": context["auth_headers"]}
+
+SCENARIOS = {
+    "member_page": member_page,
+    "api_posts": api_posts,
+    "login": login,
+    "write": write,
+}
+
+# ==================== CLIENTS ====================
+
+def create_client(args):
+    """Client HTTP thật (requests) hoặc TestClient chạy app trong cùng process"""
+    if args.in_process:
+        from fastapi.testclient import TestClient
+        from app.main import app
+        client = TestClient(app, raise_server_exceptions=False)
+        client.__enter__()  # chạy startup event (warm-up pool, template)
+        return client
+    import requests
+    return requests.Session()
+
+def request(client, args, method, path, **kwargs):
+    if args.in_process:
+        return client.request(method, path, **kwargs)
+    return client.request(method, args.target.rstrip("/") + path, timeout=args.timeout, **kwargs)
+
+def prepare_context(client, args):
+    """Đăng nhập một lần để lấy token và danh sách KOL/category cho scenario ghi"""
+    credentials = {"username": args.username, "password": args.password}
+    response = request(client, args, "POST", "/api/auth/login", json=credentials)
+    if response.status_code != 200:
+        raise RuntimeError(f"Login as {args.username} failed: {response.status_code} {response.text[:200]}")
+    token = response.json()["token"]["access_token"]
+    auth_headers = {"Authorization": f"Bearer {token}"}
+    kols = request(client, args, "GET", "/api/posts/kols/", headers=auth_headers).json()
+    categories = request(client, args, "GET", "/api/posts/categories/", headers=auth_headers).json()
+    return {
+        "credentials": credentials,
+        "auth_headers": auth_headers,
+        "kol_ids": [k["id"] for k in kols] or [1],
+        "category_ids": [c["id"] for c in categories] or [1],
+    }
+
+# ==================== RUNNER ====================
+
+def parse_mix(spec):
+    """Đọc chuỗi 'member_page=60,api_posts=40' thành dict tỉ trọng scenario
+
+    Tỉ trọng là số nguyên >= 0, scenario có tỉ trọng 0 bị bỏ khỏi lần chạy.
+    """
+    mix = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        try:
+            weight = int(weight)
+        except ValueError:
+            raise ValueError(f"Invalid weight for '{name}' in --mix: expected name=integer, got '{item.strip()}'")
+        if weight < 0:
+            raise ValueError(f"Weight for '{name}' in --mix must be >= 0, got {weight}")
+        if name in mix:
+            raise ValueError(f"Scenario '{name}' appears twice in --mix")
+        mix[name] = weight
+    mix = {name: weight for name, weight in mix.items() if weight > 0}
+    if not mix:
+        raise ValueError(f"--mix '{spec}' has no scenario with a weight above 0")
+    return mix
+
+def percentile(sorted_values, pct):
+    """Percentile kiểu nearest-rank trên danh sách đã sắp xếp"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+        "max_ms": round(values[-1] * 1000, 2) if values else None,
+    }
+
+def worker(worker_id, client, args, context, mix, deadline, measure_from, results, lock):
+    """Một client ảo: chọn scenario theo tỉ trọng, gửi request tới hết thời gian"""
+    rng = random.Random(args.seed + worker_id)
+    names, weights = list(mix), list(mix.values())
+    local = {name: ([], 0) for name in names}
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights=weights)[0]
+        method, path, kwargs = SCENARIOS[name](rng, context)
+        started = time.perf_counter()
+        try:
+            response = request(client, args, method, path, **kwargs)
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - started
+        # Bỏ qua giai đoạn warm-up
+        if started < measure_from:
+            continue
+        latencies, errors = local[name]
+        latencies.append(elapsed)
+        local[name] = (latencies, errors + failed)
+    with lock:
+        for name, (latencies, errors) in local.items():
+            results[name][0].extend(latencies)
+            results[name][1] += errors
+
+def run_benchmark(args):
+    mix = parse_mix(args.mix)
+    unknown = [name for name in mix if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)} (available: {', '.join(SCENARIOS)})")
+
+    shared_client = create_client(args) if args.in_process else None
+    setup_client = shared_client or create_client(args)
+    context = prepare_context(setup_client, args)
+    log(f"Benchmark: {args.concurrency} clients, {args.duration}s (+{args.warmup}s warm-up), mix {mix}")
+
+    results = {name: [[], 0] for name in mix}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    deadline = measure_from + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(worker, i, shared_client or create_client(args), args, context, mix,
+                        deadline, measure_from, results, lock)
+            for i in range(args.concurrency)
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - measure_from
+
+    all_latencies = [latency for latencies, _ in results.values() for latency in latencies]
+    all_errors = sum(errors for _, errors in results.values())
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "target": "in-process" if args.in_process else args.target,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "mix": mix,
+            "seed": args.seed,
+        },
+        "scenarios": {name: summarize(latencies, errors, elapsed) for name, (latencies, errors) in results.items()},
+        "total": summarize(all_latencies, all_errors, elapsed),
+    }
+
+# ==================== REPORT ====================
+
+def print_report(report):
+    print(f"\n{'scenario':<14}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report["scenarios"].items()) + [("TOTAL", report["total"])]
+    for name, stats in rows:
+        print(f"{name:<14}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+              f"{stats['p50_ms'] or '-':>10}{stats['p95_ms'] or '-':>10}{stats['p99_ms'] or '-':>10}")
+
+def compare_with_baseline(report, baseline, tolerance):
+    """Danh sách regression: p95 tăng, throughput giảm hoặc tỉ lệ lỗi tăng quá tolerance"""
+    regressions = []
+    for name, stats in list(report["scenarios"].items()) + [("TOTAL", report["total"])]:
+        base = baseline["total"] if name == "TOTAL" else baseline["scenarios"].get(name)
+        if not base or not stats["requests"]:
+            continue
+        if base["p95_ms"] and stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {stats['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if stats["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {stats['throughput_rps']} rps vs baseline {base['throughput_rps']} rps")
+        if stats["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{name}: error rate {stats['error_rate']:.2%} vs baseline {base['error_rate']:.2%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FastAPI endpoints")
+    parser.add_argument("--target", default=os.getenv("BENCHMARK_TARGET", "http://localhost:8000"),
+                        help="Base URL of a running server")
+    parser.add_argument("--in-process", action="store_true", help="Drive app.main:app with TestClient, no server")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds before measuring starts")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. member_page=50,api_posts=50")
+    parser.add_argument("--username", default="user1")
+    parser.add_argument("--password", default=GENERATED_PASSWORD)
+    parser.add_argument("--timeout", type=float, default=10, help="Request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "latest.json"))
+    parser.add_argument("--baseline", default=os.path.join(RESULTS_DIR, "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression ratio vs baseline")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    log(f"Results written to {args.output}", "SUCCESS")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        log(f"Baseline saved to {args.baseline}", "SUCCESS")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        log(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(report, baseline, args.tolerance)
+    if regressions:
+        for regression in regressions:
+            log(f"Regression - {regression}", "ERROR")
+        return 1
+    log(f"No regression vs baseline (tolerance {args.tolerance:.0%})", "SUCCESS")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
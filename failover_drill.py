@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Failover Drill
+Giữ tải đọc/ghi liên tục qua engine của app, kill primary, đo thời gian phục hồi (RTO)
+của đọc và ghi riêng rẽ và số write đã ack nhưng bị mất sau failover
+
+    docker compose -f docker-compose.ha-simple.yml up -d
+    python auto-failover.py &            # monitor thực hiện promote + chuyển HAProxy
+    python failover_drill.py --warmup 10 --observe 60
+
+    # Cluster chạy local không qua docker: tự chỉ định lệnh kill
+    python failover_drill.py --kill-command "pg_ctl -D /tmp/pg-primary stop -m immediate"
+
+Write đi qua engine --write-role (mặc định haproxy, đi theo primary mới sau failover),
+read đi qua --read-role. Mỗi write ghi lại id và vị trí WAL lúc ack; sau drill, các id
+không còn trên primary mới là write bị mất, các write có LSN vượt quá vị trí replay cuối
+cùng của standby trước khi promote là write có nguy cơ mất.
+Timeline (kill, down/up của đọc và ghi, tổng kết) ghi vào cluster_reports/failover_drill.csv/.jsonl.
+"""
+
+from sqlalchemy import text
+from app.database.connection import get_engine
+from app.database.replication_lag import RotatingReport, lsn_to_int, primary_wal_lsn
+from datetime import datetime
+import argparse
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+DRILL_TABLE = "failover_drill_writes"
+REPORT_NAME = "failover_drill"
+
+def log(message, level="INFO"):
+    """Log message với timestamp"""
+    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+    icon = "✅" if level == "SUCCESS" else "❌" if level == "ERROR" else "⚠️" if level == "WARNING" else "ℹ️"
+    print(f"[{timestamp}] {icon} {message}")
+
+def setup_drill_table(write_engine):
+    with write_engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {DRILL_TABLE} (
+                id BIGSERIAL PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+            )
+        """))
+
+class DrillState:
+    """Kết quả từng thao tác và timeline các lần chuyển trạng thái down/up"""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.kill_at = None
+        self.ops = {"read": [], "write": []}   # (t, ok)
+        self.last_ok = {"read": None, "write": None}
+        self.acked = []                        # (seq, row_id, lsn, t)
+        self.standby_replay_lsn = None         # vị trí replay cuối cùng khi standby còn recovery
+        self.timeline = []
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+
+    def event(self, name, **details):
+        with self.lock:
+            self.timeline.append({"t": time.time(), "event": name, **details})
+
+    def record(self, kind, ok, error=None):
+        now = time.time()
+        with self.lock:
+            self.ops[kind].append((now, ok))
+            changed = self.last_ok[kind] is not None and self.last_ok[kind] != ok
+            self.last_ok[kind] = ok
+        if changed:
+            name = f"{kind}s_up" if ok else f"{kind}s_down"
+            self.event(name, error=str(error).splitlines()[0] if error else None)
+            log(f"{name}{': ' + str(error).splitlines()[0] if error else ''}", "SUCCESS" if ok else "ERROR")
+
+    def recovery_time(self, kind):
+        """RTO: từ lúc kill tới thao tác thành công đầu tiên sau lỗi cuối cùng
+        (0 nếu không có lỗi, None nếu chưa phục hồi)"""
+        with self.lock:
+            after = [(t, ok) for t, ok in self.ops[kind] if t >= self.kill_at]
+        failures = [t for t, ok in after if not ok]
+        if not failures:
+            return 0.0
+        recovered = [t for t, ok in after if ok and t > failures[-1]]
+        return recovered[0] - self.kill_at if recovered else None
+
+    def downtime(self, kind):
+        """Tổng thời gian từ lỗi đầu tiên tới thao tác thành công kế tiếp, cộng dồn"""
+        total, down_since = 0.0, None
+        with self.lock:
+            ops = [(t, ok) for t, ok in self.ops[kind] if t >= self.kill_at]
+        for t, ok in ops:
+            if not ok and down_since is None:
+                down_since = t
+            elif ok and down_since is not None:
+                total += t - down_since
+                down_since = None
+        if down_since is not None:
+            total += ops[-1][0] - down_since
+        return total
+
+def paced(rate, state, action):
+    """Gọi action() `rate` lần mỗi giây cho tới khi drill dừng"""
+    interval = 1 / rate
+    next_at = time.perf_counter()
+    while not state.stop.is_set():
+        action()
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            state.stop.wait(delay)
+        else:
+            next_at = time.perf_counter()
+
+def writer(state, write_engine, rate):
+    seq = 0
+    def write_once():
+        nonlocal seq
+        seq += 1
+        try:
+            with write_engine.connect() as conn:
+                row_id = conn.execute(
+                    text(f"INSERT INTO {DRILL_TABLE} (run_id, seq) VALUES (:run_id, :seq) RETURNING id"),
+                    {"run_id": state.run_id, "seq": seq},
+                ).scalar_one()
+                conn.commit()
+                # Chỉ tính là ack khi commit đã trả về thành công
+                acked_at = time.time()
+                # Đọc sau commit để vị trí nằm sau commit record của write này (RETURNING thì nằm trước);
+                # lỗi ở đây (primary vừa chết) không làm mất ack, chỉ không biết LSN
+                try:
+                    lsn = primary_wal_lsn(conn)
+                    conn.commit()
+                except Exception:
+                    lsn = None
+            with state.lock:
+                state.acked.append((seq, row_id, lsn, acked_at))
+            state.record("write", True)
+        except Exception as e:
+            state.record("write", False, e)
+    paced(rate, state, write_once)
+
+def reader(state, read_engine, rate):
+    def read_once():
+        try:
+            with read_engine.connect() as conn:
+                conn.execute(
+                    text(f"SELECT max(seq) FROM {DRILL_TABLE} WHERE run_id = :run_id"),
+                    {"run_id": state.run_id},
+                ).scalar()
+            state.record("read", True)
+        except Exception as e:
+            state.record("read", False, e)
+    paced(rate, state, read_once)
+
+def standby_watcher(state, standby_engine, interval=0.1):
+    """Ghi lại vị trí replay của standby tới lúc nó được promote (hết recovery)"""
+    query = text("SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text")
+    promoted = False
+    while not state.stop.is_set():
+        try:
+            with standby_engine.connect() as conn:
+                in_recovery, replay_lsn = conn.execute(query).one()
+            if in_recovery and replay_lsn:
+                state.standby_replay_lsn = replay_lsn
+            elif not in_recovery and not promoted and state.kill_at:
+                promoted = True
+                state.event("standby_promoted", lsn=state.standby_replay_lsn)
+                log(f"Standby promoted (last replay LSN {state.standby_replay_lsn})", "SUCCESS")
+        except Exception:
+            pass
+        state.stop.wait(interval)
+
+def kill_primary(args):
+    command = shlex.split(args.kill_command) if args.kill_command else ["docker", args.kill_mode, args.primary_container]
+    log(f"💥 Killing primary: {' '.join(command)}", "WARNING")
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Kill command failed: {result.stderr.strip()}")
+
+def recovered_and_stable(state, settle):
+    """Cả đọc và ghi đều thành công liên tục trong `settle` giây gần nhất"""
+    cutoff = time.time() - settle
+    with state.lock:
+        for kind in ("read", "write"):
+            recent = [ok for t, ok in state.ops[kind] if t >= cutoff]
+            if not recent or not all(recent) or cutoff < state.kill_at:
+                return False
+    return True
+
+def find_lost_writes(state, write_engine):
+    """So sánh các write đã ack với dữ liệu trên primary mới"""
+    with write_engine.connect() as conn:
+        present = set(conn.execute(
+            text(f"SELECT seq FROM {DRILL_TABLE} WHERE run_id = :run_id"), {"run_id": state.run_id}
+        ).scalars())
+    lost = [(seq, row_id, lsn) for seq, row_id, lsn, _ in state.acked if seq not in present]
+    at_risk = []
+    if state.standby_replay_lsn:
+        cutoff = lsn_to_int(state.standby_replay_lsn)
+        # Không biết LSN thì không chứng minh được standby đã nhận, tính là có rủi ro
+        at_risk = [seq for seq, _, lsn, _ in state.acked if lsn is None or lsn_to_int(lsn) > cutoff]
+    return lost, at_risk
+
+def write_report(state, summary, output_dir):
+    report = RotatingReport(output_dir, REPORT_NAME)
+    for entry in state.timeline:
+        details = {k: v for k, v in entry.items() if k not in ("t", "event")}
+        report.write({
+            "ts": datetime.fromtimestamp(entry["t"]).isoformat(),
+            "event": entry["event"],
+            "nodes": {},
+            "payload": state.run_id,
+            "note": ";".join(f"{k}={v}" for k, v in details.items() if v is not None) or None,
+            "since_kill": round(entry["t"] - state.kill_at, 3) if state.kill_at else None,
+        })
+    report.write({
+        "ts": datetime.now().isoformat(),
+        "event": "drill_summary",
+        "nodes": {},
+        "payload": state.run_id,
+        "note": ";".join(f"{k}={v}" for k, v in summary.items() if not isinstance(v, list)),
+        "summary": summary,
+    })
+    return report.paths
+
+def print_timeline(state):
+    log("\n📜 TIMELINE (seconds relative to kill)")
+    for entry in state.timeline:
+        offset = entry["t"] - state.kill_at if state.kill_at else 0
+        details = " ".join(f"{k}={v}" for k, v in entry.items() if k not in ("t", "event") and v is not None)
+        print(f"  {offset:+9.3f}s  {entry['event']:<18} {details}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Kill the primary under load and measure RTO and lost writes")
+    parser.add_argument("--write-role", default="haproxy", help="Engine role for writes (primary/haproxy)")
+    parser.add_argument("--read-role", default="replica", help="Engine role for reads")
+    parser.add_argument("--standby-role", default="replica", help="Engine role of the standby to watch")
+    parser.add_argument("--write-rate", type=float, default=20, help="Writes per second")
+    parser.add_argument("--read-rate", type=float, default=50, help="Reads per second")
+    parser.add_argument("--warmup", type=float, default=10, help="Seconds of load before the kill")
+    parser.add_argument("--observe", type=float, default=120, help="Max seconds to wait for recovery after the kill")
+    parser.add_argument("--settle", type=float, default=5, help="Seconds of error-free reads and writes that end the drill")
+    parser.add_argument("--primary-container", default="postgres-primary")
+    parser.add_argument("--kill-mode", choices=["kill", "stop"], default="kill", help="docker kill (crash) or docker stop")
+    parser.add_argument("--kill-command", default=None, help="Custom kill command for a non-docker stand-in")
+    parser.add_argument("--output-dir", default="cluster_reports")
+    args = parser.parse_args()
+
+    write_engine = get_engine(args.write_role)
+    setup_drill_table(write_engine)
+    state = DrillState(uuid.uuid4().hex[:8])
+    log(f"🚀 Failover drill {state.run_id}: {args.write_rate} writes/s via {args.write_role}, "
+        f"{args.read_rate} reads/s via {args.read_role}")
+
+    threads = [
+        threading.Thread(target=writer, args=(state, write_engine, args.write_rate)),
+        threading.Thread(target=reader, args=(state, get_engine(args.read_role), args.read_rate)),
+        threading.Thread(target=standby_watcher, args=(state, get_engine(args.standby_role))),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        state.event("load_started")
+        time.sleep(args.warmup)
+        state.kill_at = time.time()
+        state.event("kill_primary", container=args.primary_container if not args.kill_command else args.kill_command)
+        kill_primary(args)
+
+        deadline = state.kill_at + args.observe
+        while time.time() < deadline and not recovered_and_stable(state, args.settle):
+            time.sleep(0.5)
+        state.event("load_stopped")
+    finally:
+        state.stop.set()
+        for thread in threads:
+            thread.join()
+
+    read_rto = state.recovery_time("read")
+    write_rto = state.recovery_time("write")
+    try:
+        lost, at_risk = find_lost_writes(state, write_engine)
+        verify_error = None
+    except Exception as e:
+        lost, at_risk, verify_error = [], [], str(e).splitlines()[0]
+        log(f"Could not verify writes on the new primary: {verify_error}", "ERROR")
+
+    summary = {
+        "run_id": state.run_id,
+        "read_rto_s": round(read_rto, 3) if read_rto is not None else None,
+        "write_rto_s": round(write_rto, 3) if write_rto is not None else None,
+        "read_downtime_s": round(state.downtime("read"), 3),
+        "write_downtime_s": round(state.downtime("write"), 3),
+        "reads": len(state.ops["read"]),
+        "read_errors": sum(1 for _, ok in state.ops["read"] if not ok),
+        "writes_acked": len(state.acked),
+        "write_errors": sum(1 for _, ok in state.ops["write"] if not ok),
+        "lost_writes": len(lost),
+        "lost_seqs": [seq for seq, _, _ in lost],
+        "at_risk_writes": len(at_risk),
+        "standby_replay_lsn": state.standby_replay_lsn,
+        "max_acked_lsn": max((lsn for _, _, lsn, _ in state.acked if lsn), key=lsn_to_int, default=None),
+        "verify_error": verify_error,
+    }
+
+    print_timeline(state)
+    log("\n📊 DRILL SUMMARY")
+    for key, value in summary.items():
+        if key != "lost_seqs":
+            print(f"  {key:<20} {value}")
+    if lost:
+        log(f"Lost {len(lost)} acknowledged writes: seq {summary['lost_seqs'][:20]}", "ERROR")
+    paths = write_report(state, summary, args.output_dir)
+    log(f"Timeline written to {paths['csv']} and {paths['jsonl']}", "SUCCESS")
+    log("Rebuild the old primary as a replica, then run `python auto-failover.py switchover` to move "
+        "the primary role back", "INFO")
+
+    recovered = read_rto is not None and write_rto is not None
+    return 0 if recovered and not lost and not verify_error else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Replication Latency Benchmark
+Đo thời gian từ lúc commit trên PRIMARY tới lúc dữ liệu đọc được trên REPLICA
+
+    python replication_benchmark.py --rate 50 --duration 30
+    python replication_benchmark.py --rate 20 --load-threads 4 --load-rows 500
+
+Writer ghi các dòng có tag vào bảng probe với tốc độ --rate qua primary_engine và
+lấy vị trí WAL của chính transaction (ngay trước commit) cùng vị trí sau commit; detector
+poll pg_last_wal_replay_lsn() trên replica_engine. Replay qua vị trí sau commit thì write
+chắc chắn đã đến replica; mới qua vị trí trước commit thì detector hỏi thẳng replica dòng
+đó đã thấy chưa, để WAL của các thread tải ghi sau commit không bị tính vào latency.
+--load-threads tạo thêm tải ghi song song để đo khi cluster đang bận.
+Từng write và bản tổng kết được ghi vào cluster_reports/replication_latency.csv/.jsonl.
+"""
+
+from sqlalchemy import text
+from app.database.connection import primary_engine, replica_engine
+from app.database.replication_lag import RotatingReport, lsn_to_int, primary_wal_lsn
+from benchmark import percentile
+from collections import deque
+from datetime import datetime
+import argparse
+import sys
+import threading
+import time
+import uuid
+
+PROBE_TABLE = "replication_latency_probe"
+REPORT_NAME = "replication_latency"
+
+def log(message, level="INFO"):
+    """Log message với timestamp"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    icon = "✅" if level == "SUCCESS" else "❌" if level == "ERROR" else "ℹ️"
+    print(f"[{timestamp}] {icon} {message}")
+
+def setup_probe_table():
+    with primary_engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {PROBE_TABLE} (
+                id BIGSERIAL PRIMARY KEY,
+                tag TEXT NOT NULL,
+                payload TEXT,
+                written_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+            )
+        """))
+
+def cleanup_probe_table():
+    with primary_engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {PROBE_TABLE} RESTART IDENTITY"))
+
+class LatencyRun:
+    """Trạng thái chia sẻ giữa writer, detector và các thread tải"""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.pending = deque()  # (row_id, tag, commit_lsn, upper_lsn, committed_at, ts), lsn tăng dần vì chỉ một writer
+        self.results = []       # dict cho từng write đã đến replica hoặc hết timeout
+        self.load_rows = 0
+        self.writer_done = threading.Event()
+        self.lock = threading.Lock()
+
+def writer(run, rate, duration):
+    """Ghi một dòng có tag mỗi 1/rate giây, lấy vị trí WAL trước và sau commit"""
+    interval = 1 / rate
+    next_at = time.perf_counter()
+    deadline = next_at + duration
+    seq = 0
+    with primary_engine.connect() as conn:
+        while next_at < deadline:
+            time.sleep(max(0, next_at - time.perf_counter()))
+            seq += 1
+            tag = f"{run.run_id}-{seq}"
+            row_id = conn.execute(
+                text(f"INSERT INTO {PROBE_TABLE} (tag) VALUES (:tag) RETURNING id"), {"tag": tag}
+            ).scalar_one()
+            # Trong cùng transaction, ngay trước commit: bản ghi commit của write này nằm ngay sau
+            # vị trí này (cận dưới), chưa lẫn WAL mà các thread tải ghi sau đó
+            commit_lsn = primary_wal_lsn(conn)
+            conn.commit()
+            committed_at = time.perf_counter()
+            ts = datetime.now().isoformat()
+            # Sau commit (cận trên): gồm cả WAL của các session khác ghi chen vào
+            upper_lsn = primary_wal_lsn(conn)
+            conn.commit()
+            with run.lock:
+                run.pending.append((row_id, tag, commit_lsn, upper_lsn, committed_at, ts))
+            next_at += interval
+    run.writer_done.set()
+
+def row_visible(conn, row_id):
+    """Dòng probe đã đọc được trên replica chưa (commit của nó đã được replay)"""
+    visible = conn.execute(text(f"SELECT 1 FROM {PROBE_TABLE} WHERE id = :id"), {"id": row_id}).scalar()
+    conn.commit()
+    return visible is not None
+
+def detector(run, poll_interval, timeout):
+    """Poll vị trí replay của replica, ghi nhận latency cho các write đã được replay"""
+    query = text("SELECT pg_last_wal_replay_lsn()::text")
+    with replica_engine.connect() as conn:
+        while True:
+            replay_lsn = conn.execute(query).scalar()
+            conn.commit()
+            now = time.perf_counter()
+            replay_pos = lsn_to_int(replay_lsn) if replay_lsn else -1
+            with run.lock:
+                while run.pending:
+                    row_id, tag, commit_lsn, upper_lsn, committed_at, ts = run.pending[0]
+                    replicated = lsn_to_int(upper_lsn) <= replay_pos
+                    seen_at = now
+                    if not replicated and lsn_to_int(commit_lsn) <= replay_pos and row_visible(conn, row_id):
+                        # Replay đã qua bản ghi commit nhưng chưa tới vị trí sau commit (WAL của tải)
+                        replicated = True
+                        seen_at = time.perf_counter()
+                    if not replicated and now - committed_at < timeout:
+                        break
+                    run.pending.popleft()
+                    run.results.append({
+                        "ts": ts,
+                        "row_id": row_id,
+                        "tag": tag,
+                        "lsn": commit_lsn,
+                        "upper_lsn": upper_lsn,
+                        "replay_lsn": replay_lsn,
+                        "replicated": replicated,
+                        "latency": seen_at - committed_at if replicated else None,
+                    })
+                finished = run.writer_done.is_set() and not run.pending
+            if finished:
+                return
+            time.sleep(poll_interval)
+
+def load_writer(run, rows, payload_bytes):
+    """Tải nền: insert liên tục từng batch `rows` dòng cho tới khi writer xong"""
+    payload = "x" * payload_bytes
+    with primary_engine.connect() as conn:
+        while not run.writer_done.is_set():
+            conn.execute(
+                text(f"INSERT INTO {PROBE_TABLE} (tag, payload) "
+                     "SELECT :tag, :payload FROM generate_series(1, :rows)"),
+                {"tag": f"{run.run_id}-load", "payload": payload, "rows": rows},
+            )
+            conn.commit()
+            with run.lock:
+                run.load_rows += rows
+
+def verify_visible(run):
+    """Kiểm tra chéo: số tag thấy trên replica khớp số write được báo đã replay"""
+    with replica_engine.connect() as conn:
+        visible = conn.execute(
+            text(f"SELECT count(*) FROM {PROBE_TABLE} WHERE tag LIKE :prefix AND payload IS NULL"),
+            {"prefix": f"{run.run_id}-%"},
+        ).scalar()
+    return visible
+
+def summarize(run, elapsed):
+    latencies = sorted(r["latency"] for r in run.results if r["replicated"])
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+    return {
+        "writes": len(run.results),
+        "replicated": len(latencies),
+        "timed_out": len(run.results) - len(latencies),
+        "write_rate": round(len(run.results) / elapsed, 2) if elapsed else 0,
+        "load_rows": run.load_rows,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+def write_report(run, summary, args, output_dir):
+    report = RotatingReport(output_dir, REPORT_NAME)
+    for result in run.results:
+        latency_ms = round(result["latency"] * 1000, 3) if result["replicated"] else None
+        report.write({
+            "ts": result["ts"],
+            "event": "replicated" if result["replicated"] else "replication_timeout",
+            "nodes": {
+                "primary": {"current_wal_lsn": result["lsn"]},
+                "replica": {"replay_lsn": result["replay_lsn"]},
+            },
+            "row_id": result["row_id"],
+            "payload": result["tag"],
+            "note": f"latency_ms={latency_ms}",
+        })
+    report.write({
+        "ts": datetime.now().isoformat(),
+        "event": "latency_summary",
+        "nodes": {},
+        "payload": run.run_id,
+        "note": ";".join(f"{key}={value}" for key, value in summary.items()),
+        "summary": summary,
+        "settings": {
+            "rate": args.rate, "duration": args.duration, "load_threads": args.load_threads,
+            "load_rows": args.load_rows, "payload_bytes": args.payload_bytes,
+        },
+    })
+    return report.paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure write-to-visible latency from primary to replica")
+    parser.add_argument("--rate", type=float, default=20, help="Tagged writes per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of tagged writes")
+    parser.add_argument("--poll-interval", type=float, default=0.002, help="Replica LSN poll interval (s)")
+    parser.add_argument("--timeout", type=float, default=30, help="Count a write as lost after this many seconds")
+    parser.add_argument("--load-threads", type=int, default=0, help="Background writer threads for load")
+    parser.add_argument("--load-rows", type=int, default=200, help="Rows per background insert")
+    parser.add_argument("--payload-bytes", type=int, default=512, help="Payload size of background rows")
+    parser.add_argument("--output-dir", default="cluster_reports")
+    parser.add_argument("--keep", action="store_true", help="Keep probe rows instead of truncating")
+    args = parser.parse_args()
+
+    setup_probe_table()
+    run = LatencyRun(uuid.uuid4().hex[:8])
+    log(f"Replication benchmark {run.run_id}: {args.rate} writes/s for {args.duration}s, "
+        f"{args.load_threads} load threads")
+    threads = [threading.Thread(target=detector, args=(run, args.poll_interval, args.timeout))]
+    threads += [
+        threading.Thread(target=load_writer, args=(run, args.load_rows, args.payload_bytes), daemon=True)
+        for _ in range(args.load_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    try:
+        writer(run, args.rate, args.duration)
+    finally:
+        run.writer_done.set()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(run, elapsed)
+    visible = verify_visible(run)
+    print(f"\n{'writes':>8}{'replicated':>12}{'timeout':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    print(f"{summary['writes']:>8}{summary['replicated']:>12}{summary['timed_out']:>9}"
+          f"{summary['p50_ms'] or '-':>10}{summary['p95_ms'] or '-':>10}{summary['p99_ms'] or '-':>10}"
+          f"{summary['max_ms'] or '-':>10}")
+    if args.load_threads:
+        log(f"Background load: {summary['load_rows']:,} rows ({summary['load_rows'] / elapsed:,.0f} rows/s)")
+    if visible < summary["replicated"]:
+        log(f"Replica shows {visible} tagged rows but {summary['replicated']} were detected as replayed", "ERROR")
+
+    paths = write_report(run, summary, args, args.output_dir)
+    log(f"Results written to {paths['csv']} and {paths['jsonl']}", "SUCCESS")
+    if not args.keep:
+        cleanup_probe_table()
+    return 0 if summary["timed_out"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,97 @@
 import uvicorn
 from dotenv import load_dotenv
+import importlib.util
 import os
 import argparse
+from app.database.pool_budget import compute_pool_budget, max_workers, total_connections, DB_MAX_CONNECTIONS
 
 load_dotenv()
 
+def default_workers():
+    """Số worker mặc định: WEB_CONCURRENCY hoặc số CPU"""
+    return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+def compute_pool_settings(workers):
+    """Giới hạn số worker theo ngân sách kết nối và tính pool cho từng engine"""
+    limit = max_workers()
+    if workers > limit:
+        print(f"⚠️ {workers} workers exceed the DB connection budget, using {limit}")
+        workers = limit
+    return workers, compute_pool_budget(workers)
+
+def event_loop_impl():
+    """Dùng uvloop nếu đã cài, ngược lại dùng asyncio"""
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+def http_impl():
+    """Dùng httptools nếu đã cài, ngược lại dùng h11"""
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+def run_dev(args, ssl_options):
+    """Một process, tự reload khi sửa code"""
+    print("🛠️ Starting development server (reload enabled)...")
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        reload=True,
+        **ssl_options
+    )
+
+def run_prod(args, ssl_options):
+    """Nhiều worker, không reload, pool DB chia theo số worker"""
+    workers, budget = compute_pool_settings(args.workers)
+
+    # Worker được spawn sau khi set env nên pool_budget trong worker chia đúng theo số worker
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    # Đánh dấu process cha là supervisor của run.py: app.main.stop_server chỉ dừng cha khi có biến này
+    os.environ["BLINK_SUPERVISED"] = "1"
+
+    loop = event_loop_impl()
+    http = http_impl()
+    print(f"🚀 Starting production server: {workers} workers, loop={loop}, http={http}")
+    for role, sizes in budget.items():
+        print(f"📊 DB pool {role}: pool_size={sizes['pool_size']}, max_overflow={sizes['max_overflow']}")
+    print(f"📊 Max DB connections: {total_connections(budget, workers)}/{DB_MAX_CONNECTIONS}")
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        proxy_headers=True,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        **ssl_options
+    )
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run FastAPI server")
+    parser.add_argument("--mode", choices=["dev", "prod"], default=os.getenv("APP_MODE", "dev"),
+                        help="dev: 1 process + reload, prod: multi-worker")
     parser.add_argument("--https", action="store_true", help="Run with HTTPS")
     parser.add_argument("--host", default="0.0.0.0", help="Host to bind to")
-    parser.add_argument("--port", type=int, default=8000, help="Port to bind to")
-    
+    parser.add_argument("--port", type=int, default=None, help="Port to bind to")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Number of worker processes (prod)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds to drain in-flight requests on shutdown (prod)")
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE_TIMEOUT", "5")),
+                        help="Keep-alive timeout in seconds (prod)")
+
     args = parser.parse_args()
-    
+
+    ssl_options = {}
     if args.https:
         print("🔒 Starting HTTPS server...")
-        uvicorn.run(
-            "app.main:app",
-            host=args.host,
-            port=8443,
-            ssl_certfile="ssl/cert.pem",
-            ssl_keyfile="ssl/key.pem",
-            reload=True
-        )
+        args.port = args.port or 8443
+        ssl_options = {"ssl_certfile": "ssl/cert.pem", "ssl_keyfile": "ssl/key.pem"}
     else:
         print("🌐 Starting HTTP server...")
-        uvicorn.run(
-            "app.main:app",
-            host=args.host,
-            port=args.port,
-            reload=True
-        )
+        args.port = args.port or 8000
+
+    if args.mode == "prod":
+        run_prod(args, ssl_options)
+    else:
+        run_dev(args, ssl_options)
@@ -2,13 +2,79 @@
 """
 Cluster Query Runner
 Script để chạy các query test giữa Primary và Replica
+
+    python run_cluster_queries.py                              # chạy tuần tự từng test
+    python run_cluster_queries.py --concurrent --clients 32 --duration 60
+
+Chế độ --concurrent chạy lại các scenario (insert/update/delete trên PRIMARY, read và
+performance query trên REPLICA, ghi thử trên REPLICA) với N client song song và báo
+throughput, latency theo từng node. Ghi thử trên REPLICA phải luôn bị chặn.
 """
 
+import argparse
+import random
+import threading
 import time
+import uuid
 import psycopg2
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from sqlalchemy import text
-from app.database.connection import primary_engine, replica_engine
+from sqlalchemy import create_engine, text
+from app.database.connection import primary_engine, replica_engine, ENGINE_URLS
+from app.database.replication_lag import primary_wal_lsn, wait_for_replay
+from benchmark import parse_mix, percentile
+
+# Các câu đọc dùng chung cho test tuần tự và chế độ --concurrent
+READ_QUERIES = [
+    """
+    SELECT COUNT(*) as total_records FROM cluster_test_table;
+    """,
+    """
+    SELECT * FROM cluster_test_table ORDER BY id;
+    """,
+    """
+    SELECT 
+        id,
+        name,
+        email,
+        age,
+        status
+    FROM cluster_test_table 
+    WHERE status = 'active'
+    ORDER BY name;
+    """,
+    """
+    SELECT 
+        status,
+        COUNT(*) as count,
+        AVG(age) as avg_age,
+        MIN(age) as min_age,
+        MAX(age) as max_age
+    FROM cluster_test_table 
+    GROUP BY status
+    ORDER BY count DESC;
+    """
+]
+
+PERFORMANCE_QUERIES = [
+    """
+    SELECT * FROM cluster_test_table 
+    WHERE email = 'jane.smith@example.com';
+    """,
+    """
+    SELECT * FROM cluster_test_table 
+    WHERE status = 'active'
+    ORDER BY created_at DESC
+    LIMIT 5;
+    """,
+    """
+    SELECT 
+        COUNT(*) as total_users,
+        COUNT(CASE WHEN status = 'active' THEN 1 END) as active_users,
+        AVG(age) as average_age
+    FROM cluster_test_table;
+    """
+]
 
 def log(message, level="INFO"):
     """Log với timestamp và màu sắc"""
@@ -59,6 +125,17 @@ def run_query_on_replica(query, description):
         log(f"  ❌ REPLICA Error: {str(e)}", "ERROR")
         return None
 
+def wait_for_replication(timeout=10):
+    """Đợi replica replay tới vị trí WAL hiện tại của primary (thay cho sleep cố định)"""
+    with primary_engine.connect() as conn:
+        lsn = primary_wal_lsn(conn)
+    waited = wait_for_replay(replica_engine, lsn, timeout)
+    if waited is None:
+        log(f"  ⚠️ REPLICA did not reach {lsn} within {timeout}s", "WARNING")
+    else:
+        log(f"  🔁 REPLICA caught up to {lsn} in {waited * 1000:.1f}ms", "REPLICA")
+    return waited
+
 def test_setup():
     """Test 1: Setup bảng test"""
     log("\n" + "="*60, "INFO")
@@ -116,7 +193,7 @@ def test_insert_operations():
     
     for i, query in enumerate(insert_queries, 1):
         run_query_on_primary(query, f"Insert batch {i}")
-        time.sleep(1)  # Đợi replication
+        wait_for_replication()
 
 def test_update_operations():
     """Test 3: UPDATE operations"""
@@ -144,7 +221,7 @@ def test_update_operations():
     
     for i, query in enumerate(update_queries, 1):
         run_query_on_primary(query, f"Update operation {i}")
-        time.sleep(1)  # Đợi replication
+        wait_for_replication()
 
 def test_delete_operations():
     """Test 4: DELETE operations"""
@@ -165,7 +242,7 @@ def test_delete_operations():
     
     for i, query in enumerate(delete_queries, 1):
         run_query_on_primary(query, f"Delete operation {i}")
-        time.sleep(1)  # Đợi replication
+        wait_for_replication()
 
 def test_read_operations():
     """Test 5: READ operations trên REPLICA"""
@@ -173,38 +250,7 @@ def test_read_operations():
     log("📖 TEST 5: READ OPERATIONS (REPLICA)", "INFO")
     log("="*60, "INFO")
     
-    read_queries = [
-        """
-        SELECT COUNT(*) as total_records FROM cluster_test_table;
-        """,
-        """
-        SELECT * FROM cluster_test_table ORDER BY id;
-        """,
-        """
-        SELECT 
-            id,
-            name,
-            email,
-            age,
-            status
-        FROM cluster_test_table 
-        WHERE status = 'active'
-        ORDER BY name;
-        """,
-        """
-        SELECT 
-            status,
-            COUNT(*) as count,
-            AVG(age) as avg_age,
-            MIN(age) as min_age,
-            MAX(age) as max_age
-        FROM cluster_test_table 
-        GROUP BY status
-        ORDER BY count DESC;
-        """
-    ]
-    
-    for i, query in enumerate(read_queries, 1):
+    for i, query in enumerate(READ_QUERIES, 1):
         result = run_query_on_replica(query, f"Read query {i}")
         if result:
             log(f"  📊 Results: {result}", "INFO")
@@ -313,27 +359,7 @@ def test_performance_queries():
     log("⚡ TEST 9: PERFORMANCE QUERIES", "INFO")
     log("="*60, "INFO")
     
-    performance_queries = [
-        """
-        SELECT * FROM cluster_test_table 
-        WHERE email = 'jane.smith@example.com';
-        """,
-        """
-        SELECT * FROM cluster_test_table 
-        WHERE status = 'active'
-        ORDER BY created_at DESC
-        LIMIT 5;
-        """,
-        """
-        SELECT 
-            COUNT(*) as total_users,
-            COUNT(CASE WHEN status = 'active' THEN 1 END) as active_users,
-            AVG(age) as average_age
-        FROM cluster_test_table;
-        """
-    ]
-    
-    for i, query in enumerate(performance_queries, 1):
+    for i, query in enumerate(PERFORMANCE_QUERIES, 1):
         start_time = time.time()
         result = run_query_on_replica(query, f"Performance query {i}")
         query_time = time.time() - start_time
@@ -350,6 +376,158 @@ def cleanup_test_data():
         "Cleanup test data"
     )
 
+# ==================== CONCURRENT MODE ====================
+
+DEFAULT_MIX = "insert=15,update=10,delete=5,read=40,performance=28,replica_write=2"
+DEFAULT_SEED_ROWS = 1000
+
+def insert_params(rng):
+    suffix = f"{threading.get_ident()}_{rng.getrandbits(48)}"
+    return {"name": f"Load {suffix}", "email": f"load_{suffix}@example.com", "age": rng.randint(18, 60)}
+
+def random_id_params(rng, context):
+    return {"id": rng.randint(1, context["max_id"])}
+
+# Scenario -> (node, danh sách câu SQL, hàm sinh tham số)
+CONCURRENT_SCENARIOS = {
+    "insert": ("primary", [
+        "INSERT INTO cluster_test_table (name, email, age, status) VALUES (:name, :email, :age, 'active')"
+    ], lambda rng, context: insert_params(rng)),
+    "update": ("primary", [
+        "UPDATE cluster_test_table SET age = age + 1, updated_at = CURRENT_TIMESTAMP WHERE id = :id",
+        "UPDATE cluster_test_table SET status = 'active', updated_at = CURRENT_TIMESTAMP WHERE id = :id",
+    ], random_id_params),
+    "delete": ("primary", [
+        "DELETE FROM cluster_test_table WHERE id = :id"
+    ], random_id_params),
+    "read": ("replica", READ_QUERIES, lambda rng, context: {}),
+    "performance": ("replica", PERFORMANCE_QUERIES, lambda rng, context: {}),
+    # Sanity check read-only: mỗi lần ghi trên REPLICA phải bị từ chối
+    "replica_write": ("replica", [
+        "INSERT INTO cluster_test_table (name, email, age, status) VALUES (:name, :email, :age, 'active')"
+    ], lambda rng, context: insert_params(rng)),
+}
+
+def node_engines(clients):
+    """Engine riêng cho chế độ concurrent, mỗi client một kết nối: pool của app (chia theo
+    ngân sách kết nối) nhỏ hơn --clients thì latency đo được gồm cả thời gian đợi checkout"""
+    return {
+        node: create_engine(ENGINE_URLS[node], pool_size=clients, max_overflow=0, pool_pre_ping=True)
+        for node in ("primary", "replica")
+    }
+
+def seed_rows(rows, run_id):
+    """Chèn sẵn dòng để update/delete có mục tiêu, trả về id lớn nhất
+
+    Email có run_id để chạy lại với --keep không đụng ràng buộc UNIQUE của lần trước.
+    """
+    with primary_engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO cluster_test_table (name, email, age, status)
+            SELECT 'Seed ' || i, 'seed_' || :run_id || '_' || i || '@example.com', 18 + i % 40,
+                   (ARRAY['active', 'inactive', 'pending'])[1 + i % 3]
+            FROM generate_series(1, :rows) AS i
+        """), {"rows": rows, "run_id": run_id})
+        return conn.execute(text("SELECT COALESCE(MAX(id), 1) FROM cluster_test_table")).scalar()
+
+def run_scenario(name, rng, context):
+    """Chạy một scenario; trả về (node, kết quả, giây, lỗi)
+
+    Kết quả: "ok", "error", hoặc "accepted" khi REPLICA nhận một câu ghi (replica_write).
+    """
+    node, queries, params = CONCURRENT_SCENARIOS[name]
+    query = rng.choice(queries)
+    started = time.perf_counter()
+    try:
+        with context["engines"][node].begin() as conn:
+            result = conn.execute(text(query), params(rng, context))
+            if result.returns_rows:
+                result.fetchall()
+        elapsed = time.perf_counter() - started
+        if name == "replica_write":
+            return node, "accepted", elapsed, "REPLICA accepted a write"
+        return node, "ok", elapsed, None
+    except Exception as e:
+        elapsed = time.perf_counter() - started
+        if name == "replica_write" and getattr(getattr(e, "orig", None), "pgcode", None) == "25006":
+            return node, "ok", elapsed, None
+        return node, "error", elapsed, str(e).splitlines()[0]
+
+def concurrent_client(client_id, mix, context, deadline, stats, lock):
+    """Một client: chọn scenario theo tỉ trọng cho tới hết thời gian"""
+    rng = random.Random(client_id)
+    names, weights = list(mix), list(mix.values())
+    local = []
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights=weights)[0]
+        local.append((name, *run_scenario(name, rng, context)))
+    with lock:
+        for name, node, outcome, elapsed, error in local:
+            for key in (("node", node), ("scenario", name)):
+                entry = stats.setdefault(key, {"latencies": [], "errors": 0, "accepted": 0, "last_error": None})
+                entry["latencies"].append(elapsed)
+                if outcome == "accepted":
+                    entry["accepted"] += 1
+                elif outcome == "error":
+                    entry["errors"] += 1
+                    entry["last_error"] = error
+
+def print_concurrent_report(stats, elapsed):
+    print(f"\n{'':<22}{'ops':>8}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind in ("node", "scenario"):
+        for (entry_kind, name), entry in sorted(stats.items()):
+            if entry_kind != kind:
+                continue
+            values = sorted(entry["latencies"])
+            p50, p95, p99 = (round(percentile(values, pct) * 1000, 2) for pct in (50, 95, 99))
+            print(f"{kind + ' ' + name:<22}{len(values):>8}{entry['errors']:>8}{len(values) / elapsed:>10.1f}"
+                  f"{p50:>10}{p95:>10}{p99:>10}")
+            if entry["last_error"]:
+                print(f"{'':<22}last error: {entry['last_error']}")
+
+def run_concurrent(clients, duration, mix_spec, rows):
+    """Chạy các scenario với `clients` client song song trong `duration` giây"""
+    log("\n" + "="*60, "INFO")
+    log(f"🔀 CONCURRENT MODE: {clients} clients, {duration}s", "INFO")
+    log("="*60, "INFO")
+    mix = parse_mix(mix_spec)
+    unknown = [name for name in mix if name not in CONCURRENT_SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)} (available: {', '.join(CONCURRENT_SCENARIOS)})")
+
+    context = {"max_id": seed_rows(rows, uuid.uuid4().hex[:8]), "engines": node_engines(clients)}
+    wait_for_replication()
+    log(f"📊 Mix: {mix}", "INFO")
+
+    stats = {}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+    try:
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            futures = [pool.submit(concurrent_client, i, mix, context, deadline, stats, lock) for i in range(clients)]
+            for future in futures:
+                future.result()
+    finally:
+        for engine in context["engines"].values():
+            engine.dispose()
+    elapsed = time.perf_counter() - started
+    print_concurrent_report(stats, elapsed)
+
+    readonly = stats.get(("scenario", "replica_write"))
+    if readonly and readonly["accepted"]:
+        log(f"❌ REPLICA accepted {readonly['accepted']} writes - THIS IS BAD!", "ERROR")
+        return False
+    if readonly and readonly["errors"]:
+        # Lỗi khác (mất kết nối, timeout...) không chứng minh được replica chặn ghi
+        blocked = len(readonly["latencies"]) - readonly["errors"]
+        log(f"⚠️ REPLICA blocked {blocked} writes, {readonly['errors']} failed for other reasons: "
+            f"{readonly['last_error']}", "WARNING")
+        return False
+    if readonly:
+        log(f"✅ REPLICA blocked all {len(readonly['latencies'])} concurrent writes", "SUCCESS")
+    return True
+
 def main():
     """Chạy tất cả tests"""
     log("🚀 POSTGRESQL CLUSTER QUERY TESTING", "INFO")
@@ -380,4 +558,18 @@ def main():
         log(f"❌ Test failed: {str(e)}", "ERROR")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run cluster test queries on primary and replica")
+    parser.add_argument("--concurrent", action="store_true", help="Run the scenarios with parallel clients")
+    parser.add_argument("--clients", type=int, default=16, help="Parallel clients in concurrent mode")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run in concurrent mode")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. insert=10,read=90")
+    parser.add_argument("--seed-rows", type=int, default=DEFAULT_SEED_ROWS, help="Rows inserted before the run")
+    parser.add_argument("--keep", action="store_true", help="Keep test data after the concurrent run")
+    args = parser.parse_args()
+    if args.concurrent:
+        test_setup()
+        ok = run_concurrent(args.clients, args.duration, args.mix, args.seed_rows)
+        if not args.keep:
+            cleanup_test_data()
+        raise SystemExit(0 if ok else 1)
     main()
@@ -6,9 +6,10 @@
 
 import time
 import docker
-from datetime import datetime, timedelta
+from datetime import datetime
 from sqlalchemy import text
 from app.database.connection import primary_engine, replica_engine
+from app.database.replication_lag import primary_wal_lsn, wait_for_replay
 
 def log(message, level="INFO"):
     """Log message với timestamp"""
@@ -37,21 +38,20 @@ def setup_test_table():
         return False
 
 def wait_for_replica_sync(row_id, expected_message, timeout=20):
-    """Đợi replica sync"""
-    deadline = datetime.utcnow() + timedelta(seconds=timeout)
-    while datetime.utcnow() < deadline:
-        try:
-            with replica_engine.connect() as conn:
-                result = conn.execute(
-                    text("SELECT message FROM simple_cluster_test WHERE id = :id"),
-                    {"id": row_id}
-                ).scalar_one_or_none()
-                if result == expected_message:
-                    return True
-        except:
-            pass
-        time.sleep(0.5)
-    return False
+    """Đợi replica replay tới vị trí WAL hiện tại của primary rồi kiểm tra dòng
+    (expected_message=None: dòng phải đã bị xóa)"""
+    with primary_engine.connect() as conn:
+        lsn = primary_wal_lsn(conn)
+    waited = wait_for_replay(replica_engine, lsn, timeout)
+    if waited is None:
+        return False
+    log(f"Replica caught up in {waited * 1000:.1f}ms", "INFO")
+    with replica_engine.connect() as conn:
+        result = conn.execute(
+            text("SELECT message FROM simple_cluster_test WHERE id = :id"),
+            {"id": row_id}
+        ).scalar_one_or_none()
+    return result == expected_message
 
 def test_basic_crud():
     """Test CRUD cơ bản"""
@@ -97,20 +97,9 @@ def test_basic_crud():
         log("Deleted record on primary", "SUCCESS")
         
         # Wait for delete replication
-        deadline = datetime.utcnow() + timedelta(seconds=20)
-        while datetime.utcnow() < deadline:
-            try:
-                with replica_engine.connect() as conn:
-                    result = conn.execute(
-                        text("SELECT COUNT(*) FROM simple_cluster_test WHERE id = :id"),
-                        {"id": row_id}
-                    ).scalar_one()
-                    if result == 0:
-                        log("Delete replicated to replica", "SUCCESS")
-                        return True
-            except:
-                pass
-            time.sleep(0.5)
+        if wait_for_replica_sync(row_id, None):
+            log("Delete replicated to replica", "SUCCESS")
+            return True
         
         log("Delete did not replicate to replica", "ERROR")
         return False
@@ -1,9 +1,22 @@
 #!/bin/bash
 
+# APP_MODE=prod (mặc định trong container): nhiều worker, không reload
+# APP_MODE=dev: 1 process với --reload
+APP_MODE=${APP_MODE:-prod}
+
+# Tạo schema một lần trước khi start worker (không chạy trong startup của app nữa)
+if [ "${RUN_MIGRATIONS:-true}" = "true" ]; then
+    echo "📊 Running database migrations..."
+    if ! python -m app.database.init_db; then
+        echo "❌ Database migrations failed, not starting the server"
+        exit 1
+    fi
+fi
+
 if [ "$HTTPS_ENABLED" = "true" ]; then
-    echo "🔒 Starting HTTPS server..."
-    uvicorn app.main:app --host 0.0.0.0 --port 8443 --ssl-certfile ssl/cert.pem --ssl-keyfile ssl/key.pem --reload
+    echo "🔒 Starting HTTPS server ($APP_MODE)..."
+    exec python run.py --mode "$APP_MODE" --https
 else
-    echo "🌐 Starting HTTP server..."
-    uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
+    echo "🌐 Starting HTTP server ($APP_MODE)..."
+    exec python run.py --mode "$APP_MODE" --port 8000
 fi